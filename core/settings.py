@@ -48,6 +48,17 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Opt-in request profiling: per-route timings, SQL counts and response sizes
+# exposed at /api/_metrics (see producer/metrics.py)
+API_PROFILING = os.environ.get("API_PROFILING", "").lower() in ("1", "true", "yes")
+if API_PROFILING:
+    MIDDLEWARE.insert(0, "producer.metrics.ProfilingMiddleware")
+# Bearer token for scraping /api/_metrics; staff users can read it when logged in
+PROFILING_METRICS_TOKEN = os.environ.get("PROFILING_METRICS_TOKEN", "")
+# Number of slowest requests kept, and logged with their SQL above this time
+PROFILING_SLOWEST_REQUESTS = 10
+PROFILING_SLOW_REQUEST_MS = 500
+
 ROOT_URLCONF = "core.urls"
 
 TEMPLATES = [
@@ -72,13 +83,108 @@ WSGI_APPLICATION = "core.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
+# Configured from the environment; SQLite is the default for development:
+#   DB_ENGINE=postgresql DB_NAME DB_USER DB_PASSWORD DB_HOST DB_PORT
+#   DB_CONN_MAX_AGE  seconds a connection is kept open between requests
+#   DB_POOL=1        psycopg connection pool instead of persistent connections
+#                    (DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT)
+#   DB_REPLICAS      comma separated replica hosts (file names with SQLite);
+#                    producer API reads are routed to them, writes to default
+DB_ENGINE = os.environ.get("DB_ENGINE", "sqlite")
+
+if DB_ENGINE == "postgresql":
+    PRIMARY_DATABASE = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.environ.get("DB_NAME", "produtores_locais"),
+        "USER": os.environ.get("DB_USER", "postgres"),
+        "PASSWORD": os.environ.get("DB_PASSWORD", ""),
+        "HOST": os.environ.get("DB_HOST", "localhost"),
+        "PORT": os.environ.get("DB_PORT", "5432"),
+        "OPTIONS": {},
+    }
+    if os.environ.get("DB_POOL", "").lower() in ("1", "true", "yes"):
+        PRIMARY_DATABASE["OPTIONS"]["pool"] = {
+            "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", 2)),
+            "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", 10)),
+            "timeout": int(os.environ.get("DB_POOL_TIMEOUT", 10)),
+        }
+else:
+    PRIMARY_DATABASE = {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "NAME": os.environ.get("DB_NAME", BASE_DIR / "db.sqlite3"),
+        "OPTIONS": {},
+    }
+
+# SQLite performance profile (see producer/sqlite.py); DB_SQLITE_TUNING=0 disables it
+SQLITE_PRAGMAS = {}
+if DB_ENGINE != "postgresql" and os.environ.get("DB_SQLITE_TUNING", "1").lower() in (
+    "1", "true", "yes"
+):
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "busy_timeout": 20000,
+        "temp_store": "MEMORY",
+    }
+    # Take the write lock when a transaction starts, not on its first write
+    PRIMARY_DATABASE["OPTIONS"]["transaction_mode"] = "IMMEDIATE"
+    # Opt-in: queue a process's write requests on one lock (single-process servers)
+    if os.environ.get("DB_SQLITE_SERIALIZE_WRITES", "").lower() in ("1", "true", "yes"):
+        MIDDLEWARE.append("producer.sqlite.SerializedWritesMiddleware")
+
+# The pool manages connection reuse itself and requires CONN_MAX_AGE = 0
+PRIMARY_DATABASE["CONN_MAX_AGE"] = (
+    0
+    if "pool" in PRIMARY_DATABASE.get("OPTIONS", {})
+    else int(os.environ.get("DB_CONN_MAX_AGE", 60))
+)
+# Check persistent connections before reusing them for a new request
+PRIMARY_DATABASE["CONN_HEALTH_CHECKS"] = True
+
+DATABASES = {"default": PRIMARY_DATABASE}
+
+DATABASE_REPLICAS = []
+for index, location in enumerate(filter(None, os.environ.get("DB_REPLICAS", "").split(","))):
+    alias = f"replica_{index + 1}"
+    DATABASES[alias] = {
+        **PRIMARY_DATABASE,
+        "HOST" if DB_ENGINE == "postgresql" else "NAME": location.strip(),
+        # Tests run against the primary's test database
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+# After a write, API reads stay on the primary for this long (replication lag)
+DATABASE_REPLICA_LAG_SECONDS = int(os.environ.get("DB_REPLICA_LAG", 5))
+DATABASE_ROUTERS = ["producer.routers.ReplicaRouter"]
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "produtores-locais"),
     }
 }
 
+# Cache alias and timeout (seconds) used for producer API responses
+PRODUCER_CACHE_ALIAS = "default"
+PRODUCER_CACHE_TIMEOUT = 60 * 15
+# The changes feed holds back changes newer than this, so transactions still
+# committing are not skipped by clients. Bulk imports and batches re-stamp
+# their rows on commit; other writers must commit within this delay
+PRODUCER_CHANGES_SETTLE_SECONDS = 5
+
+# Static snapshot of the directory (export_snapshot)
+SNAPSHOT_ROOT = os.environ.get("SNAPSHOT_ROOT", os.path.join(BASE_DIR, "snapshots"))
+SNAPSHOT_BASE_URL = os.environ.get("SNAPSHOT_BASE_URL", "")
+SNAPSHOT_PAGE_SIZE = 100
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -118,6 +224,23 @@ STATIC_URL = "/static/"
 STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 
+MEDIA_URL = "/media/"
+MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+
+# Resized JPEG/WebP copies generated for producer and gallery images
+IMAGE_DERIVATIVE_WIDTHS = [320, 640, 1280]
+IMAGE_DERIVATIVE_WORKERS = 2
+IMAGE_DERIVATIVES_ASYNC = True
+# Generate them on save (tests with placeholder image files turn this off)
+IMAGE_DERIVATIVES_ENABLED = True
+
+# Background jobs for admin bulk actions (python manage.py run_jobs)
+JOBS_CHUNK_SIZE = 200
+# Selections up to this size run immediately in the admin request
+JOBS_INLINE_LIMIT = 100
+# Exported CSVs; outside MEDIA_ROOT, downloaded through the admin only
+JOBS_EXPORT_ROOT = os.environ.get("JOBS_EXPORT_ROOT", os.path.join(BASE_DIR, "exports"))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
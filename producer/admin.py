@@ -1,6 +1,14 @@
+from django.conf import settings
 from django.contrib import admin
 from django import forms
-from .models import Category, Producer, ProducerImage
+from django.core.exceptions import PermissionDenied
+from django.db.models import Max
+from django.http import FileResponse, Http404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from . import cache, jobs
+from .models import Category, Job, Producer, ProducerImage, Product
+from .pagination import EstimatedCountPaginator
 
 
 admin.site.site_header = "Produtores Locais"
@@ -39,23 +47,75 @@ class ProducerAdminForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        if self.instance and self.instance.pk:
-            self.initial["categories"] = self.instance.categories.all()
-
-    def save(self, commit=True):
-        """Save the form and update categories"""
-        instance = super().save(commit=False)
-        
-        if commit:
-            instance.save()
-        
-        # Update categories based on the form data
-        if self.cleaned_data.get("categories"):
-            instance.categories.set(self.cleaned_data["categories"])
-        else:
-            instance.categories.clear()
-        
-        return instance
+        if self.instance and self.instance.pk and "categories" not in self.initial:
+            # Loaded once (or taken from the admin's prefetch) for rendering
+            # and has_changed()
+            self.initial["categories"] = [
+                category.pk for category in self.instance.categories.all()
+            ]
+
+    def _save_m2m(self):
+        """Save categories with the other many-to-many data, so it also
+        works when the admin saves with ``commit=False``"""
+        super()._save_m2m()
+        self.instance.categories.set(self.cleaned_data.get("categories") or [])
+
+
+class CachedValuesFilter(admin.SimpleListFilter):
+    """Side filter listing the distinct values of a column.
+
+    The values are cached until producers change (the response cache
+    generation), instead of a ``DISTINCT`` scan of the table on every
+    changelist request.
+    """
+
+    field = None
+
+    def lookups(self, request, model_admin):
+        key = f"producer:admin-filter:{cache.get_generation()}:{self.parameter_name}"
+        store = cache.get_cache()
+        values = store.get(key)
+        if values is None:
+            values = self.values()
+            store.set(key, values, cache.get_timeout())
+        return values
+
+    def values(self):
+        values = (
+            Producer.objects.exclude(**{self.field: ""})
+            .exclude(**{f"{self.field}__isnull": True})
+            .order_by(self.field)
+            .values_list(self.field, flat=True)
+            .distinct()
+        )
+        return [(value, value) for value in values]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.field: self.value()})
+        return queryset
+
+
+class CityFilter(CachedValuesFilter):
+    title = "cidade"
+    parameter_name = "city"
+    field = "city_key"
+
+    def values(self):
+        # Grouped on the indexed, normalized key; one spelling is shown
+        rows = (
+            Producer.objects.exclude(city_key="")
+            .order_by("city_key")
+            .values("city_key")
+            .annotate(label=Max("city"))
+        )
+        return [(row["city_key"], row["label"]) for row in rows]
+
+
+class StateFilter(CachedValuesFilter):
+    title = "distrito"
+    parameter_name = "state"
+    field = "state"
 
 
 class CategoryInline(admin.TabularInline):
@@ -76,7 +136,7 @@ class ProducerAdmin(admin.ModelAdmin):
     list_display = ["name", "get_categories", "city", "phone", "email", "is_active"]
 
     # Side filters
-    list_filter = ["categories", "is_active", "city", "state", "created_at"]
+    list_filter = ["categories", "is_active", CityFilter, StateFilter, "created_at"]
 
     # Search fields
     search_fields = ["name", "description", "email", "phone", "city"]
@@ -101,9 +161,12 @@ class ProducerAdmin(admin.ModelAdmin):
             },
         ),
         ("Localização no Mapa", {
-            "fields": ["latitude", "longitude"],
+            "fields": ["latitude", "longitude", "geocode_source"],
             "classes": ["wide"],
-            "description": "Coordenadas para aparecer no mapa (opcional)"
+            "description": (
+                "Coordenadas para aparecer no mapa (opcional). Se ficarem vazias, "
+                "são obtidas do código postal ou da cidade."
+            ),
         }),
         (
             "Redes Sociais",
@@ -128,23 +191,36 @@ class ProducerAdmin(admin.ModelAdmin):
     ]
 
     # Read-only fields
-    readonly_fields = ["created_at", "updated_at"]
+    readonly_fields = ["geocode_source", "created_at", "updated_at"]
 
     # Pagination
     list_per_page = 25
+    paginator = EstimatedCountPaginator
+    # Avoid a second COUNT(*) of the whole table when a filter is applied
+    show_full_result_count = False
 
     # Default ordering
     ordering = ["name"]
 
-    # Custom actions
-    actions = ["activate_producers", "deactivate_producers"]
+    # Custom actions, run as background jobs (see jobs.py)
+    actions = [
+        "activate_producers",
+        "deactivate_producers",
+        "regenerate_images",
+        "reindex_search",
+        "export_selection",
+        "geocode_producers",
+    ]
+
+    def get_queryset(self, request):
+        """Categories for the changelist are loaded with one query per page"""
+        return super().get_queryset(request).prefetch_related("categories")
 
     # 👇 Método corrigido para mostrar categorias
     def get_categories(self, obj):
         """Returns categories as string"""
         return ", ".join([cat.name for cat in obj.categories.all()]) or "-"
     get_categories.short_description = "Categorias"
-    get_categories.admin_order_field = "categories"
 
     def phone(self, obj):
         """Shows main or mobile phone"""
@@ -163,16 +239,122 @@ class ProducerAdmin(admin.ModelAdmin):
     city.admin_order_field = "city"
 
     # Custom actions
+    def start_job(self, request, queryset, kind):
+        """Queue a job for the selection; small selections run right away"""
+        job = jobs.enqueue(kind, queryset.values_list("pk", flat=True), request.user)
+        if job.total <= getattr(settings, "JOBS_INLINE_LIMIT", 100):
+            jobs.run_inline(job)
+        url = reverse("admin:producer_job_change", args=[job.pk])
+        if job.status == Job.Status.DONE:
+            message = format_html(
+                '<a href="{}">{}</a> concluída para {} produtores.', url, job, job.total
+            )
+        else:
+            message = format_html(
+                '<a href="{}">{}</a> em fila para {} produtores. Acompanhe o progresso em Tarefas.',
+                url,
+                job,
+                job.total,
+            )
+        self.message_user(request, message)
+
     def activate_producers(self, request, queryset):
-        updated = queryset.update(is_active=True)
-        self.message_user(request, f"{updated} produtores ativados.")
+        self.start_job(request, queryset, Job.Kind.ACTIVATE)
     activate_producers.short_description = "Ativar produtores selecionados"
 
     def deactivate_producers(self, request, queryset):
-        updated = queryset.update(is_active=False)
-        self.message_user(request, f"{updated} produtores desativados.")
+        self.start_job(request, queryset, Job.Kind.DEACTIVATE)
     deactivate_producers.short_description = "Desativar produtores selecionados"
 
+    def regenerate_images(self, request, queryset):
+        self.start_job(request, queryset, Job.Kind.REGENERATE_IMAGES)
+    regenerate_images.short_description = "Regenerar imagens dos produtores selecionados"
+
+    def reindex_search(self, request, queryset):
+        self.start_job(request, queryset, Job.Kind.REINDEX)
+    reindex_search.short_description = "Reindexar pesquisa dos produtores selecionados"
+
+    def export_selection(self, request, queryset):
+        self.start_job(request, queryset, Job.Kind.EXPORT)
+    export_selection.short_description = "Exportar produtores selecionados (CSV)"
+
+    def geocode_producers(self, request, queryset):
+        self.start_job(request, queryset, Job.Kind.GEOCODE)
+    geocode_producers.short_description = "Recalcular coordenadas a partir da morada"
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ["__str__", "status", "get_progress", "created_by", "created_at", "finished_at"]
+    list_filter = ["status", "kind"]
+    ordering = ["-created_at"]
+    fields = [
+        "kind",
+        "status",
+        "get_progress",
+        "get_result",
+        "error",
+        "created_by",
+        "created_at",
+        "started_at",
+        "updated_at",
+        "finished_at",
+    ]
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        download = path(
+            "<path:object_id>/download/",
+            self.admin_site.admin_view(self.download_view),
+            name="producer_job_download",
+        )
+        return [download] + super().get_urls()
+
+    def download_view(self, request, object_id):
+        """Exported file of a job; exports are not public media"""
+        job = self.get_object(request, object_id)
+        if job is None or not job.result.get("file"):
+            raise Http404
+        if not self.has_view_permission(request, job):
+            raise PermissionDenied
+        storage = jobs.get_export_storage()
+        if not storage.exists(job.result["file"]):
+            raise Http404
+        return FileResponse(storage.open(job.result["file"]), as_attachment=True)
+
+    def get_progress(self, obj):
+        """Progress bar with processed/total"""
+        return format_html(
+            '<progress value="{}" max="{}"></progress> {} / {} ({}%)',
+            obj.processed,
+            obj.total or 1,
+            obj.processed,
+            obj.total,
+            round(obj.progress * 100),
+        )
+    get_progress.short_description = "Progresso"
+
+    def get_result(self, obj):
+        """Link to the exported file, or failed items"""
+        if obj.result.get("file"):
+            return format_html(
+                '<a href="{}">{}</a>',
+                reverse("admin:producer_job_download", args=[obj.pk]),
+                obj.result["file"],
+            )
+        if obj.result.get("failed"):
+            return "\n".join(obj.result["failed"])
+        if "geocoded" in obj.result:
+            return f"{obj.result['geocoded']} localizados, {obj.result['unresolved']} sem correspondência"
+        return "-"
+    get_result.short_description = "Resultado"
+
 
 @admin.register(ProducerImage)
 class ProducerImageAdmin(admin.ModelAdmin):
@@ -187,4 +369,12 @@ class CategoryAdmin(admin.ModelAdmin):
     list_display = ["name", "slug"]
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ["name"]
-    ordering = ["name"]
\ No newline at end of file
+    ordering = ["name"]
+
+
+@admin.register(Product)
+class ProductAdmin(admin.ModelAdmin):
+    list_display = ["name", "slug"]
+    search_fields = ["name", "slug"]
+    readonly_fields = ["name", "slug"]
+    ordering = ["name"]
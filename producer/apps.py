@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ProducerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'producer'
+
+    def ready(self):
+        from . import signals, sqlite  # noqa: F401
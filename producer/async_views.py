@@ -0,0 +1,144 @@
+"""Async read views for producers (list, search and detail).
+
+They are mounted next to the DRF routes under ``/api/async/`` and return the
+same JSON as ``ProducerViewSet``: filters, sparse fieldsets, pagination and
+serialization are reused from the viewset, while database access goes through
+Django's async ORM (``acount``/``aiterator``/``aget``) and the cache through
+the async cache API. Under an ASGI server a request waiting on the database
+or cache no longer holds a worker thread. Detail responses share cache
+entries and ETags with the sync views; list responses are cached separately
+because their pagination links point at the async routes.
+"""
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.views import exception_handler
+
+from . import cache
+from .models import Producer
+from .routers import areplicas_caught_up, use_replicas
+from .views import ProducerViewSet, alast_directory_change, validator_headers
+
+
+def get_viewset(request, action, **kwargs):
+    """A ProducerViewSet bound to ``request``, used for its query building"""
+    view = ProducerViewSet(action=action, args=(), kwargs=kwargs, format_kwarg=None)
+    view.request = Request(request)
+    return view
+
+
+def render(data, status=200, headers=None):
+    return HttpResponse(
+        JSONRenderer().render(data), status=status, content_type="application/json",
+        headers=headers,
+    )
+
+
+def api_view(function):
+    """Read from replicas and render DRF exceptions the way the sync views do"""
+
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return render({"detail": f'Método "{request.method}" não permitido.'}, status=405)
+        try:
+            with use_replicas(await areplicas_caught_up()):
+                return await function(request, *args, **kwargs)
+        except APIException as exc:
+            response = exception_handler(exc, {})
+            return render(response.data, status=response.status_code)
+
+    return wrapper
+
+
+async def build_queryset(view):
+    # Full-text ranking runs a raw query, which the async ORM cannot run
+    if view.request.query_params.get("q"):
+        return await sync_to_async(view.get_queryset)()
+    return view.get_queryset()
+
+
+async def conditional(request, action_name, pk, get_validators, compute):
+    """304 when the client's copy is valid, else the (cached) response.
+
+    Cache entries are shared with the sync views: validators are stored
+    with the data.
+    """
+    key = await cache.amake_key(request, action_name, pk)
+    cached = await cache.alookup(key)
+    if cached is not None:
+        status, data, etag, timestamp = cached
+    else:
+        etag, timestamp = validator_headers(request, action_name, pk, await get_validators())
+    not_modified = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if not_modified is not None:
+        return not_modified
+
+    if cached is None:
+        status, data = await compute()
+        if status == 200:
+            await cache.astore(key, (status, data, etag, timestamp))
+    headers = {"X-Cache": "HIT" if cached else "MISS"}
+    if status == 200:
+        headers["ETag"] = etag
+        if timestamp is not None:
+            headers["Last-Modified"] = http_date(timestamp)
+    return render(data, status=status, headers=headers)
+
+
+@api_view
+async def producer_list(request):
+    view = get_viewset(request, "list")
+    queryset = await build_queryset(view)
+    paginator = view.paginator
+    counted = queryset
+    if view.uses_keyset_pagination():
+        counted = paginator.window(queryset, view.request)
+
+    async def get_validators():
+        return {"last_modified": await alast_directory_change(), "count": await counted.acount()}
+
+    async def compute():
+        page = await paginator.apaginate_queryset(queryset, view.request, view=view)
+        data = view.get_serializer(page, many=True).data
+        return 200, view.get_paginated_response(data).data
+
+    action_name = f"async:{request.path}"
+    return await conditional(view.request, action_name, None, get_validators, compute)
+
+
+@api_view
+async def producer_search(request):
+    """Ranked full-text search: ``?q=`` is required"""
+    if not request.GET.get("q", "").strip():
+        raise ValidationError({"q": "Indique o texto a pesquisar."})
+    return await producer_list(request)
+
+
+@api_view
+async def producer_detail(request, pk):
+    view = get_viewset(request, "retrieve", pk=pk)
+
+    async def get_validators():
+        try:
+            last_modified = await (
+                Producer.objects.filter(pk=pk).values_list("updated_at", flat=True).afirst()
+            )
+        except (TypeError, ValueError, DjangoValidationError):
+            last_modified = None
+        return {"last_modified": last_modified, "count": int(last_modified is not None)}
+
+    async def compute():
+        queryset = await build_queryset(view)
+        try:
+            instance = await queryset.aget(pk=pk)
+        except (Producer.DoesNotExist, DjangoValidationError):
+            raise NotFound()
+        return 200, view.get_serializer(instance).data
+
+    return await conditional(view.request, "retrieve", pk, get_validators, compute)
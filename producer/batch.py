@@ -0,0 +1,152 @@
+"""Batch create/update/delete of producers in a single transaction.
+
+Every operation is validated before anything is written; if any of them is
+invalid the whole batch is rejected. Writes use the bulk helpers from
+``bulk.py`` so the cost is a fixed number of queries per batch.
+"""
+
+import uuid
+
+from django.db import transaction
+
+from . import bulk, cache
+from .models import Category, Producer, ProducerImage
+from .serializers import ProducerBatchItemSerializer
+
+OPERATIONS = ("create", "update", "delete")
+MAX_OPERATIONS = 500
+
+
+def _parse_id(value):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def validate_batch(operations):
+    """Validate all operations, returning ``(items, results)``.
+
+    ``items`` are the validated operations to apply; ``results`` holds one
+    entry per operation, with ``errors`` set on the invalid ones.
+    """
+    results = [{"index": index, "op": None, "id": None} for index in range(len(operations))]
+    parsed = []
+    for index, operation in enumerate(operations):
+        result = results[index]
+        if not isinstance(operation, dict) or operation.get("op") not in OPERATIONS:
+            result["errors"] = {"op": [f"Deve ser um de: {', '.join(OPERATIONS)}"]}
+            continue
+        result["op"] = operation["op"]
+        pk = None
+        if operation["op"] != "create":
+            pk = _parse_id(operation.get("id"))
+            if pk is None:
+                result["errors"] = {"id": ["UUID inválido."]}
+                continue
+            result["id"] = str(pk)
+        parsed.append((index, operation, pk))
+
+    target_ids = [pk for _, _, pk in parsed if pk]
+    instances = Producer.objects.in_bulk(target_ids)
+    seen = set()
+    items = []
+    for index, operation, pk in parsed:
+        result = results[index]
+        if pk is not None:
+            if pk not in instances:
+                result["errors"] = {"id": ["Produtor não encontrado."]}
+                continue
+            if pk in seen:
+                result["errors"] = {"id": ["Produtor repetido no lote."]}
+                continue
+            seen.add(pk)
+        if operation["op"] == "delete":
+            items.append((index, "delete", instances[pk], {}))
+            continue
+        serializer = ProducerBatchItemSerializer(
+            instance=instances.get(pk),
+            data=operation.get("data") or {},
+            partial=operation["op"] == "update",
+        )
+        if not serializer.is_valid():
+            result["errors"] = serializer.errors
+            continue
+        items.append((index, operation["op"], instances.get(pk), serializer.validated_data))
+
+    _validate_related(items, results)
+    return [item for item in items if "errors" not in results[item[0]]], results
+
+
+def _validate_related(items, results):
+    """Check category and gallery ids of every operation with two queries"""
+    category_ids = {cid for *_, data in items for cid in data.get("category_ids", [])}
+    known_categories = set(
+        Category.objects.filter(pk__in=category_ids).values_list("pk", flat=True)
+    )
+    gallery_producers = [instance.pk for _, _, instance, data in items if "gallery_order" in data]
+    gallery = {}
+    for image_id, producer_id in ProducerImage.objects.filter(
+        producer_id__in=gallery_producers
+    ).values_list("pk", "producer_id"):
+        gallery.setdefault(producer_id, set()).add(image_id)
+
+    for index, op, instance, data in items:
+        errors = {}
+        unknown = [cid for cid in data.get("category_ids", []) if cid not in known_categories]
+        if unknown:
+            errors["category_ids"] = [f"Categorias inexistentes: {unknown}"]
+        if "gallery_order" in data:
+            order = data["gallery_order"]
+            if instance is None:
+                errors["gallery_order"] = ["Só é possível ordenar a galeria ao atualizar."]
+            elif sorted(order) != sorted(gallery.get(instance.pk, set())):
+                errors["gallery_order"] = ["Deve listar todas as imagens da galeria uma vez."]
+        if errors:
+            results[index]["errors"] = errors
+
+
+def apply_batch(operations):
+    """Validate and apply ``operations``; returns ``(ok, results)``"""
+    items, results = validate_batch(operations)
+    if any("errors" in result for result in results):
+        for result in results:
+            result.setdefault("status", "invalid" if "errors" in result else "skipped")
+        return False, results
+
+    to_create, to_update, to_delete, links, images = [], [], [], {}, []
+    for index, op, instance, data in items:
+        data = dict(data)
+        category_ids = data.pop("category_ids", None)
+        gallery_order = data.pop("gallery_order", None)
+        if op == "delete":
+            to_delete.append(instance.pk)
+            results[index]["status"] = "deleted"
+            continue
+        if op == "create":
+            instance = Producer(**data)
+            to_create.append(instance)
+            results[index]["status"] = "created"
+        else:
+            for name, value in data.items():
+                setattr(instance, name, value)
+            to_update.append((instance, list(data)))
+            results[index]["status"] = "updated"
+        results[index]["id"] = str(instance.pk)
+        if category_ids is not None:
+            links[instance.pk] = category_ids
+        for position, image_id in enumerate(gallery_order or []):
+            images.append(ProducerImage(pk=image_id, order=position))
+
+    with transaction.atomic():
+        bulk.save_producers(to_create, to_update)
+        bulk.set_categories(links)
+        ProducerImage.objects.bulk_update(images, ["order"])
+        if to_delete:
+            # Regular delete so cascades and per-object cleanup signals run
+            Producer.objects.filter(pk__in=to_delete).delete()
+        bulk.refresh_derived(
+            [producer.pk for producer in to_create] + [producer.pk for producer, _ in to_update]
+        )
+    cache.bump_generation()
+    return True, results
@@ -0,0 +1,342 @@
+"""Streaming bulk import and export of producers as CSV or NDJSON.
+
+Imports are parsed row by row and written in chunks, one transaction per
+chunk, with ``bulk_create``/``bulk_update`` and batched category links. Bulk
+queries skip model signals, so each chunk refreshes the derived data (map
+grid, product catalogue, search index, response cache) explicitly; the
+batch write endpoint reuses the same helpers.
+"""
+
+import csv
+import io
+import json
+import math
+import uuid
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from . import cache, changes, geocoding, search
+from .catalogue import sync_catalogue
+from .models import Category, Producer, Product, ProducerProduct
+
+FORMATS = ("csv", "ndjson")
+
+# Columns read on import and written on export, in CSV order
+FIELDS = [
+    "id",
+    "name",
+    "description",
+    "phone",
+    "mobile_phone",
+    "email",
+    "website",
+    "street",
+    "number",
+    "city",
+    "state",
+    "zip_code",
+    "latitude",
+    "longitude",
+    "facebook",
+    "instagram",
+    "twitter",
+    "youtube",
+    "tiktok",
+    "products",
+    "categories",
+    "is_active",
+]
+MODEL_FIELDS = [name for name in FIELDS if name not in ("id", "categories")]
+# Separator for list values (products, category slugs) in CSV cells
+LIST_SEPARATOR = "|"
+DEFAULT_CHUNK_SIZE = 500
+COORDINATE_LIMITS = {"latitude": 90, "longitude": 180}
+
+
+def detect_format(filename, default="csv"):
+    extension = filename.rsplit(".", 1)[-1].lower() if filename and "." in filename else ""
+    if extension in ("ndjson", "jsonl"):
+        return "ndjson"
+    if extension == "csv":
+        return "csv"
+    return default
+
+
+def read_rows(stream, file_format):
+    """Yield ``(line_number, row)`` from a text stream, one row at a time"""
+    if file_format == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif file_format == "ndjson":
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield line_number, ValidationError(f"JSON inválido: {exc}")
+                continue
+            if not isinstance(row, dict):
+                row = ValidationError("Cada linha deve ser um objeto JSON.")
+            yield line_number, row
+    else:
+        raise ValueError(f"Formato desconhecido: {file_format}")
+
+
+def _as_list(value):
+    if value is None or value == "":
+        return []
+    if isinstance(value, list):
+        return [str(item).strip() for item in value if str(item).strip()]
+    return [item.strip() for item in str(value).split(LIST_SEPARATOR) if item.strip()]
+
+
+def _as_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() not in ("0", "false", "no", "não", "nao", "")
+
+
+def clean_row(row):
+    """Validate one row with the model field validators.
+
+    Returns ``(producer, category_slugs, provided_fields)`` where
+    ``provided_fields`` lists the model fields present in the row, so updates
+    leave the other columns untouched. Raises ``ValidationError``.
+    """
+    errors = {}
+    values = {}
+    for name in MODEL_FIELDS:
+        if name not in row:
+            continue
+        value = row[name]
+        if name == "products":
+            value = _as_list(value)
+        elif name == "is_active":
+            if value is None or str(value).strip() == "":
+                continue  # Blank cell: keep the current value or the default
+            value = _as_bool(value)
+        elif name in ("latitude", "longitude"):
+            try:
+                value = float(value) if value not in (None, "") else None
+            except (TypeError, ValueError):
+                errors[name] = ["Deve ser um número."]
+                continue
+            limit = COORDINATE_LIMITS[name]
+            if value is not None and not (math.isfinite(value) and -limit <= value <= limit):
+                errors[name] = [f"Deve estar entre -{limit} e {limit}."]
+                continue
+        elif value == "" and Producer._meta.get_field(name).null:
+            value = None
+        elif value is None:
+            value = ""
+        values[name] = value
+
+    if ("latitude" in row) != ("longitude" in row):
+        # Only written together, so the map cell follows them
+        missing = "longitude" if "latitude" in row else "latitude"
+        errors[missing] = ["Indique a latitude e a longitude."]
+
+    pk = row.get("id") or None
+    if pk:
+        try:
+            values["id"] = uuid.UUID(str(pk))
+        except ValueError:
+            errors["id"] = ["UUID inválido."]
+
+    producer = Producer(**values)
+    try:
+        producer.clean_fields(
+            exclude=[field.name for field in Producer._meta.fields if field.name not in values]
+        )
+    except ValidationError as exc:
+        errors.update(exc.message_dict)
+    if errors:
+        raise ValidationError(errors)
+
+    slugs = _as_list(row["categories"]) if "categories" in row else None
+    return producer, slugs, [name for name in values if name != "id"]
+
+
+def import_chunk(rows):
+    """Validate and write one chunk of ``(line_number, row)`` in a transaction"""
+    result = {"created": 0, "updated": 0, "errors": []}
+    cleaned = []
+    for line_number, row in rows:
+        if isinstance(row, ValidationError):
+            result["errors"].append({"line": line_number, "errors": row.messages})
+            continue
+        try:
+            cleaned.append((line_number, *clean_row(row)))
+        except ValidationError as exc:
+            result["errors"].append({"line": line_number, "errors": exc.message_dict})
+
+    slugs = {slug for _, _, row_slugs, _ in cleaned for slug in row_slugs or []}
+    categories = dict(Category.objects.filter(slug__in=slugs).values_list("slug", "pk"))
+    valid = []
+    seen = {}
+    for line_number, producer, row_slugs, provided in cleaned:
+        unknown = [slug for slug in row_slugs or [] if slug not in categories]
+        if unknown:
+            message = f"Categorias desconhecidas: {', '.join(unknown)}"
+            result["errors"].append({"line": line_number, "errors": {"categories": [message]}})
+        elif producer.pk in seen:
+            message = f"Id repetido (linha {seen[producer.pk]})."
+            result["errors"].append({"line": line_number, "errors": {"id": [message]}})
+        else:
+            seen[producer.pk] = line_number
+            valid.append((line_number, producer, row_slugs, provided))
+
+    ids = [producer.pk for _, producer, _, _ in valid if producer.pk]
+    existing = set(Producer.objects.filter(pk__in=ids).values_list("pk", flat=True))
+    # New producers need a name; updates may send only the changed columns
+    for entry in list(valid):
+        line_number, producer, _, provided = entry
+        if producer.pk not in existing and "name" not in provided:
+            result["errors"].append(
+                {"line": line_number, "errors": {"name": ["Este campo é obrigatório."]}}
+            )
+            valid.remove(entry)
+    if not valid:
+        return result
+
+    to_create, to_update = [], []
+    for _, producer, _, provided in valid:
+        if producer.pk in existing:
+            to_update.append((producer, provided))
+        else:
+            to_create.append(producer)
+    links = {
+        producer.pk: [categories[slug] for slug in row_slugs]
+        for _, producer, row_slugs, _ in valid
+        if row_slugs is not None
+    }
+    with transaction.atomic():
+        save_producers(to_create, to_update)
+        set_categories(links)
+        refresh_derived([producer.pk for _, producer, _, _ in valid])
+    cache.bump_generation()
+
+    result["created"] = len(to_create)
+    result["updated"] = len(to_update)
+    return result
+
+
+def save_producers(to_create, to_update):
+    """Write producers with one INSERT batch and one UPDATE batch per field set.
+
+    ``to_update`` holds ``(producer, fields)`` pairs; only those fields are
+    written, plus ``updated_at`` and the derived columns (map grid, city key)
+    when their source fields change. Missing coordinates are filled from the
+    gazetteer; coordinates given in ``fields`` count as entered by hand.
+    ``updated_at`` is stamped again when the transaction commits, however
+    long it runs (see ``changes.stamp_on_commit``).
+    """
+    for producer in to_create:
+        producer.update_coordinates()
+        producer.update_derived_fields()
+    Producer.objects.bulk_create(to_create)
+    changes.stamp_on_commit(
+        [producer.pk for producer in to_create] + [producer.pk for producer, _ in to_update]
+    )
+    now = timezone.now()
+    groups = {}
+    moved = []
+    for producer, fields in to_update:
+        producer.updated_at = now
+        fields = set(fields) | {"updated_at"}
+        # Either one moves the pin; the other is the current value
+        coordinates = bool({"latitude", "longitude"} & fields)
+        # Written by geocoding itself, which needs no second pass
+        geocoded = "geocode_source" in fields
+        if coordinates:
+            if not geocoded:
+                producer.geocode_source = ""
+            fields |= {"latitude", "longitude", "geocode_source", "grid_x", "grid_y"}
+        if not geocoded and (
+            {"zip_code", "city"} & fields
+            or (coordinates and None in (producer.latitude, producer.longitude))
+        ):
+            # Geocoded below, once the new address is written
+            moved.append(producer.pk)
+        if "city" in fields:
+            fields.add("city_key")
+        producer.update_derived_fields()
+        groups.setdefault(frozenset(fields), []).append(producer)
+    for fields, producers in groups.items():
+        Producer.objects.bulk_update(producers, sorted(fields))
+    if moved:
+        geocoding.geocode_producers(Producer.objects.filter(pk__in=moved), refresh=True)
+
+
+def set_categories(links):
+    """Replace the categories of several producers: ``{producer_id: [category_id]}``"""
+    through = Producer.categories.through
+    through.objects.filter(producer_id__in=list(links)).delete()
+    through.objects.bulk_create(
+        [
+            through(producer_id=producer_id, category_id=category_id)
+            for producer_id, category_ids in links.items()
+            for category_id in category_ids
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def refresh_derived(producer_ids):
+    """Rebuild the product catalogue and search documents after bulk writes"""
+    written = Producer.objects.filter(pk__in=list(producer_ids))
+    sync_catalogue(list(written.only("pk", "products")), Product, ProducerProduct)
+    search.index_producers(written.prefetch_related("categories"))
+
+
+def import_producers(stream, file_format, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Import a CSV/NDJSON text stream, returning counts and per-line errors"""
+    summary = {"created": 0, "updated": 0, "errors": []}
+    rows = read_rows(stream, file_format)
+    while chunk := list(islice(rows, chunk_size)):
+        result = import_chunk(chunk)
+        summary["created"] += result["created"]
+        summary["updated"] += result["updated"]
+        summary["errors"].extend(result["errors"])
+    return summary
+
+
+def export_row(producer):
+    row = {"id": str(producer.pk)}
+    for name in MODEL_FIELDS:
+        row[name] = getattr(producer, name)
+    row["products"] = row["products"] if isinstance(row["products"], list) else []
+    row["categories"] = [category.slug for category in producer.categories.all()]
+    return row
+
+
+def csv_row(producer):
+    """``export_row`` with list values joined for a CSV cell"""
+    row = export_row(producer)
+    row["products"] = LIST_SEPARATOR.join(row["products"])
+    row["categories"] = LIST_SEPARATOR.join(row["categories"])
+    return row
+
+
+def iter_export(queryset, file_format, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the export line by line, reading the queryset in chunks"""
+    queryset = queryset.prefetch_related("categories")
+    if file_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+        writer.writeheader()
+    for producer in queryset.iterator(chunk_size=chunk_size):
+        if file_format == "ndjson":
+            yield json.dumps(export_row(producer), ensure_ascii=False) + "\n"
+            continue
+        writer.writerow(csv_row(producer))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if file_format == "csv" and buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,178 @@
+"""Response cache for the producer API.
+
+Cached entries are keyed on a generation counter that is bumped whenever a
+producer, category or gallery image changes (see ``signals.py``), so stale
+responses are never served and no key enumeration is needed to invalidate.
+
+A bump also marks the directory as recently written for
+``DATABASE_REPLICA_LAG_SECONDS``. Reads stay on the primary meanwhile (see
+``routers.replicas_caught_up``), so a lagging replica's pre-write data is not
+cached under the new generation. The marker lives in this cache, so with more
+than one process it needs a shared backend, as the generation itself does.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+GENERATION_KEY = "producer:generation"
+HITS_KEY = "producer:stats:hits"
+MISSES_KEY = "producer:stats:misses"
+WRITTEN_KEY = "producer:written"
+
+
+def get_cache():
+    return caches[getattr(settings, "PRODUCER_CACHE_ALIAS", "default")]
+
+
+def get_timeout():
+    return getattr(settings, "PRODUCER_CACHE_TIMEOUT", 300)
+
+
+def get_replica_lag():
+    return getattr(settings, "DATABASE_REPLICA_LAG_SECONDS", 5)
+
+
+def _incr(cache, key):
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, 1, timeout=None)
+        return 1
+
+
+async def _aincr(cache, key):
+    await cache.aadd(key, 0, timeout=None)
+    try:
+        return await cache.aincr(key)
+    except ValueError:
+        await cache.aset(key, 1, timeout=None)
+        return 1
+
+
+def get_generation():
+    cache = get_cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, 1, timeout=None)
+        generation = cache.get(GENERATION_KEY, 1)
+    return generation
+
+
+async def aget_generation():
+    cache = get_cache()
+    generation = await cache.aget(GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(GENERATION_KEY, 1, timeout=None)
+        generation = await cache.aget(GENERATION_KEY, 1)
+    return generation
+
+
+def bump_generation():
+    """Invalidate every cached producer response"""
+    cache = get_cache()
+    # Set before the bump: a reader of the new generation also sees the marker
+    if get_replica_lag():
+        cache.set(WRITTEN_KEY, True, timeout=get_replica_lag())
+    return _incr(cache, GENERATION_KEY)
+
+
+def recently_written():
+    return bool(get_cache().get(WRITTEN_KEY))
+
+
+async def arecently_written():
+    return bool(await get_cache().aget(WRITTEN_KEY))
+
+
+def normalize_params(query_params, exclude=()):
+    """Sorted ``(name, values)`` pairs, ignoring blank values and ``exclude``.
+
+    Values are stripped: every filter ignores surrounding whitespace.
+    """
+    params = []
+    for name in sorted(query_params):
+        if name in exclude:
+            continue
+        values = sorted(v.strip() for v in query_params.getlist(name) if v.strip())
+        if values:
+            params.append((name, values))
+    return params
+
+
+def _digest(request, action, pk, exclude):
+    params = normalize_params(request.query_params, exclude)
+    raw = repr((request.get_host(), action, str(pk), params))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def make_key(request, action, pk=None, exclude=()):
+    """Cache key for a request, scoped to the current generation.
+
+    The host is part of the key because responses contain absolute media URLs.
+    Params listed in ``exclude`` do not affect the response and are ignored.
+    """
+    return f"producer:response:{get_generation()}:{_digest(request, action, pk, exclude)}"
+
+
+async def amake_key(request, action, pk=None, exclude=()):
+    """Async ``make_key``; keys are shared with the sync views"""
+    return f"producer:response:{await aget_generation()}:{_digest(request, action, pk, exclude)}"
+
+
+def lookup(key):
+    """Return the cached entry for ``key`` or None, counting hits and misses"""
+    cache = get_cache()
+    cached = cache.get(key)
+    _incr(cache, HITS_KEY if cached is not None else MISSES_KEY)
+    return cached
+
+
+async def alookup(key):
+    cache = get_cache()
+    cached = await cache.aget(key)
+    await _aincr(cache, HITS_KEY if cached is not None else MISSES_KEY)
+    return cached
+
+
+def store(key, entry):
+    get_cache().set(key, entry, get_timeout())
+
+
+async def astore(key, entry):
+    await get_cache().aset(key, entry, get_timeout())
+
+
+def get_or_set(key, compute):
+    """Return the cached ``(status, data)`` for ``key``, computing it on a miss.
+
+    ``compute`` returns a ``(status, data)`` pair; only 200 responses are
+    stored. The boolean tells whether the value came from the cache.
+    """
+    cached = lookup(key)
+    if cached is not None:
+        return cached, True
+    status, data = compute()
+    if status == 200:
+        store(key, (status, data))
+    return (status, data), False
+
+
+def stats():
+    cache = get_cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / total, 4) if total else None,
+        "generation": get_generation(),
+    }
+
+
+def reset_stats():
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
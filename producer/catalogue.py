@@ -0,0 +1,47 @@
+"""Keep the normalized product catalogue in sync with ``Producer.products``.
+
+The JSON field remains the value clients read and write; the ``Product`` and
+``ProducerProduct`` tables are derived from it so that "who sells X" is an
+indexed lookup. Functions take the model classes as arguments so the data
+migration can run them with historical models.
+"""
+
+from django.utils.text import slugify
+
+
+def product_names(products):
+    """Return ``[(slug, name), ...]`` for a products JSON value, deduplicated"""
+    if not isinstance(products, list):
+        return []
+    seen = {}
+    for product in products:
+        name = str(product).strip()
+        slug = slugify(name)[:200]
+        if slug and slug not in seen:
+            seen[slug] = name[:200]
+    return list(seen.items())
+
+
+def sync_catalogue(producers, product_model, link_model):
+    """Rebuild the product links of ``producers`` from their JSON field"""
+    wanted = {producer.pk: product_names(producer.products) for producer in producers}
+    if not wanted:
+        return
+
+    names = {slug: name for entries in wanted.values() for slug, name in entries}
+    product_model.objects.bulk_create(
+        [product_model(slug=slug, name=name) for slug, name in names.items()],
+        ignore_conflicts=True,
+    )
+    product_ids = dict(
+        product_model.objects.filter(slug__in=names).values_list("slug", "pk")
+    )
+
+    link_model.objects.filter(producer_id__in=wanted).delete()
+    link_model.objects.bulk_create(
+        [
+            link_model(producer_id=producer_id, product_id=product_ids[slug], order=order)
+            for producer_id, entries in wanted.items()
+            for order, (slug, _name) in enumerate(entries)
+        ]
+    )
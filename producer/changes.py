@@ -0,0 +1,123 @@
+"""Incremental sync feed for clients that mirror the producer directory.
+
+Changes are read in ``(timestamp, id)`` order from two streams, merged:
+producers by ``updated_at`` (which related category and gallery changes also
+bump, see ``signals.touch``) and ``DeletedProducer`` tombstones by
+``deleted_at``. Active producers are reported as upserts; deactivated and
+deleted ones as deletes.
+
+The position of the last change returned is handed to the client as an
+opaque token. Changes newer than ``PRODUCER_CHANGES_SETTLE_SECONDS`` are held
+back, so a transaction that is still committing with an earlier timestamp
+is not skipped by a client that already moved past it. Timestamps are taken
+when rows are written, so a transaction that commits later than that would
+still be missed: bulk writers re-stamp their rows on commit (see
+``stamp_on_commit``), and any other writer must keep its transactions
+shorter than the delay.
+"""
+
+import base64
+import heapq
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import DeletedProducer, Producer
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+UPSERT = "upsert"
+DELETE = "delete"
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+def encode_token(changed_at, pk):
+    microseconds = (changed_at - EPOCH) // timedelta(microseconds=1)
+    raw = f"{microseconds}:{uuid.UUID(str(pk)).hex}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_token(token):
+    """Return the ``(changed_at, pk)`` position encoded in ``token``"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        microseconds, pk = raw.split(":")
+        return EPOCH + timedelta(microseconds=int(microseconds)), uuid.UUID(pk)
+    except (ValueError, UnicodeDecodeError, OverflowError) as exc:
+        raise InvalidToken(str(exc)) from exc
+
+
+def get_settle_delay():
+    return timedelta(seconds=getattr(settings, "PRODUCER_CHANGES_SETTLE_SECONDS", 5))
+
+
+def stamp_on_commit(producer_ids=(), deleted_ids=()):
+    """Stamp producers and tombstones written in the current transaction
+    again when it commits.
+
+    Clients that read the feed meanwhile then get them after their position
+    instead of skipping them; at worst a change is reported twice.
+    """
+    if not transaction.get_connection().in_atomic_block:
+        return
+    producer_ids, deleted_ids = list(producer_ids), list(deleted_ids)
+
+    def stamp():
+        now = timezone.now()
+        if producer_ids:
+            Producer.objects.filter(pk__in=producer_ids).update(updated_at=now)
+        if deleted_ids:
+            DeletedProducer.objects.filter(producer_id__in=deleted_ids).update(deleted_at=now)
+
+    transaction.on_commit(stamp)
+
+
+def _after(position, time_field, id_field):
+    if position is None:
+        return Q()
+    changed_at, pk = position
+    return Q(**{f"{time_field}__gt": changed_at}) | Q(
+        **{time_field: changed_at, f"{id_field}__gt": pk}
+    )
+
+
+def read_changes(position, limit, until=None):
+    """Return ``(changes, has_more)`` after ``position`` (``None``: from the start).
+
+    Each change is ``(changed_at, pk, action, reason)``. Starting from the
+    beginning, only active producers are listed: there is nothing to delete.
+    """
+    until = until or timezone.now() - get_settle_delay()
+    producers = Producer.objects.filter(
+        _after(position, "updated_at", "pk"), updated_at__lte=until
+    ).order_by("updated_at", "pk")
+    if position is None:
+        producers = producers.filter(is_active=True)
+    streams = [
+        [
+            (changed_at, pk, UPSERT, None) if active else (changed_at, pk, DELETE, "inactive")
+            for changed_at, pk, active in producers.values_list(
+                "updated_at", "pk", "is_active"
+            )[: limit + 1]
+        ]
+    ]
+    if position is not None:
+        tombstones = DeletedProducer.objects.filter(
+            _after(position, "deleted_at", "producer_id"), deleted_at__lte=until
+        ).order_by("deleted_at", "producer_id")
+        streams.append(
+            [
+                (changed_at, pk, DELETE, "deleted")
+                for changed_at, pk in tombstones.values_list("deleted_at", "producer_id")[
+                    : limit + 1
+                ]
+            ]
+        )
+    changes = list(heapq.merge(*streams, key=lambda change: change[:2]))
+    return changes[:limit], len(changes) > limit
@@ -0,0 +1,59 @@
+"""Facet counts for the producer filter sidebar."""
+
+from django.db.models import Count, Max
+
+from .models import Producer
+
+# Query params that change the page or representation but not the matches
+NON_FILTER_PARAMS = ("page", "page_size", "cursor", "pagination", "fields", "omit", "view")
+
+
+def facet_counts(queryset):
+    """Count the producers of ``queryset`` per category, city and district.
+
+    ``queryset`` may carry joins and annotations from the list filters, so it
+    is reduced to a primary key subquery; each facet is then a single
+    GROUP BY query.
+    """
+    base = Producer.objects.filter(pk__in=queryset.order_by().values("pk"))
+
+    through = Producer.categories.through
+    categories = (
+        through.objects.filter(producer__in=base)
+        .values("category_id", "category__name", "category__slug")
+        .annotate(count=Count("producer_id"))
+        .order_by("-count", "category__name")
+    )
+
+    def by_field(field):
+        rows = (
+            base.exclude(**{field: ""})
+            .values(field)
+            .annotate(count=Count("pk"))
+            .order_by("-count", field)
+        )
+        return [{"value": row[field], "count": row["count"]} for row in rows]
+
+    # Grouped on the normalized key, so "Braga" and "braga " are one city;
+    # one spelling is shown (it filters the same way, see CityFilter)
+    cities = (
+        base.exclude(city_key="")
+        .values("city_key")
+        .annotate(label=Max("city"), count=Count("pk"))
+        .order_by("-count", "city_key")
+    )
+
+    return {
+        "total": base.count(),
+        "categories": [
+            {
+                "id": row["category_id"],
+                "name": row["category__name"],
+                "slug": row["category__slug"],
+                "count": row["count"],
+            }
+            for row in categories
+        ],
+        "cities": [{"value": row["label"], "count": row["count"]} for row in cities],
+        "states": by_field("state"),
+    }
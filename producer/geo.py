@@ -0,0 +1,93 @@
+"""Geospatial helpers for producer search without PostGIS."""
+
+import math
+
+from django.db.models import F, FloatField
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """Return ``(min_lat, max_lat, min_lon, max_lon)`` enclosing the circle.
+
+    The box is a cheap, index-friendly pre-filter; results still need the exact
+    haversine distance to drop the corners.
+    """
+    lat_delta = radius_km / KM_PER_DEGREE_LAT
+    cos_lat = math.cos(math.radians(latitude))
+    if cos_lat < 1e-6:
+        lon_delta = 180.0
+    else:
+        lon_delta = min(radius_km / (KM_PER_DEGREE_LAT * cos_lat), 180.0)
+    return (
+        max(latitude - lat_delta, -90.0),
+        min(latitude + lat_delta, 90.0),
+        longitude - lon_delta,
+        longitude + lon_delta,
+    )
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in kilometres between two points."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def distance_expression(latitude, longitude):
+    """Database expression computing the haversine distance to a point in km."""
+    phi1 = math.radians(latitude)
+    d_phi = (Radians(F("latitude")) - phi1) / 2
+    d_lambda = (Radians(F("longitude")) - math.radians(longitude)) / 2
+    a = Power(Sin(d_phi), 2) + math.cos(phi1) * Cos(Radians(F("latitude"))) * Power(
+        Sin(d_lambda), 2
+    )
+    return 2 * EARTH_RADIUS_KM * ASin(Sqrt(a), output_field=FloatField())
+
+
+def filter_near(queryset, latitude, longitude, radius_km):
+    """Restrict ``queryset`` to producers within ``radius_km`` of a point.
+
+    Rows are pruned by the indexed latitude/longitude bounding box first, then
+    annotated with ``distance_km`` and ordered from the closest.
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+    return (
+        queryset.filter(
+            latitude__range=(min_lat, max_lat),
+            longitude__range=(min_lon, max_lon),
+        )
+        .annotate(distance_km=distance_expression(latitude, longitude))
+        .filter(distance_km__lte=radius_km)
+        .order_by("distance_km", "name")
+    )
+
+
+# Producers are bucketed once, on save, into Web Mercator tile coordinates at
+# GRID_ZOOM. Coarser cells for any lower zoom are obtained by integer division,
+# so clustering is a plain GROUP BY over two integer columns.
+GRID_ZOOM = 20
+MAX_MERCATOR_LAT = 85.05112878
+# Each map tile is split into 2**CELL_BITS x 2**CELL_BITS clustering cells
+CELL_BITS = 2
+
+
+def grid_cell(latitude, longitude):
+    """Return the ``(x, y)`` tile coordinates of a point at ``GRID_ZOOM``."""
+    if latitude is None or longitude is None:
+        return None, None
+    size = 2**GRID_ZOOM
+    lat = max(min(latitude, MAX_MERCATOR_LAT), -MAX_MERCATOR_LAT)
+    lat_rad = math.radians(lat)
+    x = (longitude + 180.0) / 360.0 * size
+    y = (1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * size
+    return min(max(int(x), 0), size - 1), min(max(int(y), 0), size - 1)
+
+
+def cell_divisor(zoom):
+    """Divisor mapping ``GRID_ZOOM`` coordinates to clustering cells at ``zoom``."""
+    return 2 ** max(GRID_ZOOM - zoom - CELL_BITS, 0)
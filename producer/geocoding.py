@@ -0,0 +1,234 @@
+"""Offline geocoding of producer addresses.
+
+Coordinates come from a gazetteer loaded into the ``Place`` table by the
+``load_gazetteer`` command, so no network access is needed. A gazetteer is a
+CSV file with the columns ``postal_code``, ``city``, ``district``,
+``latitude`` and ``longitude``; rows may omit the postal code to give the
+centre of a city directly. Three kinds of places are derived from it, tried
+from the most precise:
+
+* the full postal code (``4700-123``);
+* the postal area, i.e. its first four digits, at the mean of its codes;
+* the city, by accent-folded name, at the mean of its codes unless a row
+  without postal code gives its centre.
+
+Lookups are memoized per process, keyed on the gazetteer version: the
+highest ``Place`` id. ``load_gazetteer`` replaces every row and new rows get
+higher ids, so each load changes the version. It is read from the database
+(one indexed query), so every process sees a reload without a shared cache.
+"""
+
+import csv
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from django.db import transaction
+from django.db.models import Max, Q
+
+from .search import normalize
+
+POSTAL_CODE_RE = re.compile(r"^\s*(\d{4})\s*-?\s*(\d{3})?\s*$")
+BATCH_SIZE = 1000
+# Fields written when coordinates are filled from the gazetteer
+GEOCODED_FIELDS = ("latitude", "longitude", "geocode_source")
+
+Match = namedtuple("Match", ["latitude", "longitude", "source"])
+
+
+def parse_postal_code(value):
+    """Return ``(postal_code, postal_area)``, e.g. ``("4700-123", "4700")``.
+
+    Either part is ``None`` when ``value`` does not contain it.
+    """
+    found = POSTAL_CODE_RE.match(value or "")
+    if not found:
+        return None, None
+    area, suffix = found.groups()
+    return (f"{area}-{suffix}" if suffix else None), area
+
+
+def city_key(value):
+    """Accent-folded, lowercased city name with single spaces"""
+    return " ".join(normalize(value).split())
+
+
+def get_version():
+    """Highest ``Place`` id, which changes with every gazetteer load"""
+    from .models import Place
+
+    return Place.objects.aggregate(version=Max("pk"))["version"]
+
+
+@lru_cache(maxsize=8192)
+def _resolve(version, postal_code, postal_area, city):
+    from .models import Place
+
+    candidates = Q(pk__in=[])
+    if postal_code:
+        candidates |= Q(kind=Place.Kind.POSTAL_CODE, key=postal_code)
+    if postal_area:
+        candidates |= Q(kind=Place.Kind.POSTAL_AREA, key=postal_area)
+    if city:
+        candidates |= Q(kind=Place.Kind.CITY, key=city)
+    places = {
+        kind: (latitude, longitude, key)
+        for kind, key, latitude, longitude in Place.objects.filter(candidates).values_list(
+            "kind", "key", "latitude", "longitude"
+        )
+    }
+    for kind in Place.PRECISION:
+        if kind in places:
+            latitude, longitude, key = places[kind]
+            return Match(latitude, longitude, f"{kind}:{key}")
+    return None
+
+
+def lookup(zip_code, city, version=None):
+    """Coordinates for an address as a ``Match``, or ``None`` if unknown"""
+    postal_code, postal_area = parse_postal_code(zip_code)
+    key = city_key(city)
+    if not (postal_area or key):
+        return None
+    if version is None:
+        version = get_version()
+    return _resolve(version, postal_code, postal_area, key)
+
+
+def clear_memo():
+    _resolve.cache_clear()
+
+
+def read_gazetteer(stream):
+    """Aggregate gazetteer rows into ``(places, errors)``.
+
+    ``places`` maps ``(kind, key)`` to ``(name, district, latitude, longitude)``.
+    """
+    from .models import Place
+
+    postal_codes, explicit_cities, errors = {}, {}, []
+    sums = {}  # (kind, key) -> [name, district, latitude sum, longitude sum, count]
+    reader = csv.DictReader(stream)
+    for row in reader:
+        try:
+            latitude = float(row.get("latitude") or "")
+            longitude = float(row.get("longitude") or "")
+        except ValueError:
+            errors.append({"line": reader.line_num, "errors": ["Coordenadas inválidas."]})
+            continue
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            errors.append({"line": reader.line_num, "errors": ["Coordenadas fora dos limites."]})
+            continue
+        name = (row.get("city") or "").strip()
+        district = (row.get("district") or "").strip()
+        raw_code = (row.get("postal_code") or "").strip()
+        postal_code, postal_area = parse_postal_code(raw_code)
+        if raw_code and not postal_code:
+            errors.append({"line": reader.line_num, "errors": ["Código postal inválido."]})
+            continue
+        if not postal_code and not name:
+            errors.append({"line": reader.line_num, "errors": ["Sem código postal nem cidade."]})
+            continue
+
+        if postal_code:
+            postal_codes[postal_code] = (name, district, latitude, longitude)
+            totals = [(Place.Kind.POSTAL_AREA, postal_area)]
+            if name:
+                totals.append((Place.Kind.CITY, city_key(name)))
+            for total_key in totals:
+                total = sums.setdefault(total_key, [name, district, 0.0, 0.0, 0])
+                total[2] += latitude
+                total[3] += longitude
+                total[4] += 1
+        else:
+            explicit_cities[city_key(name)] = (name, district, latitude, longitude)
+
+    places = {
+        key: (name, district, latitude / count, longitude / count)
+        for key, (name, district, latitude, longitude, count) in sums.items()
+    }
+    places.update(
+        ((Place.Kind.POSTAL_CODE, code), value) for code, value in postal_codes.items()
+    )
+    places.update(((Place.Kind.CITY, key), value) for key, value in explicit_cities.items())
+    return places, errors
+
+
+def load_gazetteer(stream, batch_size=BATCH_SIZE):
+    """Replace the ``Place`` table with a gazetteer read from a CSV stream.
+
+    Returns counts per kind of place and per-line errors.
+    """
+    from .models import Place
+
+    places, errors = read_gazetteer(stream)
+    with transaction.atomic():
+        Place.objects.all().delete()
+        Place.objects.bulk_create(
+            (
+                Place(
+                    kind=kind,
+                    key=key,
+                    name=name,
+                    district=district,
+                    latitude=latitude,
+                    longitude=longitude,
+                )
+                for (kind, key), (name, district, latitude, longitude) in places.items()
+            ),
+            batch_size=batch_size,
+        )
+    clear_memo()
+    summary = {kind: 0 for kind in Place.Kind.values}
+    for kind, _ in places:
+        summary[kind] += 1
+    summary["errors"] = errors
+    return summary
+
+
+def geocode_producers(queryset, refresh=False, batch_size=BATCH_SIZE):
+    """Fill coordinates of the producers in ``queryset`` from the gazetteer.
+
+    Producers without coordinates are geocoded; with ``refresh``, so are
+    those whose coordinates came from the gazetteer, to follow address or
+    gazetteer changes; those whose address no longer resolves lose their
+    gazetteer coordinates. Coordinates entered by hand are never changed.
+    Returns ``{"geocoded": n, "unresolved": n}``.
+    """
+    from .bulk import save_producers
+
+    wanted = Q(latitude__isnull=True) | Q(longitude__isnull=True)
+    if refresh:
+        wanted |= ~Q(geocode_source="")
+    candidates = (
+        queryset.filter(wanted)
+        .exclude(Q(zip_code__isnull=True) | Q(zip_code=""), city="")
+        .only("pk", "zip_code", "city", *GEOCODED_FIELDS)
+        .order_by("pk")
+    )
+    version = get_version()
+    summary = {"geocoded": 0, "unresolved": 0}
+    last_pk = None
+    while True:
+        page = candidates if last_pk is None else candidates.filter(pk__gt=last_pk)
+        batch = list(page[:batch_size])
+        if not batch:
+            return summary
+        last_pk = batch[-1].pk
+        changed = []
+        for producer in batch:
+            match = lookup(producer.zip_code, producer.city, version)
+            if match is None:
+                summary["unresolved"] += 1
+                if producer.geocode_source:
+                    # The address moved off the gazetteer: drop the old pin
+                    producer.latitude = producer.longitude = None
+                    producer.geocode_source = ""
+                    changed.append((producer, GEOCODED_FIELDS))
+                continue
+            summary["geocoded"] += 1
+            if (producer.latitude, producer.longitude, producer.geocode_source) != match:
+                producer.latitude, producer.longitude, producer.geocode_source = match
+                changed.append((producer, GEOCODED_FIELDS))
+        with transaction.atomic():
+            save_producers([], changed)
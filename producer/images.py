@@ -0,0 +1,162 @@
+"""Resized JPEG and WebP derivatives of producer images.
+
+Derivatives are generated off the request path: saving a producer or gallery
+image with a new file schedules a job on a small thread pool once the
+transaction commits. The generated file names are recorded in the model's
+``derivatives`` field, so serializers can build a srcset without touching the
+storage backend.
+"""
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_FORMATS = {
+    "jpeg": ("JPEG", "jpg", {"quality": 82, "optimize": True, "progressive": True}),
+    "webp": ("WEBP", "webp", {"quality": 80, "method": 4}),
+}
+
+_executor = None
+
+
+def get_widths():
+    return getattr(settings, "IMAGE_DERIVATIVE_WIDTHS", [320, 640, 1280])
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, "IMAGE_DERIVATIVE_WORKERS", 2),
+            thread_name_prefix="image-derivatives",
+        )
+    return _executor
+
+
+def needs_derivatives(file, derivatives):
+    """Whether ``derivatives`` were not generated from the current ``file``"""
+    name = file.name if file else None
+    return (derivatives or {}).get("source") != name
+
+
+def derivative_name(source_name, width, extension):
+    directory, filename = os.path.split(source_name)
+    root = os.path.splitext(filename)[0]
+    return os.path.join(directory, "derivatives", f"{root}__{width}w.{extension}")
+
+
+def delete_derivatives(derivatives, storage=default_storage):
+    for formats in (derivatives or {}).get("widths", {}).values():
+        for name in formats.values():
+            storage.delete(name)
+
+
+def build_derivatives(file, storage=default_storage):
+    """Generate resized copies of ``file`` and return the derivatives record"""
+    from PIL import Image, ImageOps
+
+    if not file:
+        return {"source": None, "widths": {}}
+
+    with storage.open(file.name, "rb") as handle:
+        original = ImageOps.exif_transpose(Image.open(handle))
+        original.load()
+
+    widths = [width for width in get_widths() if width < original.width] or [original.width]
+    record = {"source": file.name, "widths": {}}
+    for width in widths:
+        height = max(round(original.height * width / original.width), 1)
+        resized = original.resize((width, height), Image.Resampling.LANCZOS)
+        if resized.mode not in ("RGB", "RGBA"):
+            resized = resized.convert("RGBA" if "A" in resized.getbands() else "RGB")
+        formats = {}
+        for key, (pil_format, extension, options) in DERIVATIVE_FORMATS.items():
+            image = resized.convert("RGB") if pil_format == "JPEG" else resized
+            buffer = BytesIO()
+            image.save(buffer, pil_format, **options)
+            name = derivative_name(file.name, width, extension)
+            formats[key] = storage.save(name, ContentFile(buffer.getvalue()))
+        record["widths"][str(width)] = formats
+    return record
+
+
+def srcset(derivatives, build_url):
+    """``{"jpeg": "url 320w, ...", "webp": ...}`` from a derivatives record"""
+    widths = sorted((derivatives or {}).get("widths", {}).items(), key=lambda item: int(item[0]))
+    if not widths:
+        return {}
+    return {
+        key: ", ".join(f"{build_url(formats[key])} {width}w" for width, formats in widths)
+        for key in DERIVATIVE_FORMATS
+    }
+
+
+def refresh_derivatives(model, pk, force=False, lock=None):
+    """Regenerate the derivatives of one Producer or ProducerImage row.
+
+    Images are processed outside any transaction; only the final row updates
+    run in one, under ``lock`` when given (see ``jobs.database_turn``).
+    """
+    from . import cache
+    from .models import Producer, ProducerImage
+
+    file_field = "main_image" if model is Producer else "image"
+    instance = model.objects.filter(pk=pk).only("pk", file_field, "derivatives").first()
+    if instance is None:
+        return False
+    file = getattr(instance, file_field)
+    if not force and not needs_derivatives(file, instance.derivatives):
+        return False
+
+    record = build_derivatives(file)
+    with lock or nullcontext(), transaction.atomic():
+        # Only record them if the file was not replaced meanwhile: a newer job
+        # owns the row's derivatives then, and ours are already stale
+        current = model.objects.filter(pk=pk, **{file_field: file.name})
+        now = timezone.now()
+        if model is Producer:
+            updated = current.update(derivatives=record, updated_at=now)
+        else:
+            updated = current.update(derivatives=record)
+            if updated:
+                producer_id = current.values_list("producer_id", flat=True)
+                Producer.objects.filter(pk__in=producer_id).update(updated_at=now)
+        if updated:
+            old = instance.derivatives
+            transaction.on_commit(lambda: delete_derivatives(old))
+    if not updated:
+        delete_derivatives(record)
+        return False
+    cache.bump_generation()
+    return True
+
+
+def _run_job(model, pk):
+    close_old_connections()
+    try:
+        refresh_derivatives(model, pk)
+    except Exception:
+        logger.exception("Failed to generate image derivatives for %s %s", model.__name__, pk)
+    finally:
+        connections.close_all()
+
+
+def schedule_derivatives(instance):
+    """Queue derivative generation for ``instance`` after the transaction commits"""
+    if not getattr(settings, "IMAGE_DERIVATIVES_ENABLED", True):
+        return
+    model, pk = type(instance), instance.pk
+    if getattr(settings, "IMAGE_DERIVATIVES_ASYNC", True):
+        transaction.on_commit(lambda: get_executor().submit(_run_job, model, pk))
+    else:
+        transaction.on_commit(lambda: refresh_derivatives(model, pk))
@@ -0,0 +1,212 @@
+"""Background jobs over selections of producers.
+
+Admin actions create a ``Job`` row holding the selected producer ids; the
+``run_jobs`` management command claims pending jobs and runs them on a thread
+pool. A job is processed in chunks; handlers keep their writes in short
+transactions of their own. The job's ``processed`` counter and ``updated_at``
+heartbeat are updated after each chunk so progress shows in the admin and a
+job is only requeued once it stops making progress. Small selections are run
+straight away in the request.
+
+Exports are written to ``JOBS_EXPORT_ROOT``, outside the public media
+directory; staff download them from the job's admin page.
+"""
+
+import csv
+import logging
+import os
+import tempfile
+import threading
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import close_old_connections, connection, connections, transaction
+from django.utils import timezone
+
+from . import bulk, cache, geocoding, images, search
+from .models import Job, Producer, ProducerImage
+
+logger = logging.getLogger(__name__)
+
+_sqlite_lock = threading.Lock()
+
+
+def get_chunk_size():
+    return getattr(settings, "JOBS_CHUNK_SIZE", 200)
+
+
+def database_turn():
+    """SQLite has a single writer: worker threads take turns instead of
+    failing with "database is locked" while another one writes"""
+    return _sqlite_lock if connection.vendor == "sqlite" else nullcontext()
+
+
+def get_export_storage():
+    """Private storage for exported files: no URL, served by the admin only"""
+    root = getattr(settings, "JOBS_EXPORT_ROOT", os.path.join(settings.BASE_DIR, "exports"))
+    return FileSystemStorage(location=root, base_url=None)
+
+
+def set_active(job, ids, active):
+    Producer.objects.filter(pk__in=ids).update(is_active=active, updated_at=timezone.now())
+    cache.bump_generation()
+
+
+def regenerate_images(job, ids):
+    failed = job.result.get("failed", [])
+    with database_turn():
+        gallery = list(
+            ProducerImage.objects.filter(producer_id__in=ids).values_list("pk", flat=True)
+        )
+    targets = [(Producer, pk) for pk in ids] + [(ProducerImage, pk) for pk in gallery]
+    for model, pk in targets:
+        try:
+            images.refresh_derivatives(model, pk, force=True, lock=database_turn())
+        except (OSError, ValueError) as exc:
+            failed.append(f"{model.__name__} {pk}: {exc}")
+    job.result["failed"] = failed
+
+
+def reindex(job, ids):
+    with transaction.atomic():
+        search.index_producers(
+            Producer.objects.filter(pk__in=ids).prefetch_related("categories")
+        )
+
+
+def geocode(job, ids):
+    summary = geocoding.geocode_producers(Producer.objects.filter(pk__in=ids), refresh=True)
+    for name, count in summary.items():
+        job.result[name] = job.result.get(name, 0) + count
+    cache.bump_generation()
+
+
+def export_path(job):
+    return os.path.join(tempfile.gettempdir(), f"produtores-tarefa-{job.pk}.csv")
+
+
+def export(job, ids):
+    """Append the chunk to a local CSV, stored when the job finishes"""
+    first_chunk = job.processed == 0
+    queryset = Producer.objects.filter(pk__in=ids).order_by("name").prefetch_related("categories")
+    with database_turn():
+        rows = [bulk.csv_row(producer) for producer in queryset]
+    with open(export_path(job), "w" if first_chunk else "a", encoding="utf-8", newline="") as handle:
+        writer = csv.DictWriter(handle, fieldnames=bulk.FIELDS)
+        if first_chunk:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
+def finish_export(job):
+    path = export_path(job)
+    if not job.producer_ids:
+        with open(path, "w", encoding="utf-8", newline="") as handle:
+            csv.DictWriter(handle, fieldnames=bulk.FIELDS).writeheader()
+    with open(path, "rb") as handle:
+        job.result["file"] = get_export_storage().save(
+            f"produtores-tarefa-{job.pk}.csv", File(handle)
+        )
+    os.remove(path)
+
+
+# kind -> (chunk handler, optional finish hook). Handlers keep their own
+# transactions short: image and file work happens outside of them, so the
+# SQLite write lock is not held while it runs
+HANDLERS = {
+    Job.Kind.ACTIVATE: (lambda job, ids: set_active(job, ids, True), None),
+    Job.Kind.DEACTIVATE: (lambda job, ids: set_active(job, ids, False), None),
+    Job.Kind.REGENERATE_IMAGES: (regenerate_images, None),
+    Job.Kind.REINDEX: (reindex, None),
+    Job.Kind.EXPORT: (export, finish_export),
+    Job.Kind.GEOCODE: (geocode, None),
+}
+
+
+# Handlers that take database turns only around their queries and writes
+IO_BOUND = {Job.Kind.REGENERATE_IMAGES, Job.Kind.EXPORT}
+
+
+def enqueue(kind, producer_ids, user=None):
+    """Create a pending job for ``producer_ids``"""
+    producer_ids = [str(pk) for pk in producer_ids]
+    return Job.objects.create(
+        kind=kind,
+        producer_ids=producer_ids,
+        total=len(producer_ids),
+        created_by=user if user and user.is_authenticated else None,
+    )
+
+
+def claim(job_id):
+    """Mark a pending job as running; False if another worker took it"""
+    return bool(
+        Job.objects.filter(pk=job_id, status=Job.Status.PENDING).update(
+            status=Job.Status.RUNNING, started_at=timezone.now(), updated_at=timezone.now()
+        )
+    )
+
+
+def claim_next():
+    """Claim the oldest pending job, or return None"""
+    pending = Job.objects.filter(status=Job.Status.PENDING).order_by("created_at")
+    with database_turn():
+        for job_id in pending.values_list("pk", flat=True)[:10]:
+            if claim(job_id):
+                return Job.objects.get(pk=job_id)
+    return None
+
+
+def requeue_stale(older_than):
+    """Return running jobs with no progress since ``older_than`` (a dead worker) to the queue"""
+    return Job.objects.filter(status=Job.Status.RUNNING, updated_at__lt=older_than).update(
+        status=Job.Status.PENDING, processed=0, started_at=None, updated_at=timezone.now()
+    )
+
+
+def run_job(job):
+    """Process a claimed job chunk by chunk, recording progress"""
+    handler, finish = HANDLERS[job.kind]
+    chunk_size = get_chunk_size()
+    try:
+        for start in range(0, len(job.producer_ids), chunk_size):
+            ids = job.producer_ids[start : start + chunk_size]
+            if job.kind in IO_BOUND:
+                handler(job, ids)
+            else:
+                with database_turn():
+                    handler(job, ids)
+            job.processed += len(ids)
+            with database_turn():
+                job.save(update_fields=["processed", "result", "updated_at"])
+        if finish is not None:
+            finish(job)
+    except Exception as exc:
+        logger.exception("Job %s failed", job.pk)
+        job.status = Job.Status.FAILED
+        job.error = f"{type(exc).__name__}: {exc}"
+    else:
+        job.status = Job.Status.DONE
+    job.finished_at = timezone.now()
+    with database_turn():
+        job.save(update_fields=["status", "error", "result", "finished_at", "updated_at"])
+    return job
+
+
+def run_inline(job):
+    """Run a job in the current request, for small selections"""
+    if claim(job.pk):
+        job.refresh_from_db()
+        run_job(job)
+    return job
+
+
+def run_in_thread(job):
+    """Entry point for worker threads: own database connection per job"""
+    close_old_connections()
+    try:
+        return run_job(job)
+    finally:
+        connections.close_all()
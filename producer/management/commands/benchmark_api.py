@@ -0,0 +1,186 @@
+import json
+import time
+from itertools import count
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from producer.models import Category
+from producer.synthetic import generate_producers
+
+
+class Rollback(Exception):
+    pass
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the producer API through the full URL/middleware stack on synthetic "
+        "data: p50/p95 latency, queries per request and bytes per response for each "
+        "scenario. Results can be saved as a baseline and compared on later runs. "
+        "Synthetic rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--producers", type=int, default=2000)
+        parser.add_argument("--categories", type=int, default=8)
+        parser.add_argument("--images", type=int, default=3)
+        parser.add_argument("--requests", type=int, default=30, help="Requests per scenario")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--baseline",
+            default=str(Path(settings.BASE_DIR) / "benchmarks" / "api_baseline.json"),
+            help="Baseline file compared against when it exists",
+        )
+        parser.add_argument(
+            "--save-baseline", action="store_true", help="Store this run as the baseline"
+        )
+        parser.add_argument(
+            "--max-regression",
+            type=float,
+            default=25.0,
+            help="Fail when a p95 grows by more than this percentage over the baseline",
+        )
+        parser.add_argument(
+            "--warm-cache",
+            action="store_true",
+            help="Keep the response cache enabled (by default every request is a miss)",
+        )
+
+    def handle(self, *args, **options):
+        self.client = Client(HTTP_HOST="localhost")
+        self.repeat = options["requests"]
+        caches = settings.CACHES
+        if not options["warm_cache"]:
+            caches = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+        try:
+            with transaction.atomic(), override_settings(CACHES=caches):
+                ids = generate_producers(
+                    options["producers"],
+                    categories=options["categories"],
+                    images=options["images"],
+                    seed=options["seed"],
+                    prefix="Bench ",
+                )
+                self.results = self.run_scenarios(ids)
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.report(self.results)
+        baseline_path = Path(options["baseline"])
+        regressions = []
+        if baseline_path.exists() and not options["save_baseline"]:
+            baseline = json.loads(baseline_path.read_text())
+            regressions = self.compare(baseline, options["max_regression"])
+        if options["save_baseline"]:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(
+                json.dumps(
+                    {
+                        "producers": options["producers"],
+                        "requests": self.repeat,
+                        "scenarios": self.results,
+                    },
+                    indent=2,
+                )
+                + "\n"
+            )
+            self.stdout.write(f"Baseline guardada em {baseline_path}")
+        if regressions:
+            raise CommandError("Regressões de desempenho: " + ", ".join(regressions))
+
+    def scenarios(self, ids):
+        category = Category.objects.filter(slug__startswith="bench-").order_by("pk").first()
+        detail_ids = ids[: self.repeat] or ids
+        created = count()
+        return {
+            "list": lambda i: self.client.get("/api/producers/"),
+            "list_compact": lambda i: self.client.get("/api/producers/", {"view": "compact"}),
+            "list_cursor": lambda i: self.client.get("/api/producers/", {"pagination": "cursor"}),
+            "filter_category": lambda i: self.client.get(
+                "/api/producers/", {"category": category.slug}
+            ),
+            "filter_city": lambda i: self.client.get("/api/producers/", {"city": "braga"}),
+            "search": lambda i: self.client.get("/api/producers/", {"q": "queijo"}),
+            "near": lambda i: self.client.get(
+                "/api/producers/", {"near": "41.55,-8.42", "radius_km": 10}
+            ),
+            "detail": lambda i: self.client.get(
+                f"/api/producers/{detail_ids[i % len(detail_ids)]}/"
+            ),
+            "create": lambda i: self.client.post(
+                "/api/producers/",
+                data=json.dumps(
+                    {
+                        "name": f"Bench novo {next(created)}",
+                        "city": "Braga",
+                        "category_ids": [category.pk],
+                        "products": ["Mel de urze"],
+                    }
+                ),
+                content_type="application/json",
+            ),
+        }
+
+    def run_scenarios(self, ids):
+        results = {}
+        for name, request in self.scenarios(ids).items():
+            request(0)  # warm-up, not measured
+            timings, queries, sizes = [], [], []
+            for index in range(self.repeat):
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = request(index)
+                    timings.append((time.perf_counter() - start) * 1000)
+                if response.status_code >= 400:
+                    raise CommandError(f"{name}: HTTP {response.status_code}")
+                queries.append(len(captured))
+                sizes.append(len(response.content))
+            results[name] = {
+                "p50_ms": round(percentile(timings, 0.5), 3),
+                "p95_ms": round(percentile(timings, 0.95), 3),
+                "queries": max(queries),
+                "bytes": round(sum(sizes) / len(sizes)),
+            }
+        return results
+
+    def report(self, results):
+        self.stdout.write(
+            f"{'cenário':<16} {'p50 (ms)':>9} {'p95 (ms)':>9} {'queries':>8} {'bytes':>9}"
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<16} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+                f"{result['queries']:>8} {result['bytes']:>9}"
+            )
+
+    def compare(self, baseline, max_regression):
+        """Print the change against the baseline and return the regressed scenarios"""
+        regressions = []
+        self.stdout.write(f"\n{'vs. baseline':<16} {'p95':>9} {'queries':>8} {'bytes':>9}")
+        for name, result in self.results.items():
+            previous = baseline.get("scenarios", {}).get(name)
+            if previous is None:
+                continue
+            change = (result["p95_ms"] / previous["p95_ms"] - 1) * 100 if previous["p95_ms"] else 0
+            extra_queries = result["queries"] - previous["queries"]
+            self.stdout.write(
+                f"{name:<16} {change:>+8.1f}% {extra_queries:>+8} "
+                f"{result['bytes'] - previous['bytes']:>+9}"
+            )
+            if change > max_regression or extra_queries > 0:
+                regressions.append(name)
+        return regressions
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import AsyncClient
+from django.test.utils import override_settings
+
+from producer.synthetic import generate_producers
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare throughput of the sync ProducerViewSet and the async read views "
+        "under concurrent clients, through the ASGI handler. The response cache is "
+        "disabled so every request reaches the database. Synthetic rows are rolled "
+        "back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--producers", type=int, default=1000)
+        parser.add_argument("--concurrency", default="1,10,50")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per run")
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options["concurrency"].split(",")]
+        total = options["requests"]
+        try:
+            with transaction.atomic(), override_settings(
+                CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+                ALLOWED_HOSTS=["testserver"],
+            ):
+                ids = generate_producers(options["producers"], prefix="Bench ")
+                scenarios = {
+                    "list": ("/api/producers/", "/api/async/producers/"),
+                    "search": ("/api/producers/?q=queijo", "/api/async/producers/search/?q=queijo"),
+                    "detail": (f"/api/producers/{ids[0]}/", f"/api/async/producers/{ids[0]}/"),
+                }
+                self.stdout.write(
+                    f"{'cenário':<8} {'clientes':>8} {'sync (req/s)':>13} {'async (req/s)':>14}"
+                )
+                for name, (sync_path, async_path) in scenarios.items():
+                    for level in levels:
+                        sync_rate = async_to_sync(self.throughput)(sync_path, level, total)
+                        async_rate = async_to_sync(self.throughput)(async_path, level, total)
+                        self.stdout.write(
+                            f"{name:<8} {level:>8} {sync_rate:>13.1f} {async_rate:>14.1f}"
+                        )
+                raise Rollback
+        except Rollback:
+            pass
+
+    async def throughput(self, path, concurrency, total):
+        """Requests per second for ``total`` GETs with ``concurrency`` clients"""
+        client = AsyncClient()
+        await client.get(path)  # warm-up
+        remaining = iter(range(total))
+
+        async def worker():
+            for _ in remaining:
+                response = await client.get(path)
+                assert response.status_code == 200, (path, response.status_code)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return total / (time.perf_counter() - start)
@@ -0,0 +1,79 @@
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+
+from producer.models import Producer
+from producer.pagination import KeysetPagination
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the latency of a deep page with page-number and cursor pagination "
+        "as the producer table grows. Synthetic rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,5000,20000")
+        parser.add_argument("--page-size", type=int, default=50)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options["sizes"].split(",")]
+        self.page_size = options["page_size"]
+        self.repeat = options["repeat"]
+        self.client = Client(HTTP_HOST="localhost")
+
+        self.stdout.write(f"{'produtores':>10} {'página N (ms)':>14} {'cursor N (ms)':>14}")
+        try:
+            with transaction.atomic(), override_settings(
+                CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+            ):
+                total = 0
+                for size in sizes:
+                    self.create_producers(size - total)
+                    total = size
+                    page_ms = self.measure_page_number(size)
+                    cursor_ms = self.measure_cursor(size)
+                    self.stdout.write(f"{size:>10} {page_ms:>14.2f} {cursor_ms:>14.2f}")
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_producers(self, count):
+        Producer.objects.bulk_create(
+            [Producer(id=uuid.uuid4(), name=f"Bench {uuid.uuid4().hex}") for _ in range(count)],
+            batch_size=1000,
+        )
+
+    def timed_get(self, path, params):
+        timings = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            response = self.client.get(path, params)
+            timings.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.status_code
+        return statistics.median(timings), response
+
+    def measure_page_number(self, size):
+        last_page = max(size // self.page_size, 1)
+        ms, _ = self.timed_get("/api/producers/", {"page": last_page, "page_size": self.page_size})
+        return ms
+
+    def measure_cursor(self, size):
+        # Build a cursor pointing at the same depth as the last numbered page
+        skip = max(size - self.page_size, 0)
+        last = Producer.objects.order_by("name", "id")[skip - 1] if skip else None
+        params = {"pagination": "cursor", "page_size": self.page_size}
+        if last is not None:
+            params["cursor"] = KeysetPagination().encode_cursor(last)
+        ms, _ = self.timed_get("/api/producers/", params)
+        return ms
@@ -0,0 +1,79 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory
+
+from producer.models import Category, Producer, ProducerImage
+from producer.serializers import ProducerReadSerializer, ProducerSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure per-object serialization cost of ProducerSerializer and the "
+        "ProducerReadSerializer fast path. Synthetic rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--producers", type=int, default=100)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options["producers"], options["repeat"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, count, repeat):
+        categories = [
+            Category.objects.create(name=f"Bench categoria {i}", slug=f"bench-categoria-{i}")
+            for i in range(3)
+        ]
+        producers = Producer.objects.bulk_create(
+            [
+                Producer(
+                    name=f"Bench {i:05d}",
+                    description="Produtor de teste",
+                    city="Braga",
+                    street="Rua Direita",
+                    number=str(i),
+                    main_image=f"producers/{i}.jpg",
+                    products=["Queijo", "Mel"],
+                )
+                for i in range(count)
+            ]
+        )
+        Producer.categories.through.objects.bulk_create(
+            [
+                Producer.categories.through(producer_id=p.pk, category_id=c.pk)
+                for p in producers
+                for c in categories[:2]
+            ]
+        )
+        ProducerImage.objects.bulk_create(
+            [
+                ProducerImage(producer=p, image=f"producers/gallery/{p.pk}-{o}.jpg", order=o)
+                for p in producers
+                for o in range(3)
+            ]
+        )
+
+        queryset = Producer.objects.filter(pk__in=[p.pk for p in producers])
+        instances = list(queryset.prefetch_related("categories", "gallery_images"))
+        context = {"request": APIRequestFactory().get("/api/producers/", HTTP_HOST="localhost")}
+
+        self.stdout.write(f"{'serializer':<24} {'µs/objeto':>10}")
+        for serializer_class in (ProducerSerializer, ProducerReadSerializer):
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                serializer_class(instances, many=True, context=context).data
+                best = min(best, time.perf_counter() - start)
+            per_object = best / len(instances) * 1_000_000
+            self.stdout.write(f"{serializer_class.__name__:<24} {per_object:>10.1f}")
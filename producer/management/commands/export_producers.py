@@ -0,0 +1,29 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from producer import bulk
+from producer.models import Producer
+
+
+class Command(BaseCommand):
+    help = "Export producers as CSV or NDJSON without loading the table in memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=bulk.FORMATS, default="csv", dest="file_format")
+        parser.add_argument("--output", help="File path (defaults to stdout)")
+        parser.add_argument("--active", action="store_true", help="Only active producers")
+
+    def handle(self, *args, **options):
+        queryset = Producer.objects.order_by("name", "id")
+        if options["active"]:
+            queryset = queryset.filter(is_active=True)
+
+        output = options["output"]
+        stream = open(output, "w", encoding="utf-8", newline="") if output else sys.stdout
+        try:
+            for chunk in bulk.iter_export(queryset, options["file_format"]):
+                stream.write(chunk)
+        finally:
+            if output:
+                stream.close()
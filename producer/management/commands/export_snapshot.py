@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from producer import snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the active producers (list, per-category and per-city lists, details) "
+        "into a versioned directory of precompressed JSON files for a static file "
+        "server. Only files affected by changes since the last run are rendered again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--root", help="Snapshot directory (defaults to SNAPSHOT_ROOT)")
+        parser.add_argument(
+            "--base-url",
+            default=getattr(settings, "SNAPSHOT_BASE_URL", ""),
+            help="Prefix for image URLs, e.g. https://api.example.pt",
+        )
+        parser.add_argument("--page-size", type=int, help="Producers per list page")
+        parser.add_argument("--keep", type=int, default=3, help="Versions to keep")
+        parser.add_argument("--full", action="store_true", help="Render every file again")
+
+    def handle(self, *args, **options):
+        summary = snapshot.build_snapshot(
+            root=options["root"],
+            full=options["full"],
+            base_url=options["base_url"],
+            page_size=options["page_size"],
+            keep=options["keep"],
+        )
+        if not summary["changes"] and not summary["full"]:
+            self.stdout.write(f"Sem alterações; versão atual {summary['version']}.")
+            return
+        kind = "completa" if summary["full"] else f"{summary['changes']} produtores alterados"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Versão {summary['version']} ({kind}): {summary['written']} ficheiros "
+                f"escritos, {summary['removed']} removidos."
+            )
+        )
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from producer import images
+from producer.models import Producer, ProducerImage
+
+
+class Command(BaseCommand):
+    help = "Generate missing resized JPEG/WebP derivatives for producer and gallery images"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force", action="store_true", help="Regenerate derivatives that already exist"
+        )
+
+    def handle(self, *args, **options):
+        force = options["force"]
+        generated = 0
+        for model, file_field in ((Producer, "main_image"), (ProducerImage, "image")):
+            rows = (
+                model.objects.exclude(**{file_field: ""})
+                .exclude(**{f"{file_field}__isnull": True})
+                .values_list("pk", file_field, "derivatives")
+            )
+            for pk, name, derivatives in rows.iterator():
+                if not force and derivatives.get("source") == name:
+                    continue
+                try:
+                    generated += images.refresh_derivatives(model, pk, force=True)
+                except (OSError, ValueError) as exc:
+                    self.stderr.write(f"{model.__name__} {pk}: {exc}")
+        self.stdout.write(self.style.SUCCESS(f"{generated} imagens processadas."))
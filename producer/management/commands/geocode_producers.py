@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from producer import cache, geocoding
+from producer.models import Place, Producer
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill missing producer coordinates from the postal code or city, using "
+        "the gazetteer loaded with load_gazetteer"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--refresh",
+            action="store_true",
+            help="Also recompute coordinates previously taken from the gazetteer",
+        )
+        parser.add_argument("--batch-size", type=int, default=geocoding.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if not Place.objects.exists():
+            self.stdout.write(self.style.WARNING("Índice geográfico vazio: corra load_gazetteer."))
+            return
+        summary = geocoding.geocode_producers(
+            Producer.objects.all(), refresh=options["refresh"], batch_size=options["batch_size"]
+        )
+        if summary["geocoded"]:
+            cache.bump_generation()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{summary['geocoded']} produtores localizados, "
+                f"{summary['unresolved']} sem correspondência."
+            )
+        )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from producer import bulk
+
+
+class Command(BaseCommand):
+    help = "Import producers from a CSV or NDJSON file, in chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=bulk.FORMATS, dest="file_format")
+        parser.add_argument("--chunk-size", type=int, default=bulk.DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["file_format"] or bulk.detect_format(path)
+        try:
+            with open(path, encoding="utf-8-sig", newline="") as stream:
+                summary = bulk.import_producers(stream, file_format, options["chunk_size"])
+        except OSError as exc:
+            raise CommandError(exc)
+
+        for error in summary["errors"]:
+            self.stderr.write(f"Linha {error['line']}: {error['errors']}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{summary['created']} criados, {summary['updated']} atualizados, "
+                f"{len(summary['errors'])} linhas com erros."
+            )
+        )
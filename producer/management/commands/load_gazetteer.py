@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from producer import geocoding
+
+
+class Command(BaseCommand):
+    help = (
+        "Load a gazetteer CSV (postal_code, city, district, latitude, longitude) "
+        "into the geocoding table, replacing the previous one"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["path"], encoding="utf-8-sig", newline="") as stream:
+                summary = geocoding.load_gazetteer(stream)
+        except OSError as exc:
+            raise CommandError(exc)
+
+        for error in summary["errors"]:
+            self.stderr.write(f"Linha {error['line']}: {error['errors']}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{summary['postal_code']} códigos postais, {summary['postal_area']} zonas "
+                f"postais, {summary['city']} localidades, "
+                f"{len(summary['errors'])} linhas com erros."
+            )
+        )
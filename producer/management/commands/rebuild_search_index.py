@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from producer import search
+from producer.models import Producer
+
+
+class Command(BaseCommand):
+    help = "Rebuild the producer full-text search index"
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write(self.style.WARNING("Search index not supported on this database."))
+            return
+        count = search.rebuild_index(Producer.objects.all())
+        self.stdout.write(self.style.SUCCESS(f"{count} produtores indexados."))
@@ -0,0 +1,59 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from producer import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs (admin bulk actions) on a thread pool. "
+        "Polls for new jobs until interrupted, or exits when idle with --once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds")
+        parser.add_argument(
+            "--once", action="store_true", help="Exit when there are no pending jobs"
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=int,
+            default=30,
+            help="Minutes without progress after which a running job is assumed dead and requeued",
+        )
+
+    def handle(self, *args, **options):
+        requeued = jobs.requeue_stale(timezone.now() - timedelta(minutes=options["stale_after"]))
+        if requeued:
+            self.stdout.write(f"{requeued} tarefas interrompidas voltaram à fila.")
+
+        running = set()
+        with ThreadPoolExecutor(
+            max_workers=options["workers"], thread_name_prefix="producer-jobs"
+        ) as executor:
+            try:
+                while True:
+                    while len(running) < options["workers"]:
+                        job = jobs.claim_next()
+                        if job is None:
+                            break
+                        self.stdout.write(f"A executar {job} ({job.total} produtores)")
+                        running.add(executor.submit(jobs.run_in_thread, job))
+                    if not running:
+                        if options["once"]:
+                            break
+                        time.sleep(options["poll_interval"])
+                        continue
+                    done, running = wait(
+                        running, timeout=options["poll_interval"], return_when=FIRST_COMPLETED
+                    )
+                    for future in done:
+                        job = future.result()
+                        self.stdout.write(f"{job}: {job.get_status_display()}")
+            except KeyboardInterrupt:
+                self.stdout.write("A terminar as tarefas em curso...")
@@ -0,0 +1,85 @@
+"""Clustered map markers built from the precomputed producer grid."""
+
+from collections import defaultdict
+
+from django.db.models import Avg, Count, F
+
+from .geo import cell_divisor, grid_cell
+from .models import Producer
+
+# Zoom level from which producers are returned as individual points
+POINTS_MIN_ZOOM = 14
+# Above this many producers in the viewport, points are clustered anyway
+MAX_POINTS = 500
+# Cells in the viewport; wider viewports than the zoom implies get coarser cells
+MAX_CLUSTERS = 1024
+
+
+def viewport_divisor(bbox, zoom):
+    """``cell_divisor(zoom)``, doubled until ``bbox`` spans at most
+    ``MAX_CLUSTERS`` cells"""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    left, top = grid_cell(max_lat, min_lon)
+    right, bottom = grid_cell(min_lat, max_lon)
+    divisor = cell_divisor(zoom)
+    while (abs(right // divisor - left // divisor) + 1) * (
+        abs(bottom // divisor - top // divisor) + 1
+    ) > MAX_CLUSTERS:
+        divisor *= 2
+    return divisor
+
+
+def map_markers(queryset, bbox, zoom):
+    """Return clusters or individual points for producers inside ``bbox``.
+
+    ``bbox`` is ``(min_lon, min_lat, max_lon, max_lat)``. Clusters are grouped
+    in SQL by grid cell, so the payload is bounded by the number of cells in
+    the viewport rather than by the number of producers; cells are made
+    coarser when the viewport is wider than ``zoom`` implies, so there are
+    never more than ``MAX_CLUSTERS``.
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    queryset = queryset.filter(
+        latitude__range=(min_lat, max_lat),
+        longitude__range=(min_lon, max_lon),
+    )
+
+    if zoom >= POINTS_MIN_ZOOM:
+        points = list(
+            queryset.order_by("name", "id").values("id", "name", "latitude", "longitude")[
+                : MAX_POINTS + 1
+            ]
+        )
+        if len(points) <= MAX_POINTS:
+            return {"zoom": zoom, "clusters": [], "points": with_category_slugs(points)}
+
+    divisor = viewport_divisor(bbox, zoom)
+    cells = (
+        queryset.exclude(grid_x=None)
+        .annotate(cell_x=F("grid_x") / divisor, cell_y=F("grid_y") / divisor)
+        .values("cell_x", "cell_y")
+        .annotate(count=Count("id"), latitude=Avg("latitude"), longitude=Avg("longitude"))
+        .order_by("cell_x", "cell_y")
+    )
+    clusters = [
+        {
+            "count": cell["count"],
+            "latitude": cell["latitude"],
+            "longitude": cell["longitude"],
+        }
+        for cell in cells
+    ]
+    return {"zoom": zoom, "clusters": clusters, "points": []}
+
+
+def with_category_slugs(points):
+    """Attach category slugs to point dicts with a single query"""
+    slugs = defaultdict(list)
+    through = Producer.categories.through.objects.filter(
+        producer_id__in=[point["id"] for point in points]
+    ).order_by("category__name")
+    for producer_id, slug in through.values_list("producer_id", "category__slug"):
+        slugs[producer_id].append(slug)
+    for point in points:
+        point["categories"] = slugs[point["id"]]
+    return points
@@ -0,0 +1,268 @@
+"""Opt-in request profiling with Prometheus-style metrics.
+
+``ProfilingMiddleware`` records, per route and method, the wall time, number
+of SQL queries and time spent in the database, time spent in serializers and
+the response size. Aggregates are kept in memory per process and exposed in
+the Prometheus text format by ``metrics_view`` (``/api/_metrics``). The
+slowest requests are kept with their SQL and logged.
+
+Enable it with ``API_PROFILING`` (see ``core/settings.py``), which adds
+``"producer.metrics.ProfilingMiddleware"`` to ``MIDDLEWARE`` and mounts the
+metrics view. Only staff users, or scrapers sending
+``Authorization: Bearer <PROFILING_METRICS_TOKEN>``, can read the metrics.
+
+Queries are recorded by an execute wrapper installed on every connection,
+which reads the current request from a context variable, so requests handled
+by async views (whose ORM calls run in worker threads) are profiled too.
+"""
+
+import heapq
+import hmac
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_current = ContextVar("producer_request_profile", default=None)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = []
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+
+
+@contextmanager
+def timed_serialization():
+    """Add the time spent in the block to the current request's serializer time"""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.serializer_time += time.perf_counter() - start
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+
+class MetricsRegistry:
+    histograms = {
+        "api_request_duration_seconds": ("Request wall time", DURATION_BUCKETS),
+        "api_request_db_queries": ("SQL queries per request", QUERY_BUCKETS),
+        "api_request_db_duration_seconds": ("Time spent in SQL per request", DURATION_BUCKETS),
+        "api_request_serializer_duration_seconds": (
+            "Time spent in serializers per request",
+            DURATION_BUCKETS,
+        ),
+        "api_response_size_bytes": ("Response body size", SIZE_BUCKETS),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.series = {}
+            self.requests = {}
+            self.slowest = []
+
+    def record(self, labels, status, duration, profile, size):
+        values = {
+            "api_request_duration_seconds": duration,
+            "api_request_db_queries": len(profile.queries),
+            "api_request_db_duration_seconds": profile.db_time,
+            "api_request_serializer_duration_seconds": profile.serializer_time,
+            "api_response_size_bytes": size,
+        }
+        with self.lock:
+            for name, value in values.items():
+                if value is None:
+                    continue
+                key = (name, labels)
+                if key not in self.series:
+                    self.series[key] = Histogram(self.histograms[name][1])
+                self.series[key].observe(value)
+            counter = labels + (("status", str(status)),)
+            self.requests[counter] = self.requests.get(counter, 0) + 1
+            return self._keep_if_slow(labels, duration, profile)
+
+    def _keep_if_slow(self, labels, duration, profile):
+        """Keep the N slowest requests; returns True if this one was kept"""
+        limit = getattr(settings, "PROFILING_SLOWEST_REQUESTS", 10)
+        entry = (duration, time.time(), dict(labels), [q["sql"] for q in profile.queries])
+        if len(self.slowest) < limit:
+            heapq.heappush(self.slowest, entry)
+            return True
+        if limit and duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+            return True
+        return False
+
+    def slowest_requests(self):
+        with self.lock:
+            entries = sorted(self.slowest, reverse=True)
+        return [
+            {"duration_ms": round(duration * 1000, 2), "at": at, **labels, "queries": queries}
+            for duration, at, labels, queries in entries
+        ]
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            lines.append("# HELP api_requests_total Requests handled")
+            lines.append("# TYPE api_requests_total counter")
+            for labels, count in sorted(self.requests.items()):
+                lines.append(f"api_requests_total{_labels(labels)} {count}")
+            for name, (help_text, _buckets) in self.histograms.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for (series_name, labels), histogram in sorted(self.series.items()):
+                    if series_name != name:
+                        continue
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        le = labels + (("le", _number(bound)),)
+                        lines.append(f"{name}_bucket{_labels(le)} {count}")
+                    inf = labels + (("le", "+Inf"),)
+                    lines.append(f"{name}_bucket{_labels(inf)} {histogram.count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {_number(histogram.sum)}")
+                    lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(pairs):
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in pairs
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+registry = MetricsRegistry()
+
+
+def record_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        profile.db_time += elapsed
+        profile.queries.append({"sql": sql, "ms": elapsed * 1000})
+
+
+def install_query_recorder(sender=None, connection=None, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        # First, so execute_wrapper() blocks still pop their own wrapper
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        connection_created.connect(install_query_recorder, dispatch_uid="producer-metrics")
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection=connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        profile = RequestProfile()
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, profile, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        profile = RequestProfile()
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, profile, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, profile, duration):
+        match = getattr(request, "resolver_match", None)
+        route = match.view_name if match and match.view_name else "unmatched"
+        labels = (("method", request.method), ("route", route))
+        size = None if response.streaming else len(response.content)
+        kept = registry.record(labels, response.status_code, duration, profile, size)
+
+        threshold = getattr(settings, "PROFILING_SLOW_REQUEST_MS", 500)
+        if kept and duration * 1000 >= threshold:
+            logger.warning(
+                "Slow request %s %s: %.1f ms, %d queries (%.1f ms in DB)\n%s",
+                request.method,
+                request.get_full_path(),
+                duration * 1000,
+                len(profile.queries),
+                profile.db_time * 1000,
+                "\n".join(f"  {q['ms']:.2f} ms  {q['sql']}" for q in profile.queries),
+            )
+
+
+def can_read_metrics(request):
+    user = getattr(request, "user", None)
+    if user is not None and user.is_active and user.is_staff:
+        return True
+    token = getattr(settings, "PROFILING_METRICS_TOKEN", "")
+    given = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    return bool(token) and hmac.compare_digest(given.encode(), token.encode())
+
+
+def metrics_view(request):
+    """Aggregated request metrics in the Prometheus text format"""
+    if not can_read_metrics(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
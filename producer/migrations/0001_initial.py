@@ -0,0 +1,83 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:07
+
+import django.core.validators
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Producer',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(help_text='Nome do produtor', max_length=255, verbose_name='Nome')),
+                ('description', models.TextField(blank=True, help_text='Descrição do produtor e seus produtos', verbose_name='Descrição')),
+                ('phone', models.CharField(blank=True, max_length=20, null=True, validators=[django.core.validators.RegexValidator(message="Número de telefone deve estar no formato: '+351912345678' ou '912345678'", regex='^\\+?351?\\d{9}$')], verbose_name='Telefone')),
+                ('mobile_phone', models.CharField(blank=True, max_length=20, null=True, validators=[django.core.validators.RegexValidator(message="Número de telefone deve estar no formato: '+351912345678' ou '912345678'", regex='^\\+?351?\\d{9}$')], verbose_name='Telemóvel')),
+                ('email', models.EmailField(blank=True, max_length=255, null=True, validators=[django.core.validators.RegexValidator(message='Email inválido', regex='^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\\.[a-zA-Z0-9-.]+$')], verbose_name='Email')),
+                ('website', models.URLField(blank=True, max_length=255, null=True, verbose_name='Site internet')),
+                ('street', models.CharField(blank=True, max_length=200, null=True, verbose_name='Rua')),
+                ('number', models.CharField(blank=True, max_length=20, null=True, verbose_name='Número')),
+                ('city', models.CharField(blank=True, default='', max_length=100, verbose_name='Cidade')),
+                ('state', models.CharField(blank=True, default='', max_length=50, verbose_name='Distrito')),
+                ('zip_code', models.CharField(blank=True, help_text='Formato: 1234-123', max_length=10, null=True, verbose_name='Código Postal')),
+                ('latitude', models.FloatField(blank=True, null=True, verbose_name='Latitude')),
+                ('longitude', models.FloatField(blank=True, null=True, verbose_name='Longitude')),
+                ('facebook', models.URLField(blank=True, max_length=255, null=True, verbose_name='Facebook')),
+                ('instagram', models.URLField(blank=True, max_length=255, null=True, verbose_name='Instagram')),
+                ('twitter', models.URLField(blank=True, max_length=255, null=True, verbose_name='Twitter')),
+                ('youtube', models.URLField(blank=True, max_length=255, null=True, verbose_name='YouTube')),
+                ('tiktok', models.URLField(blank=True, max_length=255, null=True, verbose_name='TikTok')),
+                ('main_image', models.ImageField(blank=True, null=True, upload_to='producers/', verbose_name='Imagem principal')),
+                ('products', models.JSONField(blank=True, default=list, help_text='Array de produtos: ["Queijo de Cabra", "Requeijão"]', null=True, verbose_name='Produtos')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Ativo')),
+            ],
+            options={
+                'verbose_name': 'Produtor',
+                'verbose_name_plural': 'Produtores',
+                'ordering': ['name'],
+                'indexes': [models.Index(fields=['name'], name='producer_pr_name_80500b_idx'), models.Index(fields=['city'], name='producer_pr_city_e79cf6_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Categoria')),
+                ('slug', models.SlugField(max_length=100, unique=True, verbose_name='Slug')),
+                ('producer', models.ManyToManyField(blank=True, related_name='categories', to='producer.producer', verbose_name='Produtores')),
+            ],
+            options={
+                'verbose_name': 'Categoria de filtro',
+                'verbose_name_plural': 'Categorias de filtro',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProducerImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(upload_to='producers/gallery/', verbose_name='Imagem')),
+                ('caption', models.CharField(blank=True, max_length=200, null=True, verbose_name='Legenda')),
+                ('order', models.PositiveIntegerField(default=0, verbose_name='Ordem')),
+                ('uploaded_at', models.DateTimeField(auto_now_add=True)),
+                ('producer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gallery_images', to='producer.producer', verbose_name='Produtor')),
+            ],
+            options={
+                'verbose_name': 'Imagem da galeria',
+                'verbose_name_plural': 'Imagens da galeria',
+                'ordering': ['order', 'uploaded_at'],
+                'indexes': [models.Index(fields=['producer', 'order'], name='producer_pr_produce_f3ab6b_idx')],
+            },
+        ),
+    ]
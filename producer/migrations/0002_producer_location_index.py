@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producer', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='producer',
+            index=models.Index(fields=['latitude', 'longitude'], name='producer_pr_latitud_bd2e20_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:09
+
+from django.db import migrations, models
+
+from producer.geo import grid_cell
+
+
+def fill_grid_cells(apps, schema_editor):
+    Producer = apps.get_model("producer", "Producer")
+    producers = Producer.objects.exclude(latitude=None).exclude(longitude=None)
+    batch = []
+    for producer in producers.only("id", "latitude", "longitude").iterator():
+        producer.grid_x, producer.grid_y = grid_cell(producer.latitude, producer.longitude)
+        batch.append(producer)
+    Producer.objects.bulk_update(batch, ["grid_x", "grid_y"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producer', '0002_producer_location_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producer',
+            name='grid_x',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='producer',
+            name='grid_y',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_grid_cells, migrations.RunPython.noop),
+    ]
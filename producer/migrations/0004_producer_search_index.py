@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from producer import search
+
+
+def create_search_index(apps, schema_editor):
+    search.create_index(schema_editor)
+    Producer = apps.get_model("producer", "Producer")
+    search.rebuild_index(Producer.objects.all(), schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    search.drop_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producer', '0003_producer_map_grid'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from producer.catalogue import sync_catalogue
+
+
+def fill_catalogue(apps, schema_editor):
+    Producer = apps.get_model("producer", "Producer")
+    Product = apps.get_model("producer", "Product")
+    ProducerProduct = apps.get_model("producer", "ProducerProduct")
+    batch = []
+    for producer in Producer.objects.only("id", "products").iterator(chunk_size=500):
+        batch.append(producer)
+        if len(batch) == 500:
+            sync_catalogue(batch, Product, ProducerProduct)
+            batch = []
+    sync_catalogue(batch, Product, ProducerProduct)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producer', '0004_producer_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProducerProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order', models.PositiveIntegerField(default=0, verbose_name='Ordem')),
+                ('producer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='producer.producer')),
+            ],
+            options={
+                'ordering': ['order'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Produto')),
+                ('slug', models.SlugField(max_length=200, unique=True, verbose_name='Slug')),
+                ('producers', models.ManyToManyField(blank=True, related_name='catalogue', through='producer.ProducerProduct', to='producer.producer', verbose_name='Produtores')),
+            ],
+            options={
+                'verbose_name': 'Produto',
+                'verbose_name_plural': 'Produtos',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='producerproduct',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='producer.product'),
+        ),
+        migrations.AddConstraint(
+            model_name='producerproduct',
+            constraint=models.UniqueConstraint(fields=('product', 'producer'), name='unique_producer_product'),
+        ),
+        migrations.RunPython(fill_catalogue, migrations.RunPython.noop),
+    ]
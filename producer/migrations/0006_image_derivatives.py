@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producer', '0005_product_catalogue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producer',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Derivados da imagem principal'),
+        ),
+        migrations.AddField(
+            model_name='producerimage',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Derivados da imagem'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:24
+
+from django.db import migrations, models
+
+from producer.search import normalize
+
+
+def fill_city_keys(apps, schema_editor):
+    Producer = apps.get_model("producer", "Producer")
+    batch = []
+    for producer in Producer.objects.only("id", "city").iterator(chunk_size=500):
+        producer.city_key = normalize(producer.city).strip()
+        batch.append(producer)
+    Producer.objects.bulk_update(batch, ["city_key"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producer', '0006_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producer',
+            name='city_key',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Cidade normalizada (minúsculas, sem acentos) para filtros', max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='producer',
+            index=models.Index(fields=['city_key', 'name'], name='producer_city_key_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producer',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['name'], name='producer_active_name_idx'),
+        ),
+        migrations.RunPython(fill_city_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producer', '0007_producer_filter_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('activate', 'Ativar produtores'), ('deactivate', 'Desativar produtores'), ('regenerate_images', 'Regenerar imagens'), ('reindex', 'Reindexar pesquisa'), ('export', 'Exportar seleção')], max_length=32, verbose_name='Tipo')),
+                ('status', models.CharField(choices=[('pending', 'Em espera'), ('running', 'Em curso'), ('done', 'Concluída'), ('failed', 'Falhou')], default='pending', max_length=16, verbose_name='Estado')),
+                ('producer_ids', models.JSONField(default=list, verbose_name='Produtores')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Total')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Processados')),
+                ('result', models.JSONField(blank=True, default=dict, verbose_name='Resultado')),
+                ('error', models.TextField(blank=True, verbose_name='Erro')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criada em')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Iniciada em')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Terminada em')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Criada por')),
+            ],
+            options={
+                'verbose_name': 'Tarefa',
+                'verbose_name_plural': 'Tarefas',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='producer_jo_status_f109e2_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producer', '0008_background_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producer',
+            name='geocode_source',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Entrada do índice geográfico usada; vazio se introduzidas à mão', max_length=40, verbose_name='Origem das coordenadas'),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='kind',
+            field=models.CharField(choices=[('activate', 'Ativar produtores'), ('deactivate', 'Desativar produtores'), ('regenerate_images', 'Regenerar imagens'), ('reindex', 'Reindexar pesquisa'), ('export', 'Exportar seleção'), ('geocode', 'Recalcular coordenadas')], max_length=32, verbose_name='Tipo'),
+        ),
+        migrations.CreateModel(
+            name='Place',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('postal_code', 'Código postal'), ('postal_area', 'Zona postal'), ('city', 'Localidade')], max_length=16, verbose_name='Tipo')),
+                ('key', models.CharField(help_text='Código postal (1234-123), zona postal (1234) ou cidade normalizada', max_length=100, verbose_name='Chave')),
+                ('name', models.CharField(blank=True, max_length=100, verbose_name='Nome')),
+                ('district', models.CharField(blank=True, max_length=50, verbose_name='Distrito')),
+                ('latitude', models.FloatField(verbose_name='Latitude')),
+                ('longitude', models.FloatField(verbose_name='Longitude')),
+            ],
+            options={
+                'verbose_name': 'Local',
+                'verbose_name_plural': 'Locais',
+                'constraints': [models.UniqueConstraint(fields=('kind', 'key'), name='producer_place_kind_key_uniq')],
+            },
+        ),
+    ]
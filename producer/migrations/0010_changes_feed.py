@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producer', '0009_offline_geocoding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedProducer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('producer_id', models.UUIDField(unique=True, verbose_name='Produtor')),
+                ('deleted_at', models.DateTimeField(verbose_name='Eliminado em')),
+            ],
+            options={
+                'verbose_name': 'Produtor eliminado',
+                'verbose_name_plural': 'Produtores eliminados',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='producer',
+            index=models.Index(fields=['updated_at', 'id'], name='producer_updated_at_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deletedproducer',
+            index=models.Index(fields=['deleted_at', 'producer_id'], name='producer_deleted_at_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producer', '0010_changes_feed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Atualizada em'),
+        ),
+    ]
@@ -1,7 +1,12 @@
 import uuid
+from django.conf import settings
 from django.db import models
 from django.core.validators import RegexValidator
 
+from . import geocoding
+from .geo import grid_cell
+from .search import normalize
+
 
 phone_regex = RegexValidator(
     regex=r"^\+?351?\d{9}$",
@@ -69,6 +74,13 @@ class Producer(models.Model):
         default="",
         blank=True,
     )
+    city_key = models.CharField(
+        max_length=100,
+        default="",
+        blank=True,
+        editable=False,
+        help_text="Cidade normalizada (minúsculas, sem acentos) para filtros",
+    )
     state = models.CharField(
         max_length=50,
         verbose_name="Distrito",
@@ -84,6 +96,16 @@ class Producer(models.Model):
     )
     latitude = models.FloatField(null=True, blank=True, verbose_name="Latitude")
     longitude = models.FloatField(null=True, blank=True, verbose_name="Longitude")
+    geocode_source = models.CharField(
+        max_length=40,
+        default="",
+        blank=True,
+        editable=False,
+        verbose_name="Origem das coordenadas",
+        help_text="Entrada do índice geográfico usada; vazio se introduzidas à mão",
+    )
+    grid_x = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    grid_y = models.PositiveIntegerField(null=True, blank=True, editable=False)
     facebook = models.URLField(
         verbose_name="Facebook",
         max_length=255,
@@ -117,6 +139,9 @@ class Producer(models.Model):
     main_image = models.ImageField(
         upload_to="producers/", verbose_name="Imagem principal", blank=True, null=True
     )
+    derivatives = models.JSONField(
+        verbose_name="Derivados da imagem principal", default=dict, blank=True, editable=False
+    )
     products = models.JSONField(
         verbose_name="Produtos",
         help_text='Array de produtos: ["Queijo de Cabra", "Requeijão"]',
@@ -135,11 +160,107 @@ class Producer(models.Model):
         indexes = [
             models.Index(fields=["name"]),
             models.Index(fields=["city"]),
+            models.Index(fields=["latitude", "longitude"]),
+            # Match the list filters, which are ordered by name
+            models.Index(fields=["city_key", "name"], name="producer_city_key_name_idx"),
+            # Keyset order of the changes feed
+            models.Index(fields=["updated_at", "id"], name="producer_updated_at_id_idx"),
+            # The public directory lists active producers only
+            models.Index(
+                fields=["name"],
+                condition=models.Q(is_active=True),
+                name="producer_active_name_idx",
+            ),
         ]
 
     def __str__(self):
         return self.name
 
+    # Columns computed from other fields: source fields -> derived fields
+    DERIVED_FIELDS = {
+        "latitude": {"geocode_source", "grid_x", "grid_y"},
+        "longitude": {"geocode_source", "grid_x", "grid_y"},
+        "city": {"city_key", *geocoding.GEOCODED_FIELDS, "grid_x", "grid_y"},
+        "zip_code": {*geocoding.GEOCODED_FIELDS, "grid_x", "grid_y"},
+    }
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._geocoded_point = instance.geocoded_point()
+        return instance
+
+    def geocoded_point(self):
+        """``(latitude, longitude)`` as set from the gazetteer, or None"""
+        if not self.__dict__.get("geocode_source"):
+            return None
+        return self.__dict__.get("latitude"), self.__dict__.get("longitude")
+
+    def detect_manual_coordinates(self):
+        """Coordinates changed from the gazetteer ones count as entered by hand"""
+        geocoded = getattr(self, "_geocoded_point", None)
+        if geocoded is not None and self.geocoded_point() not in (None, geocoded):
+            self.geocode_source = ""
+
+    def update_coordinates(self):
+        """Fill the coordinates from the gazetteer, unless entered by hand.
+
+        Gazetteer coordinates of an address that no longer resolves are
+        cleared, rather than left pointing at the old address.
+        """
+        self.detect_manual_coordinates()
+        if self.latitude is not None and self.longitude is not None and not self.geocode_source:
+            return
+        match = geocoding.lookup(self.zip_code, self.city)
+        if match is not None:
+            self.latitude, self.longitude, self.geocode_source = match
+        elif self.geocode_source:
+            self.latitude = self.longitude = None
+            self.geocode_source = ""
+        self._geocoded_point = self.geocoded_point()
+
+    def update_derived_fields(self):
+        """Recompute the map grid cell and the normalized city key"""
+        self.grid_x, self.grid_y = grid_cell(self.latitude, self.longitude)
+        self.city_key = normalize(self.city).strip()
+
+    @classmethod
+    def with_derived_fields(cls, fields):
+        """``fields`` plus the derived columns that depend on them"""
+        fields = set(fields)
+        for name in list(fields):
+            fields |= cls.DERIVED_FIELDS.get(name, set())
+        return fields
+
+    def save(self, *args, **kwargs):
+        """Keep the derived columns in sync with their source fields"""
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or {"zip_code", "city"} & set(update_fields):
+            self.update_coordinates()
+        else:
+            self.detect_manual_coordinates()
+        self.update_derived_fields()
+        if update_fields is not None:
+            kwargs["update_fields"] = self.with_derived_fields(update_fields)
+        super().save(*args, **kwargs)
+
+
+class DeletedProducer(models.Model):
+    """Tombstone of a deleted producer, reported by the changes feed"""
+
+    producer_id = models.UUIDField(unique=True, verbose_name="Produtor")
+    deleted_at = models.DateTimeField(verbose_name="Eliminado em")
+
+    class Meta:
+        verbose_name = "Produtor eliminado"
+        verbose_name_plural = "Produtores eliminados"
+        indexes = [
+            models.Index(fields=["deleted_at", "producer_id"], name="producer_deleted_at_idx"),
+        ]
+
+    def __str__(self):
+        return str(self.producer_id)
+
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True, verbose_name="Categoria")
@@ -171,6 +292,9 @@ class ProducerImage(models.Model):
         null=True,
     )
     order = models.PositiveIntegerField(default=0, verbose_name="Ordem")
+    derivatives = models.JSONField(
+        verbose_name="Derivados da imagem", default=dict, blank=True, editable=False
+    )
     uploaded_at = models.DateTimeField(auto_now_add=True)
     producer = models.ForeignKey(
         Producer,
@@ -188,4 +312,133 @@ class ProducerImage(models.Model):
         ]
 
     def __str__(self):
-        return f"Imagem de {self.producer.name}"
\ No newline at end of file
+        return f"Imagem de {self.producer.name}"
+
+
+class Product(models.Model):
+    """Normalized product catalogue, derived from ``Producer.products``"""
+
+    name = models.CharField(max_length=200, verbose_name="Produto")
+    slug = models.SlugField(max_length=200, unique=True, verbose_name="Slug")
+    producers = models.ManyToManyField(
+        Producer,
+        through="ProducerProduct",
+        related_name="catalogue",
+        verbose_name="Produtores",
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = "Produto"
+        verbose_name_plural = "Produtos"
+        ordering = ["name"]
+
+    def __str__(self):
+        return self.name
+
+
+class ProducerProduct(models.Model):
+    producer = models.ForeignKey(Producer, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    order = models.PositiveIntegerField(default=0, verbose_name="Ordem")
+
+    class Meta:
+        ordering = ["order"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "producer"], name="unique_producer_product"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.producer_id} - {self.product_id}"
+
+
+class Place(models.Model):
+    """Gazetteer entry used to geocode addresses offline (see ``geocoding``)"""
+
+    class Kind(models.TextChoices):
+        POSTAL_CODE = "postal_code", "Código postal"
+        POSTAL_AREA = "postal_area", "Zona postal"
+        CITY = "city", "Localidade"
+
+    # Kinds tried for an address, from the most precise
+    PRECISION = [Kind.POSTAL_CODE, Kind.POSTAL_AREA, Kind.CITY]
+
+    kind = models.CharField(max_length=16, choices=Kind.choices, verbose_name="Tipo")
+    key = models.CharField(
+        max_length=100,
+        verbose_name="Chave",
+        help_text="Código postal (1234-123), zona postal (1234) ou cidade normalizada",
+    )
+    name = models.CharField(max_length=100, blank=True, verbose_name="Nome")
+    district = models.CharField(max_length=50, blank=True, verbose_name="Distrito")
+    latitude = models.FloatField(verbose_name="Latitude")
+    longitude = models.FloatField(verbose_name="Longitude")
+
+    class Meta:
+        verbose_name = "Local"
+        verbose_name_plural = "Locais"
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "key"], name="producer_place_kind_key_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.key}"
+
+
+class Job(models.Model):
+    """Background job over a selection of producers, run by ``run_jobs``"""
+
+    class Kind(models.TextChoices):
+        ACTIVATE = "activate", "Ativar produtores"
+        DEACTIVATE = "deactivate", "Desativar produtores"
+        REGENERATE_IMAGES = "regenerate_images", "Regenerar imagens"
+        REINDEX = "reindex", "Reindexar pesquisa"
+        EXPORT = "export", "Exportar seleção"
+        GEOCODE = "geocode", "Recalcular coordenadas"
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Em espera"
+        RUNNING = "running", "Em curso"
+        DONE = "done", "Concluída"
+        FAILED = "failed", "Falhou"
+
+    kind = models.CharField(max_length=32, choices=Kind.choices, verbose_name="Tipo")
+    status = models.CharField(
+        max_length=16, choices=Status.choices, default=Status.PENDING, verbose_name="Estado"
+    )
+    producer_ids = models.JSONField(default=list, verbose_name="Produtores")
+    total = models.PositiveIntegerField(default=0, verbose_name="Total")
+    processed = models.PositiveIntegerField(default=0, verbose_name="Processados")
+    result = models.JSONField(default=dict, blank=True, verbose_name="Resultado")
+    error = models.TextField(blank=True, verbose_name="Erro")
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name="Criada por",
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criada em")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Iniciada em")
+    # Heartbeat: set when claimed and after each chunk
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Atualizada em")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Terminada em")
+
+    class Meta:
+        verbose_name = "Tarefa"
+        verbose_name_plural = "Tarefas"
+        ordering = ["-created_at"]
+        indexes = [
+            # The worker polls for the oldest pending jobs
+            models.Index(fields=["status", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk}"
+
+    @property
+    def progress(self):
+        """Completed fraction between 0 and 1"""
+        return self.processed / self.total if self.total else 1.0
@@ -0,0 +1,166 @@
+import base64
+import json
+import uuid
+
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def estimated_row_count(model, using="default"):
+    """The planner's row estimate for ``model``'s table, or None if unknown.
+
+    PostgreSQL keeps it in ``pg_class``; SQLite only has one after ``ANALYZE``
+    has filled ``sqlite_stat1``.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+        elif connection.vendor == "sqlite":
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that skips ``COUNT(*)`` for unfiltered querysets on large tables.
+
+    Below ``threshold`` rows, or when the queryset is filtered, the exact
+    count is used.
+    """
+
+    threshold = 10_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if hasattr(queryset, "query") and not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, using=queryset.db)
+            if estimate is not None and estimate > self.threshold:
+                return estimate
+        return super().count
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Async ``paginate_queryset`` for the async read views"""
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            number = paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            raise NotFound(
+                self.invalid_page_message.format(page_number=page_number, message=str(exc))
+            )
+        bottom = (number - 1) * page_size
+        rows = [
+            row async for row in queryset[bottom : bottom + page_size].aiterator(chunk_size=page_size)
+        ]
+        self.page = Page(rows, number, paginator)
+        return rows
+
+
+class KeysetPagination(BasePagination):
+    """Forward-only keyset pagination ordered by ``(name, id)``.
+
+    Each page is a range scan on the ``name`` index starting after the last
+    row of the previous page, so it needs neither ``COUNT(*)`` nor ``OFFSET``
+    and deep pages cost the same as the first one. The cursor is an opaque,
+    URL-safe encoding of that last ``(name, id)`` pair.
+    """
+
+    cursor_query_param = "cursor"
+    page_size = StandardResultsSetPagination.page_size
+    page_size_query_param = StandardResultsSetPagination.page_size_query_param
+    max_page_size = StandardResultsSetPagination.max_page_size
+    invalid_cursor_message = "Cursor inválido"
+
+    def window(self, queryset, request):
+        """The rows of the requested page plus one to detect a next page"""
+        queryset = queryset.order_by("name", "id")
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            name, pk = self.decode_cursor(cursor)
+            # Written as a range on name so the index drives the scan
+            queryset = queryset.filter(name__gte=name).filter(Q(name__gt=name) | Q(id__gt=pk))
+        return queryset[: self.get_page_size(request) + 1]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        rows = list(self.window(queryset, request))
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[: self.page_size]
+        return self.page
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Async ``paginate_queryset`` for the async read views"""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        window = self.window(queryset, request)
+        rows = [row async for row in window.aiterator(chunk_size=self.page_size + 1)]
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[: self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    def encode_cursor(self, instance):
+        raw = json.dumps([instance.name, str(instance.pk)]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            name, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            return str(name), uuid.UUID(str(pk))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
@@ -0,0 +1,61 @@
+"""Read-replica routing for the producer API.
+
+Reads are sent to a replica only inside ``use_replicas()``, which the
+producer read views enter for GET/HEAD requests. Everything else, including
+reads made while handling a write, goes to the primary, so a request never
+reads stale data right after its own writes. Replicas are the aliases listed
+in ``settings.DATABASE_REPLICAS``.
+
+Other requests may read right after a write, too, and their responses are
+cached under the generation the write bumped. The views therefore only use
+replicas when ``replicas_caught_up()``: no write happened in the last
+``DATABASE_REPLICA_LAG_SECONDS``.
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from . import cache
+
+_reads_from_replica = ContextVar("producer_reads_from_replica", default=False)
+
+
+@contextmanager
+def use_replicas(enabled=True):
+    """Route ORM reads in this block to a replica (when any is configured)"""
+    token = _reads_from_replica.set(enabled)
+    try:
+        yield
+    finally:
+        _reads_from_replica.reset(token)
+
+
+def get_replicas():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+def replicas_caught_up():
+    """Whether replicas can be read: none configured, or no recent write"""
+    return not get_replicas() or not cache.recently_written()
+
+
+async def areplicas_caught_up():
+    return not get_replicas() or not await cache.arecently_written()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if replicas and _reads_from_replica.get():
+            return random.choice(replicas)
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
@@ -0,0 +1,184 @@
+"""Full-text search index for producers.
+
+The index lives in the ``producer_search`` table, kept outside the ORM because
+its shape depends on the database:
+
+* SQLite: an FTS5 virtual table ranked with ``bm25``.
+* PostgreSQL: a ``tsvector`` column with a GIN index ranked with ``ts_rank``.
+
+Text is accent-folded and lowercased before indexing and querying, so
+"requeijao" matches "Requeijão" on both backends. The producer name is
+weighted above the description, products and category names.
+"""
+
+import re
+import unicodedata
+
+from django.db import connection as default_connection, connections
+from django.db.models import Case, IntegerField, Q, Value, When
+
+TABLE = "producer_search"
+# Upper bound on ranked matches fed back into the producer queryset; the best
+# ranked are kept and the list response says when more matched ("truncated")
+MAX_RESULTS = 1000
+# 63 bits of the producer UUID are used as the SQLite FTS5 rowid
+ROWID_MASK = (1 << 63) - 1
+
+
+def normalize(text):
+    """Lowercase ``text`` and strip diacritics"""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text):
+    return re.findall(r"\w+", normalize(text))
+
+
+def producer_documents(producer):
+    """Return the ``(name, body)`` texts indexed for a producer"""
+    products = producer.products if isinstance(producer.products, list) else []
+    parts = [producer.description]
+    parts.extend(str(product) for product in products)
+    parts.extend(category.name for category in producer.categories.all())
+    return normalize(producer.name), normalize(" ".join(p for p in parts if p))
+
+
+def is_supported(connection=default_connection):
+    return connection.vendor in ("sqlite", "postgresql")
+
+
+def create_index(schema_editor):
+    """Create the search table for the current database (used by migrations)"""
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+            "producer_id UNINDEXED, name, body, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    elif vendor == "postgresql":
+        schema_editor.execute(
+            f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+            "producer_id uuid PRIMARY KEY REFERENCES producer_producer (id) "
+            "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {TABLE}_document_gin ON {TABLE} USING gin (document)"
+        )
+
+
+def drop_index(schema_editor):
+    if is_supported(schema_editor.connection):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+def _rowid(producer_id):
+    return producer_id.int & ROWID_MASK
+
+
+def _producer_id_param(producer_id, connection):
+    # Django stores UUIDs as 32-char hex strings on SQLite
+    return producer_id.hex if connection.vendor == "sqlite" else producer_id
+
+
+def index_producers(producers, connection=default_connection):
+    """Insert or refresh the search documents of ``producers``"""
+    if not is_supported(connection):
+        return
+    with connection.cursor() as cursor:
+        for producer in producers:
+            name, body = producer_documents(producer)
+            if connection.vendor == "sqlite":
+                rowid = _rowid(producer.pk)
+                cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [rowid])
+                cursor.execute(
+                    f"INSERT INTO {TABLE} (rowid, producer_id, name, body) VALUES (%s, %s, %s, %s)",
+                    [rowid, producer.pk.hex, name, body],
+                )
+            else:
+                cursor.execute(
+                    f"INSERT INTO {TABLE} (producer_id, document) VALUES (%s, "
+                    "setweight(to_tsvector('simple', %s), 'A') || "
+                    "setweight(to_tsvector('simple', %s), 'B')) "
+                    "ON CONFLICT (producer_id) DO UPDATE SET document = EXCLUDED.document",
+                    [producer.pk, name, body],
+                )
+
+
+def unindex_producer(producer_id, connection=default_connection):
+    if not is_supported(connection):
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [_rowid(producer_id)])
+        else:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE producer_id = %s", [producer_id])
+
+
+def rebuild_index(queryset, connection=default_connection, batch_size=500):
+    """Reindex every producer of ``queryset``, returning how many were indexed"""
+    if not is_supported(connection):
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+    count = 0
+    queryset = queryset.prefetch_related("categories").order_by("pk")
+    for producer in queryset.iterator(chunk_size=batch_size):
+        index_producers([producer], connection)
+        count += 1
+    return count
+
+
+def ranked_ids(query, connection=default_connection, limit=MAX_RESULTS):
+    """Return matching producer ids, best match first"""
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            match = " ".join(f'"{token}"*' for token in tokens)
+            cursor.execute(
+                f"SELECT producer_id FROM {TABLE} WHERE {TABLE} MATCH %s "
+                f"ORDER BY bm25({TABLE}, 0.0, 10.0, 1.0) LIMIT %s",
+                [match, limit],
+            )
+        else:
+            match = " & ".join(f"{token}:*" for token in tokens)
+            cursor.execute(
+                f"SELECT producer_id FROM {TABLE}, to_tsquery('simple', %s) AS query "
+                "WHERE document @@ query ORDER BY ts_rank(document, query) DESC LIMIT %s",
+                [match, limit],
+            )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_producers(queryset, query, connection=None):
+    """Filter ``queryset`` to producers matching ``query``, ordered by rank.
+
+    Returns ``(queryset, truncated)``: at most ``MAX_RESULTS`` of the best
+    ranked matches are kept, and ``truncated`` tells whether more matched.
+    """
+    if connection is None:
+        # Read the index from the database the rows are read from
+        connection = connections[queryset.db]
+    if not is_supported(connection):
+        q = Q()
+        for token in query.split():
+            q &= Q(name__icontains=token) | Q(description__icontains=token)
+        return queryset.filter(q), False
+
+    ids = ranked_ids(query, connection, limit=MAX_RESULTS + 1)
+    truncated = len(ids) > MAX_RESULTS
+    ids = ids[:MAX_RESULTS]
+    if not ids:
+        return queryset.none(), False
+    rank = Case(
+        *(When(pk=pk, then=Value(position)) for position, pk in enumerate(ids)),
+        output_field=IntegerField(),
+    )
+    return (
+        queryset.filter(pk__in=ids).annotate(search_rank=rank).order_by("search_rank"),
+        truncated,
+    )
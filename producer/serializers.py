@@ -1,13 +1,22 @@
+from operator import attrgetter
+
+from django.core.files.storage import default_storage
 from rest_framework import serializers
-from .models import Producer, ProducerImage, Category
+from .images import srcset
+from .metrics import timed_serialization
+from .models import Producer, ProducerImage, Category, Product
+
 
+def absolute_media_url(request, name):
+    return request.build_absolute_uri(default_storage.url(name)) if request else None
 
 class ProducerImageSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = ProducerImage
-        fields = ["id", "image_url", "caption", "order"]
+        fields = ["id", "image_url", "srcset", "caption", "order"]
         read_only_fields = ["id", "uploaded_at"]
 
     def get_image_url(self, obj):
@@ -16,13 +25,100 @@ class ProducerImageSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.image.url)
         return None
 
+    def get_srcset(self, obj):
+        """Resized JPEG/WebP variants as srcset strings, keyed by format"""
+        request = self.context.get("request")
+        return srcset(obj.derivatives, lambda name: absolute_media_url(request, name))
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'slug']
         read_only_fields = ['id']
 
-class ProducerSerializer(serializers.ModelSerializer):
+class ProductSerializer(serializers.ModelSerializer):
+    producer_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'slug', 'producer_count']
+        read_only_fields = fields
+
+def format_address(obj):
+    """Return formatted address object"""
+    parts = []
+    if obj.street:
+        street_addr = obj.street
+        if obj.number:
+            street_addr = f"{obj.number}, {obj.street}"
+        parts.append(street_addr)
+    if obj.city:
+        parts.append(obj.city)
+    if obj.zip_code:
+        parts.append(obj.zip_code)
+
+    return {
+        "street": obj.street,
+        "number": obj.number,
+        "city": obj.city,
+        "state": obj.state,
+        "zip_code": obj.zip_code,
+        "formatted": ", ".join(parts) if parts else "Morada não disponível",
+        "latitude": obj.latitude,
+        "longitude": obj.longitude,
+    }
+
+# Producer columns read by each output field, used to prune querysets when
+# clients ask for a subset of fields
+PRODUCER_FIELD_COLUMNS = {
+    "id": ["id"],
+    "name": ["name"],
+    "categories": [],
+    "type_display": [],
+    "description": ["description"],
+    "phone": ["phone"],
+    "mobile_phone": ["mobile_phone"],
+    "email": ["email"],
+    "website": ["website"],
+    "address": ["street", "number", "city", "state", "zip_code", "latitude", "longitude"],
+    "facebook": ["facebook"],
+    "instagram": ["instagram"],
+    "twitter": ["twitter"],
+    "youtube": ["youtube"],
+    "tiktok": ["tiktok"],
+    "main_image": ["main_image"],
+    "main_image_srcset": ["derivatives"],
+    "gallery_images": [],
+    "products": ["products"],
+    "created_at": ["created_at"],
+    "updated_at": ["updated_at"],
+    "is_active": ["is_active"],
+}
+
+# Named field sets selectable with ?view=
+PRODUCER_VIEWS = {
+    "compact": ["id", "name", "categories", "address", "main_image", "main_image_srcset"],
+}
+
+class TimedListSerializer(serializers.ListSerializer):
+    """Counts serialization time in the request profile (see metrics.py)"""
+
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
+
+class TimedDataMixin:
+    """Counts serialization time in the request profile (see metrics.py)"""
+
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
+
+class ProducerSerializer(TimedDataMixin, serializers.ModelSerializer):
     categories = CategorySerializer(many=True, read_only=True)
     category_ids = serializers.PrimaryKeyRelatedField(
         many=True,
@@ -33,6 +129,7 @@ class ProducerSerializer(serializers.ModelSerializer):
     )
     gallery_images = ProducerImageSerializer(many=True, read_only=True)
     main_image_url = serializers.SerializerMethodField()
+    main_image_srcset = serializers.SerializerMethodField()
     address = serializers.SerializerMethodField()
     type_display = serializers.SerializerMethodField()
 
@@ -56,6 +153,7 @@ class ProducerSerializer(serializers.ModelSerializer):
             "youtube",
             "tiktok",
             "main_image_url",
+            "main_image_srcset",
             "gallery_images",
             "products",
             "created_at",
@@ -63,6 +161,15 @@ class ProducerSerializer(serializers.ModelSerializer):
             "is_active",
         ]
         read_only_fields = ["id", "created_at", "updated_at"]
+        list_serializer_class = TimedListSerializer
+
+    def __init__(self, *args, fields=None, **kwargs):
+        """Optionally restrict the output to ``fields`` (output names)"""
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            keep = {"main_image_url" if name == "main_image" else name for name in fields}
+            for name in set(self.fields) - keep:
+                self.fields.pop(name)
 
     def get_main_image_url(self, obj):
         request = self.context.get("request")
@@ -70,37 +177,116 @@ class ProducerSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.main_image.url)
         return None
 
+    def get_main_image_srcset(self, obj):
+        """Resized JPEG/WebP variants as srcset strings, keyed by format"""
+        request = self.context.get("request")
+        return srcset(obj.derivatives, lambda name: absolute_media_url(request, name))
+
     def get_type_display(self, obj):
         """Return a string with the types separated by ' • '"""
         return " • ".join([cat.name for cat in obj.categories.all()])
 
-
     def get_address(self, obj):
         """Return formatted address object"""
-        parts = []
-        if obj.street:
-            street_addr = obj.street
-            if obj.number:
-                street_addr = f"{obj.number}, {obj.street}"
-            parts.append(street_addr)
-        if obj.city:
-            parts.append(obj.city)
-        if obj.zip_code:
-            parts.append(obj.zip_code)
-
-        return {
-            "street": obj.street,
-            "number": obj.number,
-            "city": obj.city,
-            "state": obj.state,
-            "zip_code": obj.zip_code,
-            "formatted": ", ".join(parts) if parts else "Morada não disponível",
-            "latitude": obj.latitude,
-            "longitude": obj.longitude,
-        }
+        return format_address(obj)
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
         # Move main_image_url to main_image
-        data["main_image"] = data.pop("main_image_url", None)
+        if "main_image_url" in data:
+            data["main_image"] = data.pop("main_image_url")
+        if "main_image_srcset" in data:
+            data["main_image_srcset"] = data.pop("main_image_srcset")
+        # Distance is only annotated by the ``near`` filter
+        distance_km = getattr(instance, "distance_km", None)
+        if distance_km is not None:
+            data["distance_km"] = round(distance_km, 3)
+        return data
+
+
+class ProducerBatchItemSerializer(ProducerSerializer):
+    """Validates the ``data`` of one batch operation.
+
+    Category and gallery ids are plain integers here; their existence is
+    checked for the whole batch at once instead of one query per id.
+    """
+
+    category_ids = serializers.ListField(
+        child=serializers.IntegerField(), write_only=True, required=False
+    )
+    gallery_order = serializers.ListField(
+        child=serializers.IntegerField(), write_only=True, required=False
+    )
+
+    class Meta(ProducerSerializer.Meta):
+        fields = ProducerSerializer.Meta.fields + ["gallery_order"]
+
+class ProducerReadSerializer(TimedDataMixin, serializers.BaseSerializer):
+    """Read-only fast path producing the same output as ProducerSerializer.
+
+    Builds each dict straight from the loaded columns and the prefetched
+    categories / gallery images, skipping DRF's per-field dispatch. Output
+    must stay identical to ProducerSerializer; see the parity test.
+    """
+
+    datetime_field = serializers.DateTimeField()
+
+    class Meta:
+        list_serializer_class = TimedListSerializer
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        getters = {
+            "id": lambda obj: str(obj.id),
+            "categories": self.get_categories,
+            "type_display": lambda obj: " • ".join([cat.name for cat in obj.categories.all()]),
+            "address": format_address,
+            "gallery_images": self.get_gallery_images,
+            "created_at": lambda obj: self.datetime_field.to_representation(obj.created_at),
+            "updated_at": lambda obj: self.datetime_field.to_representation(obj.updated_at),
+        }
+        self.getters = [
+            (name, getters.get(name, attrgetter(name)))
+            for name in PRODUCER_FIELD_COLUMNS
+            if name not in ("main_image", "main_image_srcset")
+            and (fields is None or name in fields)
+        ]
+        self.with_main_image = fields is None or "main_image" in fields
+        self.with_main_image_srcset = fields is None or "main_image_srcset" in fields
+
+    def absolute_url(self, file):
+        request = self.context.get("request")
+        if file and request:
+            return request.build_absolute_uri(file.url)
+        return None
+
+    def srcset(self, derivatives):
+        request = self.context.get("request")
+        return srcset(derivatives, lambda name: absolute_media_url(request, name))
+
+    def get_categories(self, obj):
+        return [{"id": cat.id, "name": cat.name, "slug": cat.slug} for cat in obj.categories.all()]
+
+    def get_gallery_images(self, obj):
+        return [
+            {
+                "id": image.id,
+                "image_url": self.absolute_url(image.image),
+                "srcset": self.srcset(image.derivatives),
+                "caption": image.caption,
+                "order": image.order,
+            }
+            for image in obj.gallery_images.all()
+        ]
+
+    def to_representation(self, instance):
+        data = {name: getter(instance) for name, getter in self.getters}
+        if self.with_main_image:
+            data["main_image"] = self.absolute_url(instance.main_image)
+        if self.with_main_image_srcset:
+            data["main_image_srcset"] = self.srcset(instance.derivatives)
+        # Distance is only annotated by the ``near`` filter
+        distance_km = getattr(instance, "distance_km", None)
+        if distance_km is not None:
+            data["distance_km"] = round(distance_km, 3)
         return data
@@ -0,0 +1,120 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import cache, changes, images, search
+from .catalogue import sync_catalogue
+from .models import (
+    Category,
+    DeletedProducer,
+    Producer,
+    ProducerImage,
+    Product,
+    ProducerProduct,
+)
+
+
+def reindex(producer_ids):
+    """Refresh the search documents of the given producers.
+
+    Runs inside the caller's transaction, so the index rolls back with it.
+    """
+    producers = Producer.objects.filter(pk__in=list(producer_ids))
+    search.index_producers(producers.prefetch_related("categories"))
+
+
+def touch(producer_ids):
+    """Bump ``updated_at`` of producers whose representation changed through
+    a related object, so conditional GETs and change feeds notice it"""
+    Producer.objects.filter(pk__in=list(producer_ids)).update(updated_at=timezone.now())
+
+
+def related_changed(producer_ids):
+    producer_ids = list(producer_ids)
+    touch(producer_ids)
+    reindex(producer_ids)
+
+
+@receiver(post_save, sender=Producer)
+def producer_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        sync_catalogue([instance], Product, ProducerProduct)
+        reindex([instance.pk])
+
+
+@receiver(post_delete, sender=Producer)
+def producer_deleted(sender, instance, **kwargs):
+    search.unindex_producer(instance.pk)
+    DeletedProducer.objects.update_or_create(
+        producer_id=instance.pk, defaults={"deleted_at": timezone.now()}
+    )
+    # Batch deletes may commit long after the tombstone is written
+    changes.stamp_on_commit(deleted_ids=[instance.pk])
+
+
+@receiver(m2m_changed, sender=Producer.categories.through)
+def producer_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # The relation is declared on Category, so ``reverse`` means the change
+    # came from ``producer.categories``
+    if reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            related_changed([instance.pk])
+        return
+    if action == "pre_clear":
+        instance._affected_producer_ids = list(instance.producer.values_list("pk", flat=True))
+    elif action in ("post_add", "post_remove"):
+        related_changed(pk_set)
+    elif action == "post_clear":
+        related_changed(instance.__dict__.pop("_affected_producer_ids", []))
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        related_changed(instance.producer.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, **kwargs):
+    instance._affected_producer_ids = list(instance.producer.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    related_changed(instance.__dict__.pop("_affected_producer_ids", []))
+
+
+@receiver(post_save, sender=ProducerImage)
+@receiver(post_delete, sender=ProducerImage)
+def gallery_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        touch([instance.producer_id])
+
+
+@receiver(post_save, sender=Producer)
+@receiver(post_save, sender=ProducerImage)
+def image_saved(sender, instance, raw=False, **kwargs):
+    file = instance.main_image if sender is Producer else instance.image
+    if not raw and images.needs_derivatives(file, instance.derivatives):
+        images.schedule_derivatives(instance)
+
+
+@receiver(post_delete, sender=Producer)
+@receiver(post_delete, sender=ProducerImage)
+def image_deleted(sender, instance, **kwargs):
+    record = instance.derivatives
+    if record:
+        transaction.on_commit(lambda: images.delete_derivatives(record))
+
+
+@receiver(post_save, sender=Producer)
+@receiver(post_delete, sender=Producer)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=ProducerImage)
+@receiver(post_delete, sender=ProducerImage)
+@receiver(m2m_changed, sender=Producer.categories.through)
+def invalidate_response_cache(sender, action=None, **kwargs):
+    if action is None or action.startswith("post_"):
+        cache.bump_generation()
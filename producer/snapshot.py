@@ -0,0 +1,376 @@
+"""Static snapshot of the public producer directory, for a CDN or a static
+file server.
+
+``build_snapshot`` renders JSON files into a new version directory under
+``settings.SNAPSHOT_ROOT``::
+
+    <version>/index.json                           categories and cities, with counts
+    <version>/lists/all/<page>.json                active producers by name
+    <version>/lists/category/<slug>/<page>.json
+    <version>/lists/city/<city>/<page>.json
+    <version>/producers/<id>.json                  producer details
+    <version>/manifest.json                        state for the next run
+
+Producers are rendered like the API (``ProducerReadSerializer``, identical to
+``ProducerSerializer``) and list pages keep the API's ``count``/``next``/
+``previous``/``results`` shape, with links relative to the page. Every file is
+also written gzip-compressed (``.json.gz``) and, when the ``brotli`` package is
+installed, brotli-compressed (``.json.br``), for servers that serve
+precompressed files.
+
+Runs are incremental. The new version starts as hard links to the previous
+one; only the producers reported by the changes feed since the last run and
+the lists they were or are now in are rendered again, and files whose content
+did not change are left alone. ``CURRENT`` names the latest version and is
+replaced last, so readers never see a half-written one.
+"""
+
+import gzip
+import hashlib
+import json
+import math
+import os
+import shutil
+import uuid
+from pathlib import Path
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.db.models import Count, Max, Prefetch
+from django.utils import timezone
+from django.utils.text import slugify
+from rest_framework.renderers import JSONRenderer
+
+from . import changes
+from .models import Category, DeletedProducer, Producer, ProducerImage
+from .serializers import ProducerReadSerializer
+
+FORMAT = 1
+CURRENT = "CURRENT"
+MANIFEST = "manifest.json"
+ALL_LIST = "lists/all"
+SUFFIXES = ("", ".gz", ".br")
+CHUNK_SIZE = 500
+# Position before any change, so the first incremental run sees tombstones
+ORIGIN = (changes.EPOCH, uuid.UUID(int=0))
+
+
+def get_root():
+    return Path(getattr(settings, "SNAPSHOT_ROOT", Path(settings.BASE_DIR) / "snapshots"))
+
+
+def get_page_size():
+    return getattr(settings, "SNAPSHOT_PAGE_SIZE", 100)
+
+
+class BaseURLRequest:
+    """Stands in for the request when building absolute media URLs"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/") + "/"
+
+    def build_absolute_uri(self, location):
+        return urljoin(self.base_url, location)
+
+
+def compress(payload):
+    """``{suffix: content}`` of the precompressed variants of ``payload``"""
+    # mtime=0 keeps the output identical for identical content
+    variants = {".gz": gzip.compress(payload, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        return variants
+    variants[".br"] = brotli.compress(payload)
+    return variants
+
+
+def _replace(path, content):
+    # A new inode: the previous version may share the old one (hard link)
+    temporary = path.with_name(path.name + ".tmp")
+    temporary.write_bytes(content)
+    os.replace(temporary, path)
+
+
+class SnapshotWriter:
+    """Writes JSON files under ``directory``, skipping unchanged content"""
+
+    def __init__(self, directory, hashes):
+        self.directory = directory
+        self.hashes = hashes  # relative path -> sha256 of the JSON
+        self.written = 0
+        self.removed = 0
+
+    def write(self, name, data):
+        payload = JSONRenderer().render(data)
+        digest = hashlib.sha256(payload).hexdigest()
+        if self.hashes.get(name) == digest:
+            return
+        path = self.directory / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _replace(path, payload)
+        for suffix, content in compress(payload).items():
+            _replace(path.with_name(path.name + suffix), content)
+        self.hashes[name] = digest
+        self.written += 1
+
+    def remove(self, name):
+        if self.hashes.pop(name, None) is None:
+            return
+        path = self.directory / name
+        for suffix in SUFFIXES:
+            path.with_name(path.name + suffix).unlink(missing_ok=True)
+        try:
+            path.parent.rmdir()
+        except OSError:
+            pass  # Not empty
+        self.removed += 1
+
+
+def with_relations(queryset):
+    return queryset.prefetch_related(
+        "categories",
+        Prefetch("gallery_images", queryset=ProducerImage.objects.order_by("order", "uploaded_at")),
+    )
+
+
+def memberships(queryset):
+    """``{producer_id: {"categories": [slug], "city": city_key}}`` of ``queryset``"""
+    result = {
+        str(pk): {"categories": [], "city": city_key}
+        for pk, city_key in queryset.values_list("pk", "city_key")
+    }
+    links = Producer.categories.through.objects.filter(producer__in=queryset)
+    for producer_id, slug in links.values_list("producer_id", "category__slug").order_by(
+        "category__slug"
+    ):
+        result[str(producer_id)]["categories"].append(slug)
+    return result
+
+
+def lists_of(membership):
+    """``{list path: filter}`` of the lists a producer appears in"""
+    if membership is None:
+        return {}
+    lists = {ALL_LIST: {}}
+    for slug in membership["categories"]:
+        lists[f"lists/category/{slug}"] = {"categories__slug": slug}
+    if membership["city"]:
+        lists[f"lists/city/{slugify(membership['city'])}"] = {"city_key": membership["city"]}
+    return lists
+
+
+def latest_position(until):
+    """Position of the newest change up to ``until``"""
+    positions = [
+        Producer.objects.filter(updated_at__lte=until)
+        .order_by("-updated_at", "-pk")
+        .values_list("updated_at", "pk")
+        .first(),
+        DeletedProducer.objects.filter(deleted_at__lte=until)
+        .order_by("-deleted_at", "-producer_id")
+        .values_list("deleted_at", "producer_id")
+        .first(),
+    ]
+    return max((position for position in positions if position), default=ORIGIN)
+
+
+def read_current(root):
+    """``(version, manifest)`` of the latest snapshot, or ``(None, None)``"""
+    try:
+        version = (root / CURRENT).read_text().strip()
+        with open(root / version / MANIFEST, encoding="utf-8") as handle:
+            return version, json.load(handle)
+    except (OSError, ValueError):
+        return None, None
+
+
+def link_tree(source, target):
+    """Recreate ``source`` in ``target`` with hard links (copies if unsupported)"""
+    for directory, _, files in os.walk(source):
+        relative = Path(directory).relative_to(source)
+        (target / relative).mkdir(parents=True, exist_ok=True)
+        for name in files:
+            if name == MANIFEST:
+                continue
+            try:
+                os.link(Path(directory) / name, target / relative / name)
+            except OSError:
+                shutil.copy2(Path(directory) / name, target / relative / name)
+
+
+def render_details(writer, ids, request):
+    ids = sorted(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        queryset = with_relations(Producer.objects.filter(pk__in=ids[start : start + CHUNK_SIZE]))
+        for producer in queryset:
+            data = ProducerReadSerializer(producer, context={"request": request}).data
+            writer.write(f"producers/{producer.pk}.json", data)
+
+
+def render_list(writer, path, filters, old_pages, page_size, request):
+    """Write the pages of one list; returns the number of pages"""
+    queryset = Producer.objects.filter(is_active=True, **filters).order_by("name", "pk")
+    count = queryset.count()
+    pages = math.ceil(count / page_size)
+    if path == ALL_LIST:
+        pages = max(pages, 1)  # Always present, even when empty
+    for number in range(1, pages + 1):
+        page = with_relations(queryset[(number - 1) * page_size : number * page_size])
+        writer.write(
+            f"{path}/{number}.json",
+            {
+                "count": count,
+                "next": f"{number + 1}.json" if number < pages else None,
+                "previous": f"{number - 1}.json" if number > 1 else None,
+                "results": ProducerReadSerializer(
+                    page, many=True, context={"request": request}
+                ).data,
+            },
+        )
+    for number in range(pages + 1, old_pages + 1):
+        writer.remove(f"{path}/{number}.json")
+    return pages
+
+
+def render_index(writer):
+    active = Producer.objects.filter(is_active=True)
+    categories = (
+        Category.objects.filter(producer__is_active=True)
+        .annotate(count=Count("producer"))
+        .order_by("name")
+    )
+    cities = (
+        active.exclude(city_key="")
+        .values("city_key")
+        .annotate(name=Max("city"), count=Count("pk"))
+        .order_by("city_key")
+    )
+    writer.write(
+        "index.json",
+        {
+            "count": active.count(),
+            "list": f"{ALL_LIST}/1.json",
+            "categories": [
+                {
+                    "name": category.name,
+                    "slug": category.slug,
+                    "count": category.count,
+                    "list": f"lists/category/{category.slug}/1.json",
+                }
+                for category in categories
+            ],
+            "cities": [
+                {
+                    "name": city["name"],
+                    "count": city["count"],
+                    "list": f"lists/city/{slugify(city['city_key'])}/1.json",
+                }
+                for city in cities
+            ],
+        },
+    )
+
+
+def prune(root, keep, current):
+    versions = sorted(
+        path.name for path in root.iterdir() if path.is_dir() and (path / MANIFEST).exists()
+    )
+    for version in versions[:-keep] if keep else []:
+        if version != current:
+            shutil.rmtree(root / version)
+
+
+def build_snapshot(root=None, full=False, base_url="", page_size=None, keep=3):
+    """Render a new snapshot version if anything changed since the last one.
+
+    Returns ``{"version", "full", "changes", "written", "removed"}``; when
+    nothing changed, ``version`` is the current one and nothing is written.
+    """
+    root = Path(root) if root else get_root()
+    page_size = page_size or get_page_size()
+    request = BaseURLRequest(base_url or "/")
+    previous, manifest = read_current(root)
+    full = (
+        full
+        or manifest is None
+        or (manifest.get("format"), manifest.get("page_size"), manifest.get("base_url"))
+        != (FORMAT, page_size, base_url)
+    )
+    until = timezone.now() - changes.get_settle_delay()
+
+    changed = set()
+    if full:
+        position = latest_position(until)
+    else:
+        position = changes.decode_token(manifest["token"])
+        while True:
+            entries, has_more = changes.read_changes(position, 1000, until)
+            changed.update(str(pk) for _, pk, _, _ in entries)
+            if entries:
+                position = entries[-1][:2]
+            if not has_more:
+                break
+        if not changed:
+            return {"version": previous, "full": False, "changes": 0, "written": 0, "removed": 0}
+
+    version = timezone.now().strftime("%Y%m%dT%H%M%S%fZ")
+    directory = root / version
+    if full:
+        directory.mkdir(parents=True)
+        writer = SnapshotWriter(directory, {})
+        members = memberships(Producer.objects.filter(is_active=True))
+        old_lists = {}
+        affected = {ALL_LIST: {}}
+        for membership in members.values():
+            affected.update(lists_of(membership))
+        details = set(members)
+    else:
+        link_tree(root / previous, directory)
+        writer = SnapshotWriter(directory, manifest["files"])
+        members = manifest["producers"]
+        old_lists = manifest["lists"]
+        current = memberships(Producer.objects.filter(pk__in=changed, is_active=True))
+        affected = {ALL_LIST: {}}
+        for pk in changed:
+            affected.update(lists_of(members.pop(pk, None)))
+            affected.update(lists_of(current.get(pk)))
+        members.update(current)
+        details = set(current)
+        for pk in changed - details:
+            writer.remove(f"producers/{pk}.json")
+
+    render_details(writer, details, request)
+    lists = dict(old_lists)
+    for path, filters in sorted(affected.items()):
+        lists[path] = render_list(
+            writer, path, filters, old_lists.get(path, 0), page_size, request
+        )
+        if not lists[path]:
+            del lists[path]
+    render_index(writer)
+
+    with open(directory / MANIFEST, "w", encoding="utf-8") as handle:
+        json.dump(
+            {
+                "format": FORMAT,
+                "version": version,
+                "generated_at": timezone.now().isoformat(),
+                "token": changes.encode_token(*position),
+                "page_size": page_size,
+                "base_url": base_url,
+                "producers": members,
+                "lists": lists,
+                "files": writer.hashes,
+            },
+            handle,
+        )
+    _replace(root / CURRENT, version.encode())
+    prune(root, keep, version)
+    return {
+        "version": version,
+        "full": full,
+        "changes": len(changed),
+        "written": writer.written,
+        "removed": writer.removed,
+    }
@@ -0,0 +1,81 @@
+"""SQLite tuning for small deployments that run on ``db.sqlite3``.
+
+``apply_pragmas`` runs on every new SQLite connection and applies
+``settings.SQLITE_PRAGMAS``: WAL journaling lets readers keep reading while a
+write is in progress, ``synchronous=NORMAL`` is safe with WAL and avoids an
+fsync per commit, memory-mapped I/O speeds up reads and ``busy_timeout`` makes
+a writer wait for the lock instead of failing at once.
+
+Writes are serialised at two levels. Transactions start with ``BEGIN
+IMMEDIATE`` (``OPTIONS["transaction_mode"]``), so a transaction that reads
+and then writes takes the write lock up front instead of failing with
+"database is locked" when it tries to upgrade a read lock. Optionally
+(``DB_SQLITE_SERIALIZE_WRITES=1``), ``SerializedWritesMiddleware`` also queues
+unsafe API/admin requests of a process on a lock, so they wait in order rather
+than polling the busy handler. It holds the lock for the whole request, so
+it suits single-process deployments with short writes.
+"""
+
+import asyncio
+import threading
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+# Requests that may write; anything else (static, media) is never queued
+WRITE_PATHS = ("/api/", "/admin/")
+
+write_lock = threading.Lock()
+
+
+@receiver(connection_created)
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    pragmas = getattr(settings, "SQLITE_PRAGMAS", {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def uses_sqlite():
+    return settings.DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3"
+
+
+def is_write(request):
+    return request.method not in SAFE_METHODS and request.path.startswith(WRITE_PATHS)
+
+
+class SerializedWritesMiddleware:
+    """Run requests that write one at a time; reads are never queued"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = uses_sqlite()
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # One per middleware instance, used on the server's event loop
+            self.async_lock = asyncio.Lock()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.enabled or not is_write(request):
+            return self.get_response(request)
+        with write_lock:
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if not self.enabled or not is_write(request):
+            return await self.get_response(request)
+        async with self.async_lock:
+            return await self.get_response(request)
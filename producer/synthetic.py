@@ -0,0 +1,146 @@
+"""Synthetic producer data for benchmarks and load tests.
+
+Producers are spread around real Minho towns with a small random offset, so
+geographic filters, the map grid and the facet counts behave as they would
+with production data. Rows are written with bulk queries and the derived data
+(map grid, city key, catalogue, search index) is refreshed like a bulk import.
+"""
+
+import random
+import uuid
+
+from django.db import transaction
+from django.utils.text import slugify
+
+from . import bulk, cache
+from .models import Category, Producer, ProducerImage
+
+# (city, district, latitude, longitude)
+MINHO_TOWNS = [
+    ("Braga", "Braga", 41.5454, -8.4265),
+    ("Guimarães", "Braga", 41.4425, -8.2918),
+    ("Barcelos", "Braga", 41.5388, -8.6151),
+    ("Vila Nova de Famalicão", "Braga", 41.4078, -8.5198),
+    ("Fafe", "Braga", 41.4508, -8.1703),
+    ("Esposende", "Braga", 41.5326, -8.7813),
+    ("Vila Verde", "Braga", 41.6497, -8.4363),
+    ("Póvoa de Lanhoso", "Braga", 41.5763, -8.2697),
+    ("Viana do Castelo", "Viana do Castelo", 41.6932, -8.8329),
+    ("Ponte de Lima", "Viana do Castelo", 41.7672, -8.5839),
+    ("Arcos de Valdevez", "Viana do Castelo", 41.8466, -8.4186),
+    ("Monção", "Viana do Castelo", 42.0784, -8.4803),
+    ("Melgaço", "Viana do Castelo", 42.1143, -8.2603),
+    ("Caminha", "Viana do Castelo", 41.8747, -8.8384),
+]
+CATEGORY_NAMES = [
+    "Queijos",
+    "Mel",
+    "Vinho Verde",
+    "Fumeiro",
+    "Azeite",
+    "Hortícolas",
+    "Fruta",
+    "Pão e Broa",
+    "Doçaria",
+    "Cogumelos",
+    "Compotas",
+    "Ovos",
+]
+PRODUCTS = [
+    "Queijo de cabra",
+    "Requeijão",
+    "Mel de urze",
+    "Vinho Verde Alvarinho",
+    "Vinho Verde Loureiro",
+    "Chouriço",
+    "Salpicão",
+    "Azeite virgem extra",
+    "Broa de milho",
+    "Kiwi",
+    "Castanha",
+    "Doce de abóbora",
+    "Ovos caseiros",
+    "Cogumelos shiitake",
+]
+# Random offset around each town, in degrees (about 8 km)
+SPREAD = 0.07
+
+
+def ensure_categories(count, prefix=""):
+    """Return ``count`` categories, creating the missing ones"""
+    categories = []
+    for index in range(count):
+        base = CATEGORY_NAMES[index % len(CATEGORY_NAMES)]
+        name = base if index < len(CATEGORY_NAMES) else f"{base} {index // len(CATEGORY_NAMES)}"
+        name = f"{prefix}{name}"
+        category, _ = Category.objects.get_or_create(slug=slugify(name), defaults={"name": name})
+        categories.append(category)
+    return categories
+
+
+def build_producer(rng, index, prefix=""):
+    city, state, latitude, longitude = rng.choice(MINHO_TOWNS)
+    name = f"{prefix}{rng.choice(['Quinta', 'Casa', 'Adega', 'Herdade', 'Cooperativa'])} {index:06d}"
+    return Producer(
+        id=uuid.UUID(int=rng.getrandbits(128), version=4),
+        name=name,
+        description=f"Produtor local em {city}.",
+        phone="+351253000000",
+        email=f"produtor{index}@example.pt",
+        street="Rua Direita",
+        number=str(rng.randint(1, 300)),
+        city=city,
+        state=state,
+        zip_code=f"4{rng.randint(700, 999)}-{rng.randint(1, 999):03d}",
+        latitude=round(latitude + rng.uniform(-SPREAD, SPREAD), 6),
+        longitude=round(longitude + rng.uniform(-SPREAD, SPREAD), 6),
+        main_image=f"producers/synthetic/{index}.jpg",
+        products=rng.sample(PRODUCTS, rng.randint(1, 4)),
+        is_active=rng.random() > 0.1,
+    )
+
+
+def generate_producers(
+    count, categories=8, images=3, seed=0, prefix="", batch_size=1000
+):
+    """Create ``count`` synthetic producers and return their ids.
+
+    Each producer gets one to three of ``categories`` categories and
+    ``images`` gallery images. ``seed`` makes the data reproducible.
+    """
+    rng = random.Random(seed)
+    category_ids = [category.pk for category in ensure_categories(categories, prefix)]
+    through = Producer.categories.through
+    ids = []
+    with transaction.atomic():
+        for start in range(0, count, batch_size):
+            producers = [
+                build_producer(rng, index, prefix)
+                for index in range(start, min(start + batch_size, count))
+            ]
+            bulk.save_producers(producers, [])
+            through.objects.bulk_create(
+                [
+                    through(producer_id=producer.pk, category_id=category_id)
+                    for producer in producers
+                    for category_id in rng.sample(
+                        category_ids, min(len(category_ids), rng.randint(1, 3))
+                    )
+                ]
+            )
+            ProducerImage.objects.bulk_create(
+                [
+                    ProducerImage(
+                        producer=producer,
+                        image=f"producers/gallery/synthetic-{producer.pk}-{order}.jpg",
+                        order=order,
+                    )
+                    for producer in producers
+                    for order in range(images)
+                ]
+            )
+            batch_ids = [producer.pk for producer in producers]
+            bulk.refresh_derived(batch_ids)
+            ids.extend(batch_ids)
+    cache.bump_generation()
+    return ids
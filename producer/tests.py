@@ -1,3 +1,1832 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO, TextIOWrapper
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import Model
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import bulk, geocoding, images, jobs, metrics, snapshot, synthetic
+from .cache import HITS_KEY, WRITTEN_KEY, get_cache
+from .geo import filter_near, grid_cell, haversine_km
+from .models import (
+    Category,
+    DeletedProducer,
+    Job,
+    Place,
+    Producer,
+    ProducerImage,
+    Product,
+)
+from .pagination import EstimatedCountPaginator, estimated_row_count
+from .serializers import PRODUCER_VIEWS, ProducerReadSerializer, ProducerSerializer
+from .sqlite import SerializedWritesMiddleware
+
+
+# Gallery images point at placeholder files: no derivatives can be built
+@override_settings(IMAGE_DERIVATIVES_ENABLED=False)
+def create_producers(count, **extra):
+    """Create ``count`` producers with two categories and a small gallery."""
+    cheese, _ = Category.objects.get_or_create(name="Queijos", slug="queijos")
+    honey, _ = Category.objects.get_or_create(name="Mel", slug="mel")
+    producers = []
+    for index in range(count):
+        producer = Producer.objects.create(
+            name=f"Produtor {index:03d}", city="Braga", **extra
+        )
+        producer.categories.set([cheese, honey])
+        for order in range(2):
+            ProducerImage.objects.create(
+                producer=producer, image=f"producers/gallery/{index}-{order}.jpg", order=order
+            )
+        producers.append(producer)
+    return producers
+
+
+class ProducerListQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        create_producers(30)
+
+    def count_queries(self, page_size):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/producers/", {"page_size": page_size})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), page_size)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.assertEqual(self.count_queries(5), self.count_queries(30))
+
+    def test_gallery_and_type_display_use_prefetched_rows(self):
+        response = self.client.get("/api/producers/", {"page_size": 1})
+        producer = response.data["results"][0]
+        self.assertEqual(producer["type_display"], "Mel • Queijos")
+        self.assertEqual([image["order"] for image in producer["gallery_images"]], [0, 1])
+
+
+class ProducerNearFilterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.braga = Producer.objects.create(name="Braga", latitude=41.5454, longitude=-8.4265)
+        self.guimaraes = Producer.objects.create(
+            name="Guimarães", latitude=41.4425, longitude=-8.2918
+        )
+        self.viana = Producer.objects.create(
+            name="Viana", latitude=41.6932, longitude=-8.8329
+        )
+        Producer.objects.create(name="Sem coordenadas")
+
+    def test_results_are_within_radius_and_sorted_by_distance(self):
+        response = self.client.get(
+            "/api/producers/", {"near": "41.5454,-8.4265", "radius_km": 20}
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.data["results"]
+        self.assertEqual([r["name"] for r in results], ["Braga", "Guimarães"])
+        self.assertEqual(results[0]["distance_km"], 0)
+        self.assertAlmostEqual(
+            results[1]["distance_km"],
+            haversine_km(41.5454, -8.4265, 41.4425, -8.2918),
+            places=2,
+        )
+
+    def test_distance_is_omitted_without_near(self):
+        response = self.client.get("/api/producers/")
+        self.assertNotIn("distance_km", response.data["results"][0])
+
+    def test_invalid_near_is_rejected(self):
+        response = self.client.get("/api/producers/", {"near": "braga"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get("/api/producers/", {"near": "41,-8", "radius_km": "-1"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ProducerMapTests(TestCase):
+    bbox = "-9.0,41.3,-8.0,41.9"
+
+    def setUp(self):
+        self.client = APIClient()
+        cheese = Category.objects.create(name="Queijos", slug="queijos")
+        for index in range(5):
+            producer = Producer.objects.create(
+                name=f"Braga {index}",
+                latitude=41.5454 + index * 0.0001,
+                longitude=-8.4265,
+            )
+            producer.categories.add(cheese)
+        Producer.objects.create(name="Viana", latitude=41.6932, longitude=-8.8329)
+        Producer.objects.create(
+            name="Inativo", latitude=41.5454, longitude=-8.4265, is_active=False
+        )
+        Producer.objects.create(name="Lisboa", latitude=38.7223, longitude=-9.1393)
+
+    def test_low_zoom_returns_clusters(self):
+        response = self.client.get("/api/producers/map/", {"bbox": self.bbox, "zoom": 8})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["points"], [])
+        counts = sorted(cluster["count"] for cluster in response.data["clusters"])
+        self.assertEqual(counts, [1, 5])
+
+    def test_high_zoom_returns_points(self):
+        response = self.client.get("/api/producers/map/", {"bbox": self.bbox, "zoom": 16})
+        self.assertEqual(response.data["clusters"], [])
+        points = {point["name"]: point for point in response.data["points"]}
+        self.assertEqual(len(points), 6)
+        self.assertEqual(points["Braga 0"]["categories"], ["queijos"])
+        self.assertEqual(points["Viana"]["categories"], [])
+
+    def test_clusters_are_capped_for_wide_viewports(self):
+        points = [(-60 + (i % 12) * 10, -170 + (i // 12) * 20) for i in range(12 * 17)]
+        Producer.objects.bulk_create(
+            [
+                Producer(
+                    name=f"Mundo {index}",
+                    latitude=latitude,
+                    longitude=longitude,
+                    grid_x=grid_cell(latitude, longitude)[0],
+                    grid_y=grid_cell(latitude, longitude)[1],
+                )
+                for index, (latitude, longitude) in enumerate(points)
+            ]
+        )
+        world = {"bbox": "-180,-90,180,90", "zoom": 13}
+        self.assertGreater(len(self.client.get("/api/producers/map/", world).data["clusters"]), 16)
+        with mock.patch("producer.maps.MAX_CLUSTERS", 16):
+            clusters = self.client.get("/api/producers/map/", world).data["clusters"]
+        self.assertLessEqual(len(clusters), 16)
+        self.assertEqual(sum(cluster["count"] for cluster in clusters), 12 * 17 + 7)
+
+    def test_grid_cell_follows_coordinate_updates(self):
+        producer = Producer.objects.get(name="Viana")
+        producer.latitude, producer.longitude = 38.7223, -9.1393
+        producer.save(update_fields=["latitude", "longitude"])
+        producer.refresh_from_db()
+        self.assertEqual((producer.grid_x, producer.grid_y), grid_cell(38.7223, -9.1393))
+
+    def test_invalid_params_are_rejected(self):
+        response = self.client.get("/api/producers/map/", {"zoom": 8})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get("/api/producers/map/", {"bbox": self.bbox, "zoom": 99})
+        self.assertEqual(response.status_code, 400)
+
+
+class ProducerSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.cheese = Category.objects.create(name="Queijos", slug="queijos")
+        self.quinta = Producer.objects.create(
+            name="Quinta do Requeijão",
+            description="Produção artesanal",
+            products=["Requeijão", "Queijo de Cabra"],
+        )
+        self.mel = Producer.objects.create(
+            name="Mel do Gerês", description="Mel biológico e requeijão às sextas"
+        )
+        Producer.objects.create(name="Vinhos Verdes")
+
+    def search(self, query):
+        response = self.client.get("/api/producers/", {"q": query})
+        self.assertEqual(response.status_code, 200)
+        return [result["name"] for result in response.data["results"]]
+
+    def test_search_is_accent_insensitive_and_ranks_name_first(self):
+        self.assertEqual(self.search("requeijao"), ["Quinta do Requeijão", "Mel do Gerês"])
+
+    def test_capped_results_are_flagged(self):
+        response = self.client.get("/api/producers/", {"q": "requeijao"})
+        self.assertIs(response.data["truncated"], False)
+        with mock.patch("producer.search.MAX_RESULTS", 1):
+            response = self.client.get("/api/producers/", {"q": "requeijao", "page_size": 5})
+        self.assertEqual(response.data["count"], 1)
+        self.assertEqual(response.data["results"][0]["name"], "Quinta do Requeijão")
+        self.assertIs(response.data["truncated"], True)
+        self.assertNotIn("truncated", self.client.get("/api/producers/").data)
+
+    def test_search_matches_products_and_prefixes(self):
+        self.assertEqual(self.search("cabr"), ["Quinta do Requeijão"])
+        self.assertEqual(self.search("nada"), [])
+
+    def test_index_follows_category_changes(self):
+        self.assertEqual(self.search("queijos"), [])
+        self.mel.categories.add(self.cheese)
+        self.assertEqual(self.search("queijos"), ["Mel do Gerês"])
+        self.cheese.name = "Lacticínios"
+        self.cheese.save()
+        self.assertEqual(self.search("lacticinios"), ["Mel do Gerês"])
+        self.cheese.delete()
+        self.assertEqual(self.search("lacticinios"), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.quinta.name = "Quinta da Serra"
+        self.quinta.products = []
+        self.quinta.save()
+        self.assertEqual(self.search("requeijao"), ["Mel do Gerês"])
+        self.mel.delete()
+        self.assertEqual(self.search("requeijao"), [])
+
+
+class ProductCatalogueTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.quinta = Producer.objects.create(
+            name="Quinta", products=["Queijo de Cabra", "Requeijão", "queijo de cabra"]
+        )
+        Producer.objects.create(name="Serra", products=["Requeijao"])
+        Producer.objects.create(name="Vinhas", products=["Vinho Verde"])
+
+    def test_json_products_are_normalized(self):
+        self.assertEqual(
+            list(self.quinta.catalogue.values_list("slug", flat=True).order_by("slug")),
+            ["queijo-de-cabra", "requeijao"],
+        )
+        self.assertEqual(Product.objects.count(), 3)
+
+    def test_filter_by_product(self):
+        response = self.client.get("/api/producers/", {"product": "Requeijão"})
+        self.assertEqual([r["name"] for r in response.data["results"]], ["Quinta", "Serra"])
+        self.assertEqual(response.data["results"][0]["products"][1], "Requeijão")
+
+    def test_product_list_counts_producers(self):
+        self.quinta.products = ["Requeijão"]
+        self.quinta.save()
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/products/")
+        counts = {p["slug"]: p["producer_count"] for p in response.data["results"]}
+        self.assertEqual(counts, {"requeijao": 2, "vinho-verde": 1})
+
+        Producer.objects.filter(name="Vinhas").update(is_active=False)
+        response = self.client.get("/api/products/")
+        counts = {p["slug"]: p["producer_count"] for p in response.data["results"]}
+        self.assertEqual(counts, {"requeijao": 2})
+
+
+class ProducerResponseCacheTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        get_cache().clear()
+        self.producer = create_producers(3)[0]
+
+    def test_repeated_list_is_served_from_cache(self):
+        first = self.client.get("/api/producers/", {"city": "Braga", "page": 1})
+        self.assertEqual(first["X-Cache"], "MISS")
+        with self.assertNumQueries(0):
+            second = self.client.get("/api/producers/", {"page": "1", "city": "Braga "})
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(second.data, first.data)
+        stats = self.client.get("/api/producers/cache-stats/").data
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_changes_invalidate_cached_responses(self):
+        url = f"/api/producers/{self.producer.pk}/"
+        self.client.get(url)
+        self.producer.name = "Novo nome"
+        self.producer.save()
+        response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["name"], "Novo nome")
+
+        self.client.get(url)
+        self.producer.gallery_images.first().delete()
+        self.assertEqual(len(self.client.get(url).data["gallery_images"]), 1)
+
+        self.client.get(url)
+        Category.objects.get(slug="mel").producer.remove(self.producer)
+        self.assertEqual(self.client.get(url).data["type_display"], "Queijos")
+
+    def test_errors_are_not_cached(self):
+        url = "/api/producers/00000000-0000-0000-0000-000000000000/"
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(get_cache().get(HITS_KEY), None)
+
+
+class ProducerConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.producer = create_producers(2)[0]
+
+    def test_list_not_modified(self):
+        response = self.client.get("/api/producers/", {"city": "Braga"})
+        self.assertIn("Last-Modified", response)
+        etag = response["ETag"]
+        # Validators are cached with the response
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/producers/", {"city": "Braga"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        get_cache().clear()
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/producers/", {"city": "Braga"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_if_modified_since_notices_deletes(self):
+        last_modified = self.client.get("/api/producers/")["Last-Modified"]
+        self.producer.delete()
+        # Deleted in a later second than the last update
+        DeletedProducer.objects.update(deleted_at=timezone.now() + timedelta(seconds=2))
+        response = self.client.get("/api/producers/", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 1)
+        response = self.client.get(
+            "/api/producers/", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_etag_changes_with_filters_and_deletes(self):
+        etag = self.client.get("/api/producers/")["ETag"]
+        self.assertNotEqual(self.client.get("/api/producers/", {"page_size": 1})["ETag"], etag)
+        Producer.objects.filter(pk=self.producer.pk).delete()
+        response = self.client.get("/api/producers/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_detail_if_modified_since(self):
+        url = f"/api/producers/{self.producer.pk}/"
+        last_modified = self.client.get(url)["Last-Modified"]
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_related_changes_update_validators(self):
+        url = f"/api/producers/{self.producer.pk}/"
+        etag = self.client.get(url)["ETag"]
+        self.producer.gallery_images.first().delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get(url)["ETag"]
+        Category.objects.filter(slug="mel").first().delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ProducerKeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        for index in range(7):
+            # Duplicate names exercise the id tie-breaker
+            Producer.objects.create(name=f"Produtor {index // 2}")
+
+    def test_cursor_walks_every_producer_once_in_order(self):
+        seen = []
+        params = {"pagination": "cursor", "page_size": 2}
+        url = "/api/producers/"
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("count", response.data)
+            seen.extend((r["name"], r["id"]) for r in response.data["results"])
+            url, params = response.data["next"], None
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(seen, sorted(seen))
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/producers/", {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_rejects_ranked_orderings(self):
+        response = self.client.get("/api/producers/", {"pagination": "cursor", "q": "produtor"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ProducerSparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        create_producers(3)
+
+    def get(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/producers/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.data["results"][0], ctx.captured_queries
+
+    def test_fields_selects_output_and_skips_unused_relations(self):
+        producer, queries = self.get(fields="id,name")
+        self.assertEqual(set(producer), {"id", "name"})
+        sql = " ".join(query["sql"] for query in queries)
+        self.assertNotIn("producer_producerimage", sql)
+        self.assertNotIn('"description"', sql)
+
+    def test_compact_view(self):
+        producer, queries = self.get(view="compact")
+        self.assertEqual(
+            set(producer),
+            {"id", "name", "categories", "address", "main_image", "main_image_srcset"},
+        )
+        self.assertEqual(producer["address"]["city"], "Braga")
+        self.assertEqual(len(producer["categories"]), 2)
+
+    def test_omit(self):
+        producer, _ = self.get(omit="gallery_images,main_image,description")
+        self.assertNotIn("gallery_images", producer)
+        self.assertNotIn("main_image", producer)
+        self.assertIn("type_display", producer)
+        producer, _ = self.get(view="compact", omit="address,main_image_srcset")
+        self.assertEqual(set(producer), {"id", "name", "categories", "main_image"})
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get("/api/producers/", {"fields": "name,secret"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get("/api/producers/", {"view": "tiny"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_writes_use_the_full_serializer(self):
+        response = self.client.post(
+            "/api/producers/?fields=id", {"name": "Novo"}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn("gallery_images", response.data)
+
+
+class ProducerReadSerializerParityTests(TestCase):
+    def setUp(self):
+        create_producers(2)
+        Producer.objects.create(
+            name="Completo",
+            description="Queijaria",
+            phone="912345678",
+            email="geral@quinta.pt",
+            website="https://quinta.pt",
+            street="Rua Direita",
+            number="12",
+            city="Ponte de Lima",
+            state="Viana do Castelo",
+            zip_code="4990-062",
+            latitude=41.7672,
+            longitude=-8.5836,
+            instagram="https://instagram.com/quinta",
+            main_image="producers/quinta.jpg",
+            products=["Queijo", "Requeijão"],
+        )
+        Producer.objects.create(name="Vazio", products=None)
+        self.request = APIRequestFactory().get("/api/producers/")
+
+    def render(self, serializer_class, queryset, **kwargs):
+        serializer = serializer_class(
+            queryset, many=True, context={"request": self.request}, **kwargs
+        )
+        return JSONRenderer().render(serializer.data)
+
+    def assertParity(self, queryset, **kwargs):
+        queryset = queryset.prefetch_related("categories", "gallery_images")
+        self.assertEqual(
+            self.render(ProducerReadSerializer, queryset, **kwargs),
+            self.render(ProducerSerializer, queryset, **kwargs),
+        )
+
+    def test_full_representation_is_identical(self):
+        self.assertParity(Producer.objects.all())
+
+    def test_sparse_and_annotated_representations_are_identical(self):
+        self.assertParity(Producer.objects.all(), fields=PRODUCER_VIEWS["compact"])
+        self.assertParity(Producer.objects.all(), fields=["name", "gallery_images"])
+        self.assertParity(filter_near(Producer.objects.all(), 41.77, -8.58, 10))
+
+
+def image_upload(name="foto.png", size=(1600, 900), mode="RGBA"):
+    buffer = BytesIO()
+    Image.new(mode, size, (200, 120, 40, 255)[: len(mode)]).save(buffer, "PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root, IMAGE_DERIVATIVES_ASYNC=False
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_upload_generates_resized_jpeg_and_webp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            producer = Producer.objects.create(name="Quinta", main_image=image_upload())
+        producer.refresh_from_db()
+        self.assertEqual(set(producer.derivatives["widths"]), {"320", "640", "1280"})
+        with default_storage.open(producer.derivatives["widths"]["320"]["webp"]) as handle:
+            self.assertEqual(Image.open(handle).size, (320, 180))
+
+        data = self.client.get(f"/api/producers/{producer.pk}/").data
+        self.assertRegex(data["main_image_srcset"]["webp"], r"__320w\.webp 320w, .+ 1280w$")
+        self.assertIn("/media/producers/derivatives/", data["main_image_srcset"]["jpeg"])
+
+    def test_small_gallery_image_keeps_its_width(self):
+        producer = Producer.objects.create(name="Quinta")
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProducerImage.objects.create(
+                producer=producer, image=image_upload(size=(200, 100), mode="RGB")
+            )
+        image.refresh_from_db()
+        self.assertEqual(list(image.derivatives["widths"]), ["200"])
+        gallery = self.client.get(f"/api/producers/{producer.pk}/").data["gallery_images"]
+        self.assertTrue(gallery[0]["srcset"]["jpeg"].endswith("__200w.jpg 200w"))
+
+    def test_unchanged_image_is_not_reprocessed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            producer = Producer.objects.create(name="Quinta", main_image=image_upload())
+        producer.refresh_from_db()
+        with self.captureOnCommitCallbacks() as callbacks:
+            producer.name = "Quinta Nova"
+            producer.save()
+        self.assertEqual(callbacks, [])
+
+    def test_backfill_command(self):
+        with self.captureOnCommitCallbacks():
+            producer = Producer.objects.create(name="Quinta", main_image=image_upload())
+        call_command("generate_image_derivatives", stdout=StringIO())
+        producer.refresh_from_db()
+        self.assertEqual(producer.derivatives["source"], producer.main_image.name)
+
+    def test_stale_job_does_not_overwrite_newer_image(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            producer = Producer.objects.create(name="Quinta", main_image=image_upload())
+        producer.refresh_from_db()
+        newer = producer.derivatives
+        build = images.build_derivatives
+
+        def replaced_meanwhile(file):
+            record = build(file)
+            Producer.objects.filter(pk=producer.pk).update(main_image="producers/outra.jpg")
+            return record
+
+        with mock.patch("producer.images.build_derivatives", side_effect=replaced_meanwhile):
+            self.assertFalse(images.refresh_derivatives(Producer, producer.pk, force=True))
+        producer.refresh_from_db()
+        self.assertEqual(producer.derivatives, newer)
+        for formats in newer["widths"].values():
+            self.assertTrue(all(default_storage.exists(name) for name in formats.values()))
+        derivatives_dir = Path(default_storage.path("producers/derivatives"))
+        self.assertEqual(len(list(derivatives_dir.iterdir())), 2 * len(newer["widths"]))
+
+
+class BulkImportExportTests(TestCase):
+    csv_data = (
+        "name,phone,email,city,latitude,longitude,products,categories\n"
+        "Quinta A,+351912345678,a@quinta.pt,Braga,41.55,-8.42,Queijo|Mel,queijos\n"
+        "Quinta B,123,nao-e-email,Braga,,,,\n"
+        "Quinta C,,,Guimarães,,,Requeijão,queijos|inexistente\n"
+        "Quinta D,,,Viana,,,,\n"
+    )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.cheese = Category.objects.create(name="Queijos", slug="queijos")
+
+    def test_csv_import_validates_rows_and_writes_in_chunks(self):
+        summary = bulk.import_producers(StringIO(self.csv_data), "csv", chunk_size=2)
+        self.assertEqual((summary["created"], summary["updated"]), (2, 0))
+        self.assertEqual([error["line"] for error in summary["errors"]], [3, 4])
+        self.assertEqual(set(summary["errors"][0]["errors"]), {"phone", "email"})
+
+        quinta = Producer.objects.get(name="Quinta A")
+        self.assertEqual(list(quinta.categories.all()), [self.cheese])
+        self.assertEqual((quinta.grid_x, quinta.grid_y), grid_cell(41.55, -8.42))
+        self.assertEqual(quinta.catalogue.count(), 2)
+        response = self.client.get("/api/producers/", {"q": "mel"})
+        self.assertEqual([r["name"] for r in response.data["results"]], ["Quinta A"])
+
+    def test_ndjson_import_updates_only_given_fields(self):
+        producer = Producer.objects.create(name="Quinta", city="Braga", description="Antiga")
+        lines = [
+            json.dumps({"id": str(producer.pk), "description": "Nova", "categories": ["queijos"]}),
+            json.dumps({"city": "Sem nome"}),
+            "{not json",
+        ]
+        summary = bulk.import_producers(StringIO("\n".join(lines)), "ndjson")
+        self.assertEqual((summary["created"], summary["updated"]), (0, 1))
+        self.assertEqual(len(summary["errors"]), 2)
+        producer.refresh_from_db()
+        self.assertEqual((producer.description, producer.city), ("Nova", "Braga"))
+        self.assertEqual(list(producer.categories.all()), [self.cheese])
+
+    def test_invalid_coordinates_blank_status_and_repeated_ids(self):
+        producer = Producer.objects.create(name="Quinta", is_active=True)
+        new_id = "7d3c1a52-8f0e-4b7a-9a55-0d7e1c3f2b61"
+        rows = (
+            "id,name,latitude,longitude,is_active\n"
+            ",Nan,nan,-8.4,\n"
+            ",Infinita,41.5,inf,\n"
+            ",Longe,400,-8.4,\n"
+            f"{producer.pk},Quinta,,,\n"
+            f"{new_id},Nova,,,\n"
+            f"{new_id},Nova outra vez,,,\n"
+        )
+        upload = SimpleUploadedFile("produtores.csv", rows.encode(), "text/csv")
+        response = self.client.post("/api/producers/import/", {"file": upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["created"], response.data["updated"]), (1, 1))
+        self.assertEqual(
+            [(error["line"], set(error["errors"])) for error in response.data["errors"]],
+            [(2, {"latitude"}), (3, {"longitude"}), (4, {"latitude"}), (7, {"id"})],
+        )
+        producer.refresh_from_db()
+        self.assertTrue(producer.is_active)
+        self.assertTrue(Producer.objects.get(pk=new_id).is_active)
+
+    def test_single_coordinate_updates(self):
+        producer = Producer.objects.create(name="Quinta", latitude=41.55, longitude=-8.42)
+        Producer.objects.filter(pk=producer.pk).update(geocode_source="city:braga")
+        rows = f'{{"id": "{producer.pk}", "latitude": 38.72}}'
+        summary = bulk.import_producers(StringIO(rows), "ndjson")
+        self.assertEqual(summary["updated"], 0)
+        self.assertEqual(
+            summary["errors"][0]["errors"], {"longitude": ["Indique a latitude e a longitude."]}
+        )
+
+        # Writers that start from the stored row may send one coordinate
+        producer = Producer.objects.get(pk=producer.pk)
+        producer.latitude = 38.72
+        bulk.save_producers([], [(producer, ["latitude"])])
+        producer.refresh_from_db()
+        self.assertEqual((producer.latitude, producer.longitude), (38.72, -8.42))
+        self.assertEqual((producer.grid_x, producer.grid_y), grid_cell(38.72, -8.42))
+        self.assertEqual(producer.geocode_source, "")
+
+    def test_api_import_and_streaming_export_round_trip(self):
+        upload = SimpleUploadedFile("produtores.csv", self.csv_data.encode(), "text/csv")
+        response = self.client.post("/api/producers/import/", {"file": upload})
+        self.assertEqual(response.data["created"], 2)
+
+        response = self.client.get("/api/producers/export/", {"file_format": "ndjson"})
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([row["name"] for row in rows], ["Quinta A", "Quinta D"])
+        self.assertEqual(rows[0]["categories"], ["queijos"])
+
+        response = self.client.get("/api/producers/export/", {"city": "braga"})
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[:2], ["id", "name"])
+        self.assertIn("Queijo|Mel", lines[1])
+        self.assertEqual(len(lines), 2)
+
+
+class ProducerBatchWriteTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.producer, self.other = create_producers(2)
+        self.cheese = Category.objects.get(slug="queijos")
+        self.images = list(self.producer.gallery_images.order_by("order"))
+
+    def post(self, operations):
+        return self.client.post(
+            "/api/producers/batch/", {"operations": operations}, format="json"
+        )
+
+    def test_batch_applies_every_operation(self):
+        response = self.post([
+            {"op": "create", "data": {"name": "Nova Quinta", "category_ids": [self.cheese.pk]}},
+            {
+                "op": "update",
+                "id": str(self.producer.pk),
+                "data": {
+                    "description": "Atualizada",
+                    "category_ids": [],
+                    "gallery_order": [self.images[1].pk, self.images[0].pk],
+                },
+            },
+            {"op": "delete", "id": str(self.other.pk)},
+        ])
+        self.assertEqual(response.status_code, 200)
+        statuses = [result["status"] for result in response.data["results"]]
+        self.assertEqual(statuses, ["created", "updated", "deleted"])
+
+        created = Producer.objects.get(pk=response.data["results"][0]["id"])
+        self.assertEqual(list(created.categories.all()), [self.cheese])
+        self.producer.refresh_from_db()
+        self.assertEqual(self.producer.description, "Atualizada")
+        self.assertEqual(self.producer.name, "Produtor 000")
+        self.assertEqual(self.producer.categories.count(), 0)
+        self.assertEqual(
+            list(self.producer.gallery_images.order_by("order").values_list("pk", flat=True)),
+            [self.images[1].pk, self.images[0].pk],
+        )
+        self.assertFalse(Producer.objects.filter(pk=self.other.pk).exists())
+
+    def test_invalid_operation_rejects_the_whole_batch(self):
+        response = self.post([
+            {"op": "update", "id": str(self.producer.pk), "data": {"name": "Mudado"}},
+            {"op": "create", "data": {"name": "X", "email": "invalido"}},
+            {"op": "update", "id": str(self.other.pk), "data": {"category_ids": [999]}},
+            {"op": "update", "id": str(self.other.pk), "data": {"gallery_order": [self.images[0].pk]}},
+            {"op": "delete", "id": "00000000-0000-0000-0000-000000000000"},
+            {"op": "merge"},
+        ])
+        self.assertEqual(response.status_code, 400)
+        results = response.data["results"]
+        self.assertEqual(results[0]["status"], "skipped")
+        self.assertIn("email", results[1]["errors"])
+        self.assertIn("category_ids", results[2]["errors"])
+        self.assertIn("id", results[3]["errors"])
+        self.assertIn("id", results[4]["errors"])
+        self.assertIn("op", results[5]["errors"])
+        self.producer.refresh_from_db()
+        self.assertEqual(self.producer.name, "Produtor 000")
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        def run(count):
+            operations = [
+                {"op": "create", "data": {"name": f"Lote {count}-{i}", "category_ids": [self.cheese.pk]}}
+                for i in range(count)
+            ]
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.post(operations).status_code, 200)
+            # The search index is refreshed with two statements per producer
+            return len(ctx.captured_queries) - 2 * count
+
+        self.assertEqual(run(2), run(10))
+
+
+class ProducerFacetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        get_cache().clear()
+        create_producers(3)
+        honey = Category.objects.get(slug="mel")
+        for name, city, state in [("Gerês", "Terras de Bouro", "Braga"), ("Lima", "Ponte de Lima", "")]:
+            Producer.objects.create(name=name, city=city, state=state).categories.add(honey)
+
+    def test_facets_count_current_filter_set(self):
+        with self.assertNumQueries(4):
+            data = self.client.get("/api/producers/facets/").data
+        self.assertEqual(data["total"], 5)
+        self.assertEqual(
+            [(c["slug"], c["count"]) for c in data["categories"]], [("mel", 5), ("queijos", 3)]
+        )
+        self.assertEqual(data["cities"][0], {"value": "Braga", "count": 3})
+        self.assertEqual(data["states"], [{"value": "Braga", "count": 1}])
+
+        data = self.client.get("/api/producers/facets/", {"category": "queijos"}).data
+        self.assertEqual(data["total"], 3)
+        self.assertEqual([c["count"] for c in data["categories"]], [3, 3])
+        self.assertEqual(data["cities"], [{"value": "Braga", "count": 3}])
+
+    def test_city_facet_groups_spellings(self):
+        Producer.objects.create(name="Minúsculas", city="braga ")
+        Producer.objects.create(name="Acentos", city="Ponte de Límá")
+        cities = self.client.get("/api/producers/facets/").data["cities"]
+        self.assertEqual([c["count"] for c in cities], [4, 2, 1])
+        self.assertEqual(cities[0]["value"].strip().lower(), "braga")
+
+    def test_facets_are_cached_per_filter_signature(self):
+        self.client.get("/api/producers/facets/", {"city": "ponte de lima", "page": 1})
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                "/api/producers/facets/", {"city": "ponte de lima", "page": 2}
+            )
+        self.assertEqual(response["X-Cache"], "HIT")
+        Producer.objects.create(name="Outro", city="Ponte de Lima")
+        self.assertEqual(
+            self.client.get("/api/producers/facets/", {"city": "ponte de lima"}).data["total"], 2
+        )
+
+
+class ProducerIndexedFilterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cheese = Category.objects.create(name="Queijos", slug="queijos")
+        honey = Category.objects.create(name="Mel", slug="mel")
+        wine = Category.objects.create(name="Vinho", slug="vinho")
+        both = Producer.objects.create(name="Ambos", city="Guimarães")
+        both.categories.set([cheese, honey])
+        Producer.objects.create(name="Queijaria", city="Braga").categories.add(cheese)
+        Producer.objects.create(name="Adega", city="braga ", is_active=False).categories.add(wine)
+
+    def names(self, **params):
+        response = self.client.get("/api/producers/", params)
+        self.assertEqual(response.status_code, 200)
+        return [result["name"] for result in response.data["results"]]
+
+    def test_multi_value_category_filter_has_no_duplicates(self):
+        self.assertEqual(self.names(category="queijos,mel"), ["Ambos", "Queijaria"])
+        self.assertEqual(self.names(category="Queijos"), ["Ambos", "Queijaria"])
+
+    def test_city_filter_is_accent_and_case_insensitive(self):
+        self.assertEqual(self.names(city="guimaraes"), ["Ambos"])
+        self.assertEqual(self.names(city="BRAGA,Guimarães"), ["Adega", "Ambos", "Queijaria"])
+
+    def test_is_active_filter(self):
+        self.assertEqual(self.names(is_active="false"), ["Adega"])
+        self.assertEqual(self.names(is_active="true", city="braga"), ["Queijaria"])
+        response = self.client.get("/api/producers/", {"is_active": "talvez"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_city_key_follows_partial_saves(self):
+        producer = Producer.objects.get(name="Ambos")
+        producer.city = "Póvoa de Lanhoso"
+        producer.save(update_fields=["city"])
+        self.assertEqual(self.names(city="povoa de lanhoso"), ["Ambos"])
+
+    def list_plan(self, **params):
+        """EXPLAIN of the page query the list view runs for ``params``"""
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get("/api/producers/", params).status_code, 200)
+        [sql] = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith('SELECT "producer_producer"."id"')
+            and " LIMIT " in query["sql"]
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return [row[-1] for row in cursor.fetchall()]
+
+    def test_filters_use_indexes(self):
+        plans = {
+            "city": self.list_plan(city="braga"),
+            "is_active": self.list_plan(is_active="true"),
+            "combined": self.list_plan(
+                city="braga,guimaraes", category="queijos", is_active="true"
+            ),
+            "category": self.list_plan(category="queijos,mel"),
+        }
+        for name, plan in plans.items():
+            producer_steps = [step for step in plan if " producer_producer " in f"{step} "]
+            self.assertTrue(producer_steps, name)
+            # No full scans of the producer table, whatever the filters
+            for step in producer_steps:
+                self.assertIn("USING", step, name)
+        self.assertIn(
+            "SEARCH producer_producer USING INDEX producer_city_key_name_idx (city_key=?)",
+            plans["city"],
+        )
+        self.assertIn(
+            "SCAN producer_producer USING INDEX producer_active_name_idx", plans["is_active"]
+        )
+        # Single-valued filters read the rows in name order; multi-valued ones
+        # only sort the rows they matched
+        sorts = [step for step in plans["city"] + plans["is_active"] if "TEMP B-TREE" in step]
+        self.assertEqual(sorts, [])
+        self.assertIn(
+            "SEARCH producer_producer USING INDEX producer_city_key_name_idx (city_key=?)",
+            plans["combined"],
+        )
+        for plan in (plans["combined"], plans["category"]):
+            self.assertTrue([step for step in plan if "(slug=?)" in step])
+            self.assertFalse([step for step in plan if step.startswith("SCAN U0")])
+
+
+@override_settings(
+    MIDDLEWARE=["producer.metrics.ProfilingMiddleware"], PROFILING_SLOWEST_REQUESTS=2
+)
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        create_producers(3)
+
+    def read_metrics(self, user=None, **headers):
+        request = RequestFactory().get("/api/_metrics", headers=headers)
+        request.user = user or AnonymousUser()
+        return metrics.metrics_view(request)
+
+    @override_settings(PROFILING_METRICS_TOKEN="segredo")
+    def test_metrics_are_private_and_only_mounted_when_enabled(self):
+        with self.assertRaises(Resolver404):
+            resolve("/api/_metrics")
+        self.assertEqual(self.read_metrics().status_code, 403)
+        self.assertEqual(self.read_metrics(authorization="Bearer outro").status_code, 403)
+        self.assertEqual(self.read_metrics(authorization="Bearer segredo").status_code, 200)
+        staff = User.objects.create_user("equipa", is_staff=True)
+        self.assertEqual(self.read_metrics(user=staff).status_code, 200)
+
+    async def test_profiles_async_views(self):
+        response = await self.async_client.get("/api/async/producers/")
+        self.assertEqual(response.status_code, 200)
+        [slowest] = metrics.registry.slowest_requests()
+        self.assertEqual(slowest["route"], "async-producer-list")
+        self.assertTrue(slowest["queries"])
+
+    def test_metrics_per_route(self):
+        self.client.get("/api/producers/")
+        self.client.get("/api/producers/")
+        self.client.get("/api/producers/facets/")
+        body = self.read_metrics(user=User(is_staff=True)).content.decode()
+
+        labels = 'method="GET",route="producer-list"'
+        self.assertIn(f'api_requests_total{{{labels},status="200"}} 2', body)
+        self.assertIn(f"api_request_duration_seconds_count{{{labels}}} 2", body)
+        self.assertIn(f'api_request_db_queries_bucket{{{labels},le="+Inf"}} 2', body)
+        self.assertIn(f"api_request_serializer_duration_seconds_count{{{labels}}} 2", body)
+        self.assertIn(f"api_response_size_bytes_sum{{{labels}}} ", body)
+        self.assertIn('route="producer-facets"', body)
+
+    def test_counts_queries_and_serializer_time(self):
+        profile = metrics.RequestProfile()
+        token = metrics._current.set(profile)
+        try:
+            ProducerSerializer(Producer.objects.all(), many=True).data
+        finally:
+            metrics._current.reset(token)
+        self.assertGreater(profile.serializer_time, 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/api/producers/", {"page": 2})
+        slowest = metrics.registry.slowest_requests()
+        self.assertEqual(len(slowest), 1)
+        self.assertEqual(len(slowest[0]["queries"]), len(queries))
+
+    def test_keeps_only_the_slowest_requests(self):
+        for _ in range(4):
+            self.client.get("/api/producers/")
+        durations = [entry["duration_ms"] for entry in metrics.registry.slowest_requests()]
+        self.assertEqual(len(durations), 2)
+        self.assertEqual(durations, sorted(durations, reverse=True))
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_synthetic_producers_are_in_minho(self):
+        ids = synthetic.generate_producers(30, categories=4, images=2, seed=1)
+        producers = Producer.objects.filter(pk__in=ids)
+        self.assertEqual(producers.count(), 30)
+        for producer in producers:
+            self.assertTrue(41.2 < producer.latitude < 42.2)
+            self.assertTrue(-8.95 < producer.longitude < -8.1)
+            self.assertIsNotNone(producer.grid_x)
+        self.assertEqual(ProducerImage.objects.filter(producer__in=producers).count(), 60)
+        self.assertEqual(Category.objects.count(), 4)
+        self.assertTrue(Product.objects.exists())
+        # Same seed, same data
+        names = sorted(producers.values_list("name", flat=True))
+        Producer.objects.all().delete()
+        synthetic.generate_producers(30, categories=4, images=2, seed=1)
+        self.assertEqual(sorted(Producer.objects.values_list("name", flat=True)), names)
+
+    def test_command_saves_and_compares_baseline(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        baseline = f"{directory}/baseline.json"
+        options = {"producers": 20, "requests": 3, "baseline": baseline, "stdout": StringIO()}
+
+        call_command("benchmark_api", save_baseline=True, **options)
+        with open(baseline) as handle:
+            scenarios = json.load(handle)["scenarios"]
+        self.assertEqual(
+            set(scenarios),
+            {"list", "list_compact", "list_cursor", "filter_category", "filter_city",
+             "search", "near", "detail", "create"},
+        )
+        self.assertGreater(scenarios["list"]["bytes"], scenarios["detail"]["bytes"])
+        self.assertFalse(Producer.objects.exists())
+
+        output = StringIO()
+        call_command("benchmark_api", max_regression=10_000, **{**options, "stdout": output})
+        self.assertIn("vs. baseline", output.getvalue())
+
+    def test_async_benchmark_command(self):
+        output = StringIO()
+        call_command(
+            "benchmark_async", producers=10, requests=4, concurrency="1,2", stdout=output
+        )
+        self.assertEqual(len(output.getvalue().splitlines()), 7)
+        self.assertFalse(Producer.objects.exists())
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}})
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        self.producers = create_producers(5, latitude=41.55, longitude=-8.42)
+
+    async def assert_same_response(self, path, params=None, async_path=None):
+        params = params or {}
+        expected = await sync_to_async(self.client.get)(f"/api/producers/{path}", params)
+        response = await self.async_client.get(f"/api/async/producers/{async_path or path}", params)
+        self.assertEqual(response.status_code, expected.status_code)
+        # Pagination links point at the async routes
+        content = response.content.decode().replace(
+            f"/api/async/producers/{async_path or ''}", "/api/producers/"
+        )
+        self.assertEqual(json.loads(content), expected.json())
+        return response
+
+    async def test_list_matches_sync_view(self):
+        await self.assert_same_response("")
+        await self.assert_same_response("", {"page_size": 2, "page": 2})
+        await self.assert_same_response("", {"view": "compact", "category": "mel"})
+        await self.assert_same_response("", {"near": "41.55,-8.42", "radius_km": 5})
+        response = await self.assert_same_response("", {"pagination": "cursor", "page_size": 2})
+        await self.assert_same_response("", {"cursor": response.json()["next"].split("cursor=")[1]})
+
+    async def test_search_and_detail_match_sync_view(self):
+        await self.assert_same_response("", {"q": "produtor 003"}, async_path="search/")
+        await self.assert_same_response(f"{self.producers[0].pk}/")
+        await self.assert_same_response(f"{self.producers[0].pk}/", {"fields": "id,name"})
+
+    async def test_errors_match_sync_view(self):
+        await self.assert_same_response("", {"page": 9})
+        await self.assert_same_response("", {"near": "norte"})
+        response = await self.async_client.get("/api/async/producers/00000000-0000-0000-0000-000000000000/")
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get("/api/async/producers/search/")
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.post("/api/async/producers/")
+        self.assertEqual(response.status_code, 405)
+
+
+class AsyncReadViewCacheTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.producer = create_producers(1)[0]
+
+    async def test_shares_cache_and_validators_with_sync_views(self):
+        path = f"/api/async/producers/{self.producer.pk}/"
+        first = await self.async_client.get(path)
+        self.assertEqual(first["X-Cache"], "MISS")
+        synced = await sync_to_async(self.client.get)(f"/api/producers/{self.producer.pk}/")
+        self.assertEqual(synced["X-Cache"], "HIT")
+        self.assertEqual(synced["ETag"], first["ETag"])
+        not_modified = await self.async_client.get(path, headers={"if-none-match": first["ETag"]})
+        self.assertEqual(not_modified.status_code, 304)
+
+
+@override_settings(
+    DATABASE_REPLICAS=["replica"],
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+)
+class ReplicaRoutingTests(TransactionTestCase):
+    """A second SQLite file stands in for a replica that has not caught up"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        primary = connections["default"]
+        replica = primary.__class__(
+            {**primary.settings_dict, "NAME": f"{directory}/replica.sqlite3"}, alias="replica"
+        )
+        # Start the replica as a snapshot of the primary's schema
+        primary.ensure_connection()
+        replica.ensure_connection()
+        primary.connection.backup(replica.connection)
+        connections["replica"] = replica
+        self.addCleanup(self.remove_replica)
+
+    def remove_replica(self):
+        connections["replica"].close()
+        del connections["replica"]
+
+    def names(self, path="/api/producers/"):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return [producer["name"] for producer in response.json()["results"]]
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        response = self.client.post(
+            "/api/producers/", {"name": "Primário"}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Producer.objects.filter(name="Primário").exists())
+        self.assertEqual(self.names(), [])
+        detail = self.client.get(f"/api/producers/{response.json()['id']}/")
+        self.assertEqual(detail.status_code, 404)
+
+        Producer.objects.using("replica").bulk_create([Producer(name="Réplica")])
+        self.assertEqual(self.names(), ["Réplica"])
+
+        # Reads made while handling a write stay on the primary
+        producer_id = response.json()["id"]
+        response = self.client.patch(
+            f"/api/producers/{producer_id}/",
+            {"description": "Queijos"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Producer.objects.get(pk=producer_id).description, "Queijos")
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+        DATABASE_REPLICA_LAG_SECONDS=5,
+    )
+    def test_reads_after_a_write_use_primary_and_cache_fresh_data(self):
+        get_cache().clear()
+        response = self.client.post(
+            "/api/producers/", {"name": "Primário"}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 201)
+        first = self.client.get("/api/producers/")
+        self.assertEqual(first["X-Cache"], "MISS")
+        self.assertEqual([p["name"] for p in first.json()["results"]], ["Primário"])
+
+        # Once the lag window is over, reads go back to the (still empty) replica,
+        # but the cached list holds the primary's data
+        get_cache().delete(WRITTEN_KEY)
+        cached = self.client.get("/api/producers/")
+        self.assertEqual(cached["X-Cache"], "HIT")
+        self.assertEqual([p["name"] for p in cached.json()["results"]], ["Primário"])
+        detail = self.client.get(f"/api/producers/{response.json()['id']}/")
+        self.assertEqual(detail.status_code, 404)
+
+    def test_other_reads_use_primary(self):
+        Producer.objects.create(name="Primário")
+        self.assertEqual(Producer.objects.all().db, "default")
+        self.assertEqual(Producer.objects.get().name, "Primário")
+
+
+class SQLiteTuningTests(SimpleTestCase):
+    """Concurrent read-then-write transactions on a file database"""
+
+    alias = "contention"
+    writers = 4
+    iterations = 10
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = f"{directory}/contention.sqlite3"
+
+    def run_workers(self, options):
+        settings_dict = {**connections["default"].settings_dict, "NAME": self.path, "OPTIONS": options}
+        wrapper_class = connections["default"].__class__
+        setup = wrapper_class(settings_dict, alias=self.alias)
+        with setup.cursor() as cursor:
+            cursor.execute("CREATE TABLE counter (id INTEGER PRIMARY KEY, worker INTEGER)")
+        setup.close()
+
+        errors = []
+        start = threading.Barrier(self.writers + 1)
+
+        def work(index):
+            connections[self.alias] = wrapper_class(settings_dict, alias=self.alias)
+            start.wait()
+            try:
+                for _ in range(self.iterations):
+                    try:
+                        if index == self.writers:  # reader, outside a transaction
+                            with connections[self.alias].cursor() as cursor:
+                                cursor.execute("SELECT COUNT(*) FROM counter")
+                            time.sleep(0.001)
+                            continue
+                        with transaction.atomic(using=self.alias):
+                            with connections[self.alias].cursor() as cursor:
+                                cursor.execute("SELECT COUNT(*) FROM counter")
+                                time.sleep(0.002)
+                                cursor.execute("INSERT INTO counter (worker) VALUES (%s)", [index])
+                    except OperationalError as exc:
+                        errors.append(str(exc))
+            finally:
+                connections[self.alias].close()
+                del connections[self.alias]
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(self.writers + 1)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        check = wrapper_class(settings_dict, alias=self.alias)
+        with check.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM counter")
+            rows = cursor.fetchone()[0]
+            cursor.execute("PRAGMA journal_mode")
+            journal_mode = cursor.fetchone()[0]
+        check.close()
+        return errors, rows, journal_mode
+
+    @override_settings(SQLITE_PRAGMAS={})
+    def test_default_settings_hit_lock_errors(self):
+        errors, rows, journal_mode = self.run_workers({})
+        self.assertEqual(journal_mode, "delete")
+        self.assertTrue(errors)
+        self.assertIn("database is locked", errors[0])
+        self.assertLess(rows, self.writers * self.iterations)
+
+    def test_tuned_profile_has_no_lock_errors(self):
+        errors, rows, journal_mode = self.run_workers({"transaction_mode": "IMMEDIATE"})
+        self.assertEqual(errors, [])
+        self.assertEqual(journal_mode, "wal")
+        self.assertEqual(rows, self.writers * self.iterations)
+
+    def test_writes_are_serialised_and_reads_are_not(self):
+        active = {"POST": 0, "GET": 0}
+        peak = {"POST": 0, "GET": 0}
+        lock = threading.Lock()
+
+        def get_response(request):
+            with lock:
+                active[request.method] += 1
+                peak[request.method] = max(peak[request.method], active[request.method])
+            time.sleep(0.01)
+            with lock:
+                active[request.method] -= 1
+            return HttpResponse()
+
+        middleware = SerializedWritesMiddleware(get_response)
+        factory = RequestFactory()
+        requests = [factory.post("/api/producers/") for _ in range(4)]
+        requests += [factory.get("/api/producers/") for _ in range(4)]
+        threads = [threading.Thread(target=middleware, args=(request,)) for request in requests]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(peak["POST"], 1)
+        self.assertGreater(peak["GET"], 1)
+
+    def test_async_writes_are_serialised(self):
+        active = {"POST": 0, "GET": 0}
+        peak = {"POST": 0, "GET": 0}
+
+        async def get_response(request):
+            active[request.method] += 1
+            peak[request.method] = max(peak[request.method], active[request.method])
+            await asyncio.sleep(0.01)
+            active[request.method] -= 1
+            return HttpResponse()
+
+        async def run():
+            middleware = SerializedWritesMiddleware(get_response)
+            factory = RequestFactory()
+            requests = [factory.post("/api/producers/") for _ in range(4)]
+            requests += [factory.get("/api/async/producers/") for _ in range(4)]
+            await asyncio.gather(*(middleware(request) for request in requests))
+
+        asyncio.run(run())
+        self.assertEqual(peak["POST"], 1)
+        self.assertGreater(peak["GET"], 1)
+
+
+class ProducerAdminTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser("admin", "admin@example.pt", "segredo")
+        self.client.force_login(self.user)
+        get_cache().clear()
+
+    def count_queries(self, path):
+        # Warm the session and the cached filter values
+        self.client.get(path)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        create_producers(3)
+        few = self.count_queries("/admin/producer/producer/")
+        create_producers(20)
+        get_cache().clear()
+        self.assertEqual(self.count_queries("/admin/producer/producer/"), few)
+        # No DISTINCT scans for the city/state filters once cached
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/admin/producer/producer/", {"city": "braga"})
+        self.assertFalse([q for q in queries if "DISTINCT" in q["sql"]])
+
+    def test_city_filter_uses_normalized_key(self):
+        create_producers(2)
+        Producer.objects.create(name="Vinha", city="Guimarães")
+        response = self.client.get("/admin/producer/producer/", {"city": "guimaraes"})
+        self.assertEqual(response.context["cl"].result_count, 1)
+        self.assertContains(response, "Guimarães")
+
+    def test_change_form_queries_do_not_grow_with_categories(self):
+        producer = create_producers(1)[0]
+        path = f"/admin/producer/producer/{producer.pk}/change/"
+        few = self.count_queries(path)
+        producer.categories.add(*[
+            Category.objects.create(name=f"Categoria {i}", slug=f"categoria-{i}") for i in range(10)
+        ])
+        self.assertEqual(self.count_queries(path), few)
+
+    def test_change_form_saves_categories(self):
+        cheese = Category.objects.create(name="Queijos", slug="queijos")
+        response = self.client.post(
+            "/admin/producer/producer/add/",
+            {
+                "name": "Queijaria",
+                "categories": [cheese.pk],
+                "products": "[]",
+                "is_active": "on",
+                "city": "Braga",
+                "state": "Braga",
+                "gallery_images-TOTAL_FORMS": "0",
+                "gallery_images-INITIAL_FORMS": "0",
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(list(Producer.objects.get().categories.all()), [cheese])
+
+    def test_estimated_count_on_large_tables(self):
+        paginator = EstimatedCountPaginator(Producer.objects.order_by("name"), 25)
+        with mock.patch("producer.pagination.estimated_row_count", return_value=50_000):
+            self.assertEqual(paginator.count, 50_000)
+            filtered = EstimatedCountPaginator(Producer.objects.filter(city="Braga"), 25)
+            self.assertEqual(filtered.count, 0)
+        create_producers(2)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.assertEqual(estimated_row_count(Producer), 2)
+
+
+@override_settings(JOBS_CHUNK_SIZE=2)
+class BackgroundJobTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser("admin", "admin@example.pt", "segredo")
+        self.client.force_login(self.user)
+        self.producers = create_producers(5)
+        export_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, export_root)
+        settings_override = override_settings(JOBS_EXPORT_ROOT=export_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def run_action(self, action, producers):
+        return self.client.post(
+            "/admin/producer/producer/",
+            {"action": action, "_selected_action": [str(p.pk) for p in producers]},
+            follow=True,
+        )
+
+    def test_small_selection_runs_in_request(self):
+        generation = get_cache().get("producer:generation")
+        response = self.run_action("deactivate_producers", self.producers[:3])
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.processed, job.total), (Job.Status.DONE, 3, 3))
+        self.assertEqual(Producer.objects.filter(is_active=False).count(), 3)
+        self.assertNotEqual(get_cache().get("producer:generation"), generation)
+        self.assertContains(response, "concluída para 3 produtores")
+
+    @override_settings(JOBS_INLINE_LIMIT=1)
+    def test_large_selection_is_queued_and_processed_in_chunks(self):
+        response = self.run_action("export_selection", self.producers)
+        self.assertContains(response, "em fila para 5 produtores")
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.Status.PENDING)
+
+        claimed = jobs.claim_next()
+        self.assertEqual(claimed, job)
+        self.assertFalse(jobs.claim(job.pk))
+        progress = []
+
+        def save(job, **kwargs):
+            progress.append(job.processed)
+            Model.save(job, **kwargs)
+
+        with mock.patch.object(Job, "save", autospec=True, side_effect=save):
+            jobs.run_job(claimed)
+        self.assertEqual(progress, [2, 4, 5, 5])
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.DONE)
+        with jobs.get_export_storage().open(job.result["file"]) as handle:
+            rows = list(csv.DictReader(TextIOWrapper(handle, encoding="utf-8")))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]["categories"], "mel|queijos")
+
+        change = self.client.get(f"/admin/producer/job/{job.pk}/change/")
+        self.assertContains(change, '<progress value="5" max="5"></progress>')
+        download_url = f"/admin/producer/job/{job.pk}/download/"
+        self.assertContains(change, download_url)
+        download = self.client.get(download_url)
+        self.assertEqual(download.status_code, 200)
+        self.assertIn("attachment", download["Content-Disposition"])
+        self.assertEqual(b"".join(download.streaming_content).count(b"\n"), 6)
+        download.close()
+        self.client.logout()
+        self.assertEqual(self.client.get(download_url).status_code, 302)
+
+    def test_only_jobs_without_progress_are_requeued(self):
+        stale = jobs.enqueue(Job.Kind.REINDEX, [p.pk for p in self.producers])
+        working = jobs.enqueue(Job.Kind.REINDEX, [p.pk for p in self.producers])
+        self.assertTrue(jobs.claim(stale.pk) and jobs.claim(working.pk))
+        long_ago = timezone.now() - timedelta(hours=2)
+        Job.objects.filter(pk=stale.pk).update(started_at=long_ago, updated_at=long_ago)
+        # A long job that still reports progress is left alone
+        Job.objects.filter(pk=working.pk).update(started_at=long_ago)
+        self.assertEqual(jobs.requeue_stale(timezone.now() - timedelta(minutes=30)), 1)
+        stale.refresh_from_db()
+        working.refresh_from_db()
+        self.assertEqual((stale.status, working.status), (Job.Status.PENDING, Job.Status.RUNNING))
+
+    def test_images_are_processed_outside_transactions(self):
+        depth = len(connection.atomic_blocks)
+        depths = []
+
+        def build(file):
+            depths.append(len(connection.atomic_blocks))
+            return {"source": file.name, "widths": {}}
+
+        job = jobs.enqueue(Job.Kind.REGENERATE_IMAGES, [p.pk for p in self.producers[:2]])
+        with mock.patch("producer.images.build_derivatives", side_effect=build):
+            jobs.run_inline(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.DONE)
+        # Two producers with two gallery images each, plus their (empty) main images
+        self.assertEqual(depths, [depth] * 6)
+
+    def test_failed_job_records_error(self):
+        def fail(job, ids):
+            raise RuntimeError("sem ligação")
+
+        job = jobs.enqueue(Job.Kind.REINDEX, [p.pk for p in self.producers])
+        with mock.patch.dict(jobs.HANDLERS, {Job.Kind.REINDEX: (fail, None)}):
+            with self.assertLogs("producer.jobs", "ERROR"):
+                jobs.run_inline(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertEqual(job.error, "RuntimeError: sem ligação")
+
+
+class JobWorkerCommandTests(TransactionTestCase):
+    def test_worker_processes_pending_jobs(self):
+        producers = create_producers(3)
+        jobs.enqueue(Job.Kind.DEACTIVATE, [p.pk for p in producers])
+        jobs.enqueue(Job.Kind.REINDEX, [p.pk for p in producers])
+        out = StringIO()
+        call_command("run_jobs", once=True, workers=2, stdout=out)
+        self.assertEqual(
+            list(Job.objects.values_list("status", "processed")), [(Job.Status.DONE, 3)] * 2
+        )
+        self.assertFalse(Producer.objects.filter(is_active=True).exists())
+        self.assertIn("Concluída", out.getvalue())
+
+
+GAZETTEER = """postal_code,city,district,latitude,longitude
+4700-123,Braga,Braga,41.55,-8.42
+4700-456,Braga,Braga,41.57,-8.40
+4900-001,Viana do Castelo,Viana do Castelo,41.69,-8.83
+,Guimarães,Braga,41.44,-8.29
+4800-010,Guimarães,Braga,41.45,-8.30
+4800-abc,Guimarães,Braga,41.45,-8.30
+"""
+
+
+class GeocodingTests(TestCase):
+    def setUp(self):
+        self.addCleanup(geocoding.clear_memo)
+        self.summary = geocoding.load_gazetteer(StringIO(GAZETTEER))
+
+    def test_load_gazetteer_builds_lookup_table(self):
+        self.assertEqual(
+            (self.summary["postal_code"], self.summary["postal_area"], self.summary["city"]),
+            (4, 3, 3),
+        )
+        self.assertEqual([error["line"] for error in self.summary["errors"]], [7])
+        self.assertEqual(
+            Place.objects.get(kind=Place.Kind.POSTAL_AREA, key="4700").latitude, 41.56
+        )
+
+    def test_lookup_prefers_the_most_precise_place(self):
+        self.assertEqual(
+            geocoding.lookup("4700-456", "Braga"), (41.57, -8.40, "postal_code:4700-456")
+        )
+        self.assertEqual(geocoding.lookup("4700 999", ""), (41.56, -8.41, "postal_area:4700"))
+        # An explicit city centre wins over the mean of its postal codes
+        self.assertEqual(geocoding.lookup(None, " guimaraes "), (41.44, -8.29, "city:guimaraes"))
+        self.assertIsNone(geocoding.lookup("9999-999", "Lisboa"))
+
+    def test_lookups_are_memoized_until_the_gazetteer_changes(self):
+        geocoding.lookup("4910-000", "Caminha")
+        # Only the version is read
+        with self.assertNumQueries(1):
+            self.assertIsNone(geocoding.lookup("4910-000", "Caminha"))
+        version = geocoding.get_version()
+        with self.assertNumQueries(0):
+            self.assertIsNone(geocoding.lookup("4910-000", "Caminha", version))
+
+        # Another process reloading the gazetteer leaves this memo in place
+        with mock.patch.object(geocoding, "clear_memo"):
+            geocoding.load_gazetteer(StringIO(GAZETTEER + "4910-000,Caminha,,41.87,-8.84\n"))
+        self.assertEqual(geocoding.lookup("4910-000", "Caminha").source, "postal_code:4910-000")
+
+    def test_save_fills_missing_coordinates(self):
+        producer = Producer.objects.create(name="Quinta", zip_code="4700-123", city="Braga")
+        self.assertEqual((producer.latitude, producer.longitude), (41.55, -8.42))
+        self.assertEqual(producer.geocode_source, "postal_code:4700-123")
+        self.assertIsNotNone(producer.grid_x)
+
+        producer.zip_code = "4900-001"
+        producer.save(update_fields=["zip_code"])
+        producer.refresh_from_db()
+        self.assertEqual((producer.latitude, producer.geocode_source), (41.69, "postal_code:4900-001"))
+
+    def test_coordinates_entered_by_hand_are_kept(self):
+        producer = Producer.objects.create(
+            name="Quinta", zip_code="4700-123", city="Braga", latitude=41.6, longitude=-8.5
+        )
+        producer.zip_code = "4900-001"
+        producer.save()
+        self.assertEqual((producer.latitude, producer.geocode_source), (41.6, ""))
+
+    def test_moving_off_the_gazetteer_clears_geocoded_coordinates(self):
+        producer = Producer.objects.create(name="Quinta", zip_code="4700-123", city="Braga")
+        producer.zip_code, producer.city = "8000-001", "Faro"
+        producer.save()
+        producer.refresh_from_db()
+        self.assertEqual((producer.latitude, producer.longitude), (None, None))
+        self.assertEqual((producer.geocode_source, producer.grid_x), ("", None))
+
+        other = Producer.objects.create(name="Outra", zip_code="4700-123", city="Braga")
+        Producer.objects.filter(pk=other.pk).update(zip_code="8000-001", city="Faro")
+        summary = geocoding.geocode_producers(Producer.objects.filter(pk=other.pk), refresh=True)
+        self.assertEqual(summary, {"geocoded": 0, "unresolved": 1})
+        other.refresh_from_db()
+        self.assertEqual((other.latitude, other.geocode_source), (None, ""))
+
+    def test_coordinates_typed_over_geocoded_ones_are_kept(self):
+        producer = Producer.objects.create(name="Quinta", zip_code="4700-123", city="Braga")
+        producer = Producer.objects.get(pk=producer.pk)
+        producer.latitude, producer.longitude = 41.6, -8.5
+        producer.save()
+        producer.refresh_from_db()
+        self.assertEqual((producer.latitude, producer.longitude), (41.6, -8.5))
+        self.assertEqual(producer.geocode_source, "")
+
+        other = Producer.objects.create(name="Outra", zip_code="4700-123", city="Braga")
+        other.latitude = 41.7
+        other.save(update_fields=["latitude"])
+        other.refresh_from_db()
+        self.assertEqual((other.latitude, other.geocode_source), (41.7, ""))
+
+        user = User.objects.create_superuser("admin", "admin@example.pt", "segredo")
+        self.client.force_login(user)
+        form = Producer.objects.create(name="Form", zip_code="4700-123", city="Braga")
+        response = self.client.post(
+            f"/admin/producer/producer/{form.pk}/change/",
+            {
+                "name": "Form",
+                "zip_code": "4700-123",
+                "city": "Braga",
+                "latitude": "41.8",
+                "longitude": "-8.3",
+                "products": "[]",
+                "is_active": "on",
+                "gallery_images-TOTAL_FORMS": "0",
+                "gallery_images-INITIAL_FORMS": "0",
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        form.refresh_from_db()
+        self.assertEqual((form.latitude, form.geocode_source), (41.8, ""))
+
+    def test_command_fills_coordinates_in_bulk(self):
+        Producer.objects.bulk_create(
+            [
+                Producer(name="A", zip_code="4700-123", city="Braga"),
+                Producer(name="B", city="Viana do Castelo"),
+                Producer(name="C", city="Lisboa"),
+                Producer(name="D", zip_code="4800-010", latitude=1.0, longitude=2.0),
+            ]
+        )
+        out = StringIO()
+        call_command("geocode_producers", batch_size=1, stdout=out)
+        self.assertIn("2 produtores localizados, 1 sem correspondência", out.getvalue())
+        coordinates = dict(Producer.objects.values_list("name", "latitude"))
+        self.assertEqual(coordinates, {"A": 41.55, "B": 41.69, "C": None, "D": 1.0})
+        self.assertIsNotNone(Producer.objects.get(name="B").grid_x)
+
+    def test_bulk_import_geocodes_new_and_moved_producers(self):
+        moved = Producer.objects.create(name="Mudou", zip_code="4700-123", city="Braga")
+        rows = (
+            "id,name,zip_code,city,latitude,longitude\n"
+            ",Nova,4800-010,Guimarães,,\n"
+            ",Manual,4800-010,Guimarães,40.0,-8.0\n"
+            f"{moved.pk},Mudou,4900-001,Viana do Castelo,,\n"
+        )
+        summary = bulk.import_producers(StringIO(rows), "csv")
+        self.assertEqual(summary["errors"], [])
+        producers = {
+            name: (latitude, source)
+            for name, latitude, source in Producer.objects.values_list(
+                "name", "latitude", "geocode_source"
+            )
+        }
+        self.assertEqual(producers["Nova"], (41.45, "postal_code:4800-010"))
+        self.assertEqual(producers["Manual"], (40.0, ""))
+        self.assertEqual(producers["Mudou"], (41.69, "postal_code:4900-001"))
+
+    def test_admin_action_geocodes_selection(self):
+        user = User.objects.create_superuser("admin", "admin@example.pt", "segredo")
+        self.client.force_login(user)
+        producer = Producer.objects.create(name="Quinta", city="Lisboa")
+        Producer.objects.filter(pk=producer.pk).update(zip_code="4700-456")
+        self.client.post(
+            "/admin/producer/producer/",
+            {"action": "geocode_producers", "_selected_action": [str(producer.pk)]},
+        )
+        job = Job.objects.get()
+        self.assertEqual(job.result, {"geocoded": 1, "unresolved": 0})
+        producer.refresh_from_db()
+        self.assertEqual(producer.latitude, 41.57)
+
+
+@override_settings(PRODUCER_CHANGES_SETTLE_SECONDS=0)
+class ChangesFeedTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.producers = create_producers(3)
+
+    def sync(self, since=None, **params):
+        """Follow the feed to the end, returning the changes and final token"""
+        results = []
+        while True:
+            if since:
+                params["since"] = since
+            response = self.client.get("/api/producers/changes/", params)
+            self.assertEqual(response.status_code, 200)
+            results.extend(response.data["results"])
+            since = response.data["next"]
+            if not response.data["has_more"]:
+                return results, since
+
+    def test_initial_sync_lists_active_producers_in_pages(self):
+        Producer.objects.filter(pk=self.producers[0].pk).update(is_active=False)
+        results, token = self.sync(page_size=1)
+        self.assertEqual([entry["action"] for entry in results], ["upsert", "upsert"])
+        self.assertEqual(
+            {entry["producer"]["id"] for entry in results},
+            {str(p.pk) for p in self.producers[1:]},
+        )
+        self.assertEqual(results[0]["producer"]["categories"][0]["slug"], "mel")
+        self.assertEqual(self.sync(token), ([], token))
+
+    def test_delta_reports_updates_and_tombstones(self):
+        _, token = self.sync()
+        edited, deactivated, deleted = self.producers
+        deleted_pk = deleted.pk
+        edited.description = "Novo"
+        edited.save()
+        jobs.set_active(None, [deactivated.pk], False)
+        deleted.delete()
+
+        with self.assertNumQueries(5):
+            response = self.client.get("/api/producers/changes/", {"since": token})
+        results = response.data["results"]
+        self.assertEqual(
+            [(entry["id"], entry["action"], entry.get("reason")) for entry in results],
+            [
+                (str(edited.pk), "upsert", None),
+                (str(deactivated.pk), "delete", "inactive"),
+                (str(deleted_pk), "delete", "deleted"),
+            ],
+        )
+        self.assertEqual(results[0]["producer"]["description"], "Novo")
+        self.assertFalse(response.data["has_more"])
+
+    def test_category_and_gallery_changes_are_reported(self):
+        _, token = self.sync()
+        Category.objects.filter(slug="mel").get().delete()
+        ProducerImage.objects.filter(producer=self.producers[0]).first().delete()
+        results, _ = self.sync(token, fields="id,categories")
+        self.assertEqual(len(results), 3)
+        self.assertEqual(
+            [category["slug"] for category in results[0]["producer"]["categories"]],
+            ["queijos"],
+        )
+        self.assertEqual(set(results[0]["producer"]), {"id", "categories"})
+
+    def test_recent_changes_are_held_back(self):
+        _, token = self.sync()
+        self.producers[0].save()
+        with override_settings(PRODUCER_CHANGES_SETTLE_SECONDS=60):
+            self.assertEqual(self.sync(token), ([], token))
+        self.assertEqual(len(self.sync(token)[0]), 1)
+
+    def test_long_transactions_are_stamped_on_commit(self):
+        edited, deleted, _ = self.producers
+        deleted_pk = deleted.pk
+        started = timezone.now() - timedelta(minutes=10)
+        with self.captureOnCommitCallbacks(execute=True):
+            edited.description = "Novo"
+            bulk.save_producers([], [(edited, ["description"])])
+            deleted.delete()
+            # Stamped when written, at the start of a transaction that took minutes
+            Producer.objects.filter(pk=edited.pk).update(updated_at=started)
+            DeletedProducer.objects.filter(producer_id=deleted_pk).update(deleted_at=started)
+            # A client reading meanwhile moves past those stamps
+            _, token = self.sync()
+        results, _ = self.sync(token)
+        self.assertEqual(
+            {(entry["id"], entry["action"]) for entry in results},
+            {(str(edited.pk), "upsert"), (str(deleted_pk), "delete")},
+        )
+
+    def test_invalid_token(self):
+        response = self.client.get("/api/producers/changes/", {"since": "nao-e-token"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("since", response.data)
+
+
+@override_settings(PRODUCER_CHANGES_SETTLE_SECONDS=0)
+class SnapshotTests(TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+        self.producers = create_producers(3)
+
+    def build(self, **options):
+        options.setdefault("base_url", "http://testserver")
+        return snapshot.build_snapshot(root=self.root, **options)
+
+    def read(self, version, name):
+        with gzip.open(self.root / version / f"{name}.gz") as handle:
+            return json.load(handle)
+
+    def test_full_snapshot_matches_the_api(self):
+        summary = self.build(page_size=2)
+        version = summary["version"]
+        self.assertTrue(summary["full"])
+        self.assertEqual((self.root / "CURRENT").read_text(), version)
+
+        producer = self.producers[0]
+        detail = self.client.get(f"/api/producers/{producer.pk}/").json()
+        self.assertEqual(self.read(version, f"producers/{producer.pk}.json"), detail)
+        self.assertEqual(
+            json.loads((self.root / version / f"producers/{producer.pk}.json").read_bytes()),
+            detail,
+        )
+
+        first = self.read(version, "lists/all/1.json")
+        self.assertEqual((first["count"], first["next"], first["previous"]), (3, "2.json", None))
+        api_page = self.client.get("/api/producers/", {"page_size": 2}).json()
+        self.assertEqual(first["results"], api_page["results"])
+        self.assertEqual(len(self.read(version, "lists/category/mel/2.json")["results"]), 1)
+        self.assertEqual(self.read(version, "lists/city/braga/1.json")["count"], 3)
+        index = self.read(version, "index.json")
+        self.assertEqual(
+            [(category["slug"], category["count"]) for category in index["categories"]],
+            [("mel", 3), ("queijos", 3)],
+        )
+        self.assertEqual(index["cities"][0]["list"], "lists/city/braga/1.json")
+
+    def test_incremental_run_renders_only_affected_files(self):
+        first = self.build()["version"]
+        self.assertEqual(self.build(), {
+            "version": first, "full": False, "changes": 0, "written": 0, "removed": 0
+        })
+
+        edited, untouched, _ = self.producers
+        edited.description = "Queijo curado"
+        edited.save()
+        summary = self.build()
+        second = summary["version"]
+        # Its detail and the four lists it is in (all, two categories, city)
+        self.assertEqual((summary["changes"], summary["written"]), (1, 5))
+        self.assertEqual(
+            self.read(second, f"producers/{edited.pk}.json")["description"], "Queijo curado"
+        )
+        self.assertNotEqual(
+            self.read(first, f"producers/{edited.pk}.json")["description"], "Queijo curado"
+        )
+        unchanged = f"producers/{untouched.pk}.json.gz"
+        self.assertEqual(
+            (self.root / first / unchanged).stat().st_ino,
+            (self.root / second / unchanged).stat().st_ino,
+        )
+
+    def test_deleted_and_deactivated_producers_are_removed(self):
+        self.build(page_size=2)
+        deleted, deactivated, kept = self.producers
+        deleted_pk = deleted.pk
+        deleted.delete()
+        jobs.set_active(None, [deactivated.pk], False)
+        Category.objects.get(slug="mel").producer.remove(kept)
+        kept.save()
+
+        summary = self.build(page_size=2)
+        version = summary["version"]
+        self.assertEqual(summary["changes"], 3)
+        files = {
+            str(path.relative_to(self.root / version))
+            for path in (self.root / version).rglob("*.json")
+        }
+        self.assertEqual(
+            files,
+            {
+                "index.json",
+                "manifest.json",
+                "lists/all/1.json",
+                "lists/category/queijos/1.json",
+                "lists/city/braga/1.json",
+                f"producers/{kept.pk}.json",
+            },
+        )
+        self.assertFalse((self.root / version / f"producers/{deleted_pk}.json.gz").exists())
+        self.assertEqual(self.read(version, "lists/all/1.json")["next"], None)
+
+    def test_command_keeps_recent_versions(self):
+        out = StringIO()
+        for index in range(3):
+            self.producers[0].save()
+            call_command(
+                "export_snapshot", root=str(self.root), keep=2, full=index == 0, stdout=out
+            )
+        versions = [path.name for path in self.root.iterdir() if path.is_dir()]
+        self.assertEqual(len(versions), 2)
+        self.assertIn((self.root / "CURRENT").read_text(), versions)
+        self.assertIn("1 produtores alterados", out.getvalue())
@@ -1,11 +1,23 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, metrics, views
 
 
 router = DefaultRouter()
 router.register(r"producers", views.ProducerViewSet)
+router.register(r"products", views.ProductViewSet)
 
 urlpatterns = [
+    path("async/producers/", async_views.producer_list, name="async-producer-list"),
+    path(
+        "async/producers/search/", async_views.producer_search, name="async-producer-search"
+    ),
+    path(
+        "async/producers/<str:pk>/", async_views.producer_detail, name="async-producer-detail"
+    ),
     path("", include(router.urls)),
 ]
+
+if getattr(settings, "API_PROFILING", False):
+    urlpatterns.insert(0, path("_metrics", metrics.metrics_view, name="metrics"))
@@ -1,37 +1,481 @@
+import hashlib
+import io
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Count, Max, Prefetch, Q
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils.text import slugify
 from rest_framework import viewsets
-from .models import Producer
-from .serializers import ProducerSerializer
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+from . import batch, bulk, cache, changes
+from .facets import NON_FILTER_PARAMS, facet_counts
+from .geo import GRID_ZOOM, filter_near
+from .maps import map_markers
+from .search import normalize, search_producers
+from .models import DeletedProducer, Producer, ProducerImage, Product
+from .pagination import KeysetPagination, StandardResultsSetPagination
+from .routers import replicas_caught_up, use_replicas
+from .serializers import (
+    PRODUCER_FIELD_COLUMNS,
+    PRODUCER_VIEWS,
+    ProducerReadSerializer,
+    ProducerSerializer,
+    ProductSerializer,
+)
+
+
+def validator_headers(request, action_name, pk, validators):
+    """Weak ETag and Last-Modified timestamp for a read response"""
+    last_modified = validators["last_modified"]
+    raw = repr((
+        request.get_host(),
+        action_name,
+        str(pk),
+        cache.normalize_params(request.query_params),
+        last_modified.isoformat() if last_modified else None,
+        validators["count"],
+    ))
+    etag = f'W/"{hashlib.sha1(raw.encode()).hexdigest()}"'
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return etag, timestamp
+
 
+def last_directory_change():
+    """Time of the newest producer change or deletion in the whole table.
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 20
-    page_size_query_param = "page_size"
-    max_page_size = 100
+    Used as the list ``Last-Modified``: when a producer is deleted or leaves
+    a filtered list, no row still in the list changes.
+    """
+    times = [
+        Producer.objects.aggregate(last=Max("updated_at"))["last"],
+        DeletedProducer.objects.aggregate(last=Max("deleted_at"))["last"],
+    ]
+    return max((value for value in times if value), default=None)
+
+
+async def alast_directory_change():
+    times = [
+        (await Producer.objects.aaggregate(last=Max("updated_at")))["last"],
+        (await DeletedProducer.objects.aaggregate(last=Max("deleted_at")))["last"],
+    ]
+    return max((value for value in times if value), default=None)
 
 
 class ProducerViewSet(viewsets.ModelViewSet):
     queryset = Producer.objects.all()
     serializer_class = ProducerSerializer
     pagination_class = StandardResultsSetPagination
+    default_radius_km = 25.0
+    max_radius_km = 500.0
+    changes_page_size = 100
+    # Actions rendered with ProducerReadSerializer and sparse fieldsets
+    read_actions = ("list", "retrieve", "changes")
+    max_changes_page_size = 1000
+    # Set by get_queryset when ?q= matched more than search.MAX_RESULTS
+    search_truncated = False
+
+    def dispatch(self, request, *args, **kwargs):
+        """Reads are served from a replica when one is configured"""
+        with use_replicas(request.method in SAFE_METHODS and replicas_caught_up()):
+            return super().dispatch(request, *args, **kwargs)
 
     def get_queryset(self):
         queryset = super().get_queryset()
 
-        # Filter by type/category
-        producer_type = self.request.query_params.get("category")
-        if producer_type:
-            queryset = queryset.filter(categories__name__icontains=producer_type)
+        # Filter by category slug: ?category=queijos,mel (any of)
+        categories = self.parse_list("category", slugify)
+        if categories:
+            # A subquery on the through table avoids duplicate rows from the join
+            producer_ids = Producer.categories.through.objects.filter(
+                category__slug__in=categories
+            ).values("producer_id")
+            queryset = queryset.filter(pk__in=producer_ids)
+
+        # Filter by city, accent and case insensitive: ?city=braga,guimaraes
+        cities = self.parse_list("city", lambda value: normalize(value).strip())
+        if cities:
+            queryset = queryset.filter(city_key__in=cities)
+
+        # Filter by status: ?is_active=true
+        is_active = self.request.query_params.get("is_active")
+        if is_active:
+            if is_active.lower() not in ("true", "false", "1", "0"):
+                raise ValidationError({"is_active": "Deve ser 'true' ou 'false'."})
+            queryset = queryset.filter(is_active=is_active.lower() in ("true", "1"))
+
+        # Filter by product, using the normalized catalogue
+        product = self.request.query_params.get("product")
+        if product:
+            queryset = queryset.filter(catalogue__slug=slugify(product))
+
+        # Full-text search, ranked by relevance
+        query = self.request.query_params.get("q")
+        if query:
+            queryset, self.search_truncated = search_producers(queryset, query)
+
+        # Filter by distance: ?near=lat,lon&radius_km=10
+        near = self.request.query_params.get("near")
+        if near:
+            latitude, longitude = self.parse_near(near)
+            radius_km = self.parse_radius()
+            queryset = filter_near(queryset, latitude, longitude, radius_km)
+
+        if self.uses_keyset_pagination() and (query or near):
+            raise ValidationError(
+                {"cursor": "Paginação por cursor não suporta os filtros 'q' e 'near'."}
+            )
+
+        return self.with_relations(queryset)
+
+    def uses_keyset_pagination(self):
+        """Keyset pagination is opt-in: ?pagination=cursor, then follow ``next``"""
+        params = self.request.query_params
+        return params.get("pagination") == "cursor" or "cursor" in params
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator"):
+            if self.uses_keyset_pagination():
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def parse_list(self, param, normalize_value):
+        """Comma separated values of ``param``, normalized, without blanks"""
+        value = self.request.query_params.get(param, "")
+        values = (normalize_value(part) for part in value.split(","))
+        return sorted({value for value in values if value})
+
+    def parse_near(self, value):
+        """Parse ``lat,lon`` from the ``near`` query param"""
+        try:
+            latitude, longitude = (float(part) for part in value.split(","))
+        except ValueError:
+            raise ValidationError({"near": "Formato esperado: near=latitude,longitude"})
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValidationError({"near": "Coordenadas fora do intervalo válido."})
+        return latitude, longitude
+
+    def parse_radius(self):
+        """Parse ``radius_km``, falling back to the default radius"""
+        value = self.request.query_params.get("radius_km")
+        if not value:
+            return self.default_radius_km
+        try:
+            radius_km = float(value)
+        except ValueError:
+            raise ValidationError({"radius_km": "Deve ser um número."})
+        if not 0 < radius_km <= self.max_radius_km:
+            raise ValidationError(
+                {"radius_km": f"Deve estar entre 0 e {self.max_radius_km:g} km."}
+            )
+        return radius_km
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.uses_keyset_pagination():
+            # Validate the requested page only, keeping deep pages free of full scans
+            queryset = self.paginator.window(queryset, request)
+
+        def get_validators():
+            return {"last_modified": last_directory_change(), "count": queryset.count()}
+
+        return self.conditional_response(
+            request, "list", get_validators, super().list, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs.get(self.lookup_field)
+
+        def get_validators():
+            try:
+                last_modified = (
+                    Producer.objects.filter(pk=pk).values_list("updated_at", flat=True).first()
+                )
+            except (TypeError, ValueError, DjangoValidationError):
+                last_modified = None
+            return {"last_modified": last_modified, "count": int(last_modified is not None)}
+
+        return self.conditional_response(
+            request, "retrieve", get_validators, super().retrieve, *args, **kwargs
+        )
+
+    def conditional_response(self, request, action_name, get_validators, view, *args, **kwargs):
+        """Serve from the response cache, answering 304 when the client's copy
+        is still valid.
+
+        Validators are stored with the cached response, so a hit answers
+        plain and conditional GETs without queries. On a miss they are read
+        before anything is serialized.
+        """
+        pk = kwargs.get(self.lookup_field)
+        key = cache.make_key(request, action_name, pk)
+        cached = cache.lookup(key)
+        if cached is not None:
+            status, data, etag, timestamp = cached
+        else:
+            etag, timestamp = validator_headers(request, action_name, pk, get_validators())
+        not_modified = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if not_modified is not None:
+            return not_modified
+
+        if cached is None:
+            response = view(request, *args, **kwargs)
+            status, data = response.status_code, response.data
+            if status == 200:
+                cache.store(key, (status, data, etag, timestamp))
+        response = Response(data, status=status, headers={"X-Cache": "HIT" if cached else "MISS"})
+        if status == 200:
+            response["ETag"] = etag
+            if timestamp is not None:
+                response["Last-Modified"] = http_date(timestamp)
+        return response
 
-        # Filter by city
-        city = self.request.query_params.get("city")
-        if city:
-            queryset = queryset.filter(city__icontains=city)
+    @action(
+        detail=False, methods=["post"], url_path="import", parser_classes=[MultiPartParser]
+    )
+    def bulk_import(self, request):
+        """Import a CSV/NDJSON upload (field ``file``), validated and written in chunks"""
+        upload = request.FILES.get("file")
+        if upload is None:
+            raise ValidationError({"file": "Envie o ficheiro no campo 'file'."})
+        file_format = request.query_params.get("file_format") or bulk.detect_format(upload.name)
+        if file_format not in bulk.FORMATS:
+            raise ValidationError({"file_format": f"Valores possíveis: {', '.join(bulk.FORMATS)}"})
+        stream = io.TextIOWrapper(upload, encoding="utf-8-sig", newline="")
+        return Response(bulk.import_producers(stream, file_format))
 
+    @action(detail=False, methods=["get"], url_path="export")
+    def bulk_export(self, request):
+        """Stream the filtered producers as CSV or NDJSON (?file_format=)"""
+        file_format = request.query_params.get("file_format", "csv")
+        if file_format not in bulk.FORMATS:
+            raise ValidationError({"file_format": f"Valores possíveis: {', '.join(bulk.FORMATS)}"})
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        content_type = "text/csv" if file_format == "csv" else "application/x-ndjson"
+        response = StreamingHttpResponse(
+            bulk.iter_export(queryset, file_format),
+            content_type=f"{content_type}; charset=utf-8",
+        )
+        response["Content-Disposition"] = f'attachment; filename="produtores.{file_format}"'
+        return response
+
+    @action(detail=False, methods=["post"], url_path="batch")
+    def batch_write(self, request):
+        """Apply a list of create/update/delete operations in one transaction.
+
+        Body: ``{"operations": [{"op": "update", "id": "...", "data": {...}}, ...]}``.
+        Nothing is written unless every operation is valid.
+        """
+        operations = request.data.get("operations") if isinstance(request.data, dict) else None
+        if not isinstance(operations, list) or not operations:
+            raise ValidationError({"operations": "Deve ser uma lista não vazia."})
+        if len(operations) > batch.MAX_OPERATIONS:
+            raise ValidationError(
+                {"operations": f"Máximo de {batch.MAX_OPERATIONS} operações por pedido."}
+            )
+        ok, results = batch.apply_batch(operations)
+        return Response({"results": results}, status=200 if ok else 400)
+
+    @action(detail=False, methods=["get"], url_path="facets")
+    def facets(self, request):
+        """Producer counts per category, city and district for the current filters"""
+        key = cache.make_key(request, "facets", exclude=NON_FILTER_PARAMS)
+
+        def compute():
+            queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+            return 200, facet_counts(queryset)
+
+        (status, data), hit = cache.get_or_set(key, compute)
+        return Response(data, status=status, headers={"X-Cache": "HIT" if hit else "MISS"})
+
+    @action(detail=False, methods=["get"], url_path="changes")
+    def changes(self, request):
+        """Producers changed since ``?since=<token>``, with deletes as tombstones.
+
+        Without ``since``, every active producer is listed. Keep requesting
+        with the returned ``next`` token while ``has_more`` is true, then
+        store it for the next sync. Read from the primary database, so a
+        lagging replica cannot make a client skip past changes.
+        """
+        since = request.query_params.get("since")
+        try:
+            position = changes.decode_token(since) if since else None
+        except changes.InvalidToken:
+            raise ValidationError({"since": "Token inválido."})
+        try:
+            limit = int(request.query_params.get("page_size", self.changes_page_size))
+        except ValueError:
+            raise ValidationError({"page_size": "Deve ser um número inteiro."})
+        limit = min(max(limit, 1), self.max_changes_page_size)
+
+        with use_replicas(False):
+            entries, has_more = changes.read_changes(position, limit)
+            upserts = [pk for _, pk, kind, _ in entries if kind == changes.UPSERT]
+            producers = {
+                producer.pk: producer
+                for producer in self.with_relations(Producer.objects.filter(pk__in=upserts))
+            }
+            # A producer deleted since the first query has a newer tombstone
+            upserts = [pk for pk in upserts if pk in producers]
+            data = self.get_serializer([producers[pk] for pk in upserts], many=True).data
+
+        serialized = dict(zip(upserts, data))
+        results = []
+        for changed_at, pk, kind, reason in entries:
+            entry = {"id": str(pk), "action": kind, "changed_at": changed_at.isoformat()}
+            if kind == changes.UPSERT:
+                if pk not in serialized:
+                    continue
+                entry["producer"] = serialized[pk]
+            else:
+                entry["reason"] = reason
+            results.append(entry)
+        if entries:
+            since = changes.encode_token(entries[-1][0], entries[-1][1])
+        return Response({"results": results, "next": since, "has_more": has_more})
+
+    @action(detail=False, methods=["get"], url_path="cache-stats")
+    def cache_stats(self, request):
+        """Response cache hit/miss counters for monitoring"""
+        return Response(cache.stats())
+
+    def with_relations(self, queryset):
+        """Prefetch the relations rendered by ProducerSerializer.
+
+        Categories and gallery images are loaded with one query each for the
+        whole page, so the number of queries does not grow with page size.
+        On reads with a sparse fieldset, only the columns and relations the
+        requested fields need are loaded.
+        """
+        fields = self.get_requested_fields()
+        if fields is None:
+            fields = list(PRODUCER_FIELD_COLUMNS)
+        else:
+            columns = {"id", "name"}  # name is the ordering / cursor column
+            for name in fields:
+                columns.update(PRODUCER_FIELD_COLUMNS[name])
+            queryset = queryset.only(*columns)
+
+        if {"categories", "type_display"} & set(fields):
+            queryset = queryset.prefetch_related("categories")
+        if "gallery_images" in fields:
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    "gallery_images",
+                    queryset=ProducerImage.objects.order_by("order", "uploaded_at"),
+                )
+            )
         return queryset
 
+    def get_requested_fields(self):
+        """Output fields selected with ?fields=, ?omit= or ?view=, or None for all.
+
+        Only applies to reads; writes always use the full serializer.
+        """
+        if self.action not in self.read_actions:
+            return None
+        if not hasattr(self, "_requested_fields"):
+            self._requested_fields = self.parse_requested_fields()
+        return self._requested_fields
+
+    def parse_requested_fields(self):
+        params = self.request.query_params
+        view = params.get("view")
+        if view:
+            if view not in PRODUCER_VIEWS:
+                raise ValidationError({"view": f"Valores possíveis: {', '.join(PRODUCER_VIEWS)}"})
+            fields = list(PRODUCER_VIEWS[view])
+        elif params.get("fields"):
+            fields = self.parse_field_list("fields")
+        else:
+            fields = None
+
+        if params.get("omit"):
+            omitted = self.parse_field_list("omit")
+            fields = [
+                name for name in (fields or PRODUCER_FIELD_COLUMNS) if name not in omitted
+            ]
+        return fields
+
+    def parse_field_list(self, param):
+        names = [name.strip() for name in self.request.query_params[param].split(",") if name.strip()]
+        unknown = [name for name in names if name not in PRODUCER_FIELD_COLUMNS]
+        if unknown:
+            raise ValidationError(
+                {param: f"Campos desconhecidos: {', '.join(unknown)}. "
+                        f"Campos válidos: {', '.join(PRODUCER_FIELD_COLUMNS)}"}
+            )
+        return names
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.request.query_params.get("q"):
+            # Only the best ranked search.MAX_RESULTS matches are listed
+            response.data["truncated"] = self.search_truncated
+        return response
+
+    def get_serializer_class(self):
+        """Reads use the fast serializer; the schema generator still
+        introspects ProducerSerializer"""
+        if self.action in self.read_actions and not getattr(self, "swagger_fake_view", False):
+            return ProducerReadSerializer
+        return super().get_serializer_class()
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_requested_fields()
+        if fields is not None:
+            kwargs.setdefault("fields", fields)
+        return super().get_serializer(*args, **kwargs)
+
+    @action(detail=False, methods=["get"], url_path="map")
+    def map(self, request):
+        """Lightweight clustered markers: ?bbox=min_lon,min_lat,max_lon,max_lat&zoom=12"""
+        bbox = self.parse_bbox(request.query_params.get("bbox"))
+        try:
+            zoom = int(request.query_params.get("zoom", ""))
+        except ValueError:
+            raise ValidationError({"zoom": "Deve ser um número inteiro."})
+        if not 0 <= zoom <= GRID_ZOOM:
+            raise ValidationError({"zoom": f"Deve estar entre 0 e {GRID_ZOOM}."})
+        queryset = Producer.objects.filter(is_active=True)
+        return Response(map_markers(queryset, bbox, zoom))
+
+    def parse_bbox(self, value):
+        """Parse ``min_lon,min_lat,max_lon,max_lat`` from the ``bbox`` query param"""
+        try:
+            min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(","))
+        except (AttributeError, ValueError):
+            raise ValidationError({"bbox": "Formato esperado: bbox=min_lon,min_lat,max_lon,max_lat"})
+        if min_lon > max_lon or min_lat > max_lat:
+            raise ValidationError({"bbox": "Limites mínimos devem ser inferiores aos máximos."})
+        return min_lon, min_lat, max_lon, max_lat
+
     def get_serializer_context(self):
         """Add request to serializer context"""
         context = super().get_serializer_context()
         context["request"] = self.request
         return context
+
+
+class ProductViewSet(viewsets.ReadOnlyModelViewSet):
+    """Products offered by at least one active producer, with producer counts"""
+
+    queryset = (
+        Product.objects.annotate(
+            producer_count=Count(
+                "producerproduct", filter=Q(producerproduct__producer__is_active=True)
+            )
+        )
+        .filter(producer_count__gt=0)
+        .order_by("name")
+    )
+    serializer_class = ProductSerializer
+    pagination_class = StandardResultsSetPagination